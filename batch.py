@@ -0,0 +1,140 @@
+import collections
+import concurrent.futures
+import os.path
+from cache import *
+from detector import *
+
+# The outcome of analyzing one file. If the analysis failed, error holds a
+# description of the failure and the other results are None. The sample rate
+# and frequency step describe the spectrum that was analyzed, and channel is
+# the channel that was analyzed (None for a mix of every channel).
+Result = collections.namedtuple('Result', ['path', 'fund_freq', 'harm_ratios', 'error', 'sample_rate', 'freq_step',
+                                           'channel'],
+                                defaults=(None, None, None))
+
+
+def analyze_path(path, min_freq=150, cache=None, method='pairwise', detector=None, **options):
+    """ Analyze the WAV file at the given path and return a Result. Any error
+    is stored in the result instead of being raised, so that one bad file
+    doesn't stop a batch. The fundamental frequency is found with the given
+    method (see Spectrum.get_fund_freq), or with a detector from
+    make_detector if one is given. If a SpectrumCache is given, the spectrum and
+    results are looked up in it first and saved to it afterwards. Any other
+    options (fft_backend, max_freq, segment, channel) are passed on to
+    Spectrum. """
+
+    channel = options.get('channel')
+    try:
+        if not os.path.exists(path):
+            raise FileExistsError(f'"{path}" is not a readable file')
+
+        if cache is None:
+            spectrum = Spectrum(path, **options)
+        else:
+            spectrum = cache.get_spectrum(path, **options)
+
+        result = get_result(spectrum, min_freq, method, detector, lambda: detector.detect_file(path, channel))
+
+        if cache is not None:
+            cache.store(spectrum)
+
+        return result
+    except Exception as e:
+        return Result(path, None, None, f"{type(e).__name__}: {e}", channel=channel)
+
+
+def analyze_samples(samples, sample_rate, min_freq=150, method='pairwise', detector=None, **options):
+    """ Analyze a signal that is already in memory, with one row per sample
+    (and one column per channel for multichannel signals), and return a
+    Result without a path. Errors are stored in the result like analyze_path
+    does, and the other arguments are the same. """
+
+    channel = options.get('channel')
+    try:
+        spectrum = Spectrum.from_samples(samples, sample_rate, **options)
+        if channel is not None:
+            samples = select_channel(samples, channel)
+
+        return get_result(spectrum, min_freq, method, detector, lambda: detector.detect(samples, sample_rate))
+    except Exception as e:
+        return Result(None, None, None, f"{type(e).__name__}: {e}", channel=channel)
+
+
+def get_result(spectrum, min_freq, method, detector, detect):
+    """ Find the fundamental frequency and harmonic ratios of a spectrum with
+    a method or a detector, and return them as a Result. detect() runs the
+    detector on the signal of the spectrum. """
+
+    # Other detectors than the harmonic one work on the signal instead of the
+    # spectrum. Their result is given to the spectrum (and saved in the
+    # cache) under the detector's name, and the harmonic ratios are measured
+    # against it.
+    if isinstance(detector, HarmonicDetector):
+        method = detector.method
+    elif detector is not None:
+        method = detector.name
+        if (min_freq, method) not in spectrum.fund_freqs:
+            spectrum.set_fund_freq(min_freq, method, detect())
+
+    return Result(spectrum.path, spectrum.get_fund_freq(min_freq, method), spectrum.get_harm_ratios(min_freq, method),
+                  None, spectrum.sample_rate, spectrum.freq_step, spectrum.channel)
+
+
+def get_channels(path, channel):
+    """ Get the channels of the WAV file at the given path to analyze for the
+    channel option of analyze_paths: [None] for a mix of every channel, a list
+    of the given channel, or every channel for 'each'. A file whose header
+    can't be read gets [None], so that its analysis reports the error. """
+
+    if channel != 'each':
+        return [channel]
+
+    try:
+        with WavReader(path) as reader:
+            return list(range(reader.num_channels))
+    except Exception:
+        return [None]
+
+
+def analyze_paths(paths, min_freq=150, jobs=1, ordered=True, cache=None, method='pairwise', detector=None,
+                  **options):
+    """ Analyze every WAV file in paths, spreading the work across a pool of
+    jobs processes. This is a generator that yields a Result for each file as
+    soon as it is available, either in the same order as paths or in the order
+    in which the analyses complete. See analyze_path for the other
+    arguments. Each process reuses the plans and buffers of the fft_backend
+    option across the files it analyzes.
+
+    If the channel option is 'each', every channel of every file is analyzed
+    separately, and there is a Result for each, in order of channel. """
+
+    if jobs < 1:
+        raise ValueError("The number of jobs must be at least 1")
+
+    channel = options.pop('channel', None)
+
+    if jobs == 1:
+        for path in paths:
+            for c in get_channels(path, channel):
+                yield analyze_path(path, min_freq, cache, method, detector, channel=c, **options)
+        return
+
+    # The workers are separate processes, so they need to be given the sinks
+    # to send their logs and measurements to.
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=set_sinks, initargs=(get_sinks(),)) as pool:
+        futures = {pool.submit(analyze_path, path, min_freq, cache, method, detector, channel=c, **options): (path, c)
+                   for path in paths for c in get_channels(path, channel)}
+
+        if ordered:
+            done = iter(futures)
+        else:
+            done = concurrent.futures.as_completed(futures)
+
+        for future in done:
+            # analyze_path doesn't raise, so an exception here means that the
+            # worker itself died (e.g. it ran out of memory).
+            try:
+                yield future.result()
+            except Exception as e:
+                path, c = futures[future]
+                yield Result(path, None, None, f"{type(e).__name__}: {e}", channel=c)
@@ -0,0 +1,105 @@
+import pytest
+from scipy.io import wavfile
+from batch import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav",
+    "samples/mis/violin/bogus.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+]
+
+
+# Test analyzing a single file.
+def test_analyze_path():
+    result = analyze_path(testPaths[0])
+    assert result.path == testPaths[0]
+    assert str(freq_to_note(result.fund_freq)) == 'A4'
+    assert len(result.harm_ratios) > 0
+    assert result.error is None
+
+    # Errors are reported instead of raised.
+    result = analyze_path(testPaths[2])
+    assert result.path == testPaths[2]
+    assert result.fund_freq is None
+    assert result.harm_ratios is None
+    assert result.error.startswith('FileExistsError')
+
+
+# Test analyzing a file with a detector.
+def test_analyze_path_detector(tmp_path):
+    cache = SpectrumCache(str(tmp_path))
+    for _ in range(2):
+        result = analyze_path(testPaths[0], cache=cache, detector=make_detector('yin'))
+        assert result.error is None
+        assert str(freq_to_note(result.fund_freq)) == 'A4'
+        assert len(result.harm_ratios) > 0
+
+    # The detector's result is cached under its name.
+    spectrum = cache.get_spectrum(testPaths[0])
+    assert spectrum.fund_freqs == {(150, 'yin'): result.fund_freq}
+
+
+# Test analyzing a signal in memory.
+def test_analyze_samples():
+    sample_rate, wav_data = wavfile.read(testPaths[0])
+    want = analyze_path(testPaths[0], channel=0)
+    result = analyze_samples(wav_data / 32768, sample_rate, channel=0)
+    assert result.path is None
+    assert result.channel == 0
+    assert result.fund_freq == want.fund_freq
+    assert np.array_equal(result.harm_ratios, want.harm_ratios)
+
+    result = analyze_samples(np.zeros((0, 2)), sample_rate)
+    assert result.error.startswith('ValueError')
+
+
+# Test analyzing a batch of files, both sequentially and in parallel.
+def test_analyze_paths():
+    with pytest.raises(ValueError):
+        list(analyze_paths(testPaths, jobs=0))
+
+    want = list(analyze_paths(testPaths))
+    assert [result.path for result in want] == testPaths
+
+    results = list(analyze_paths(testPaths, jobs=2))
+    assert_results_equal(results, want)
+
+    results = list(analyze_paths(testPaths, jobs=2, ordered=False))
+    assert_results_equal(sorted(results, key=lambda result: result.path), sorted(want, key=lambda result: result.path))
+
+
+# Test analyzing every channel of each file separately.
+def test_analyze_paths_channels():
+    want = list(analyze_paths(testPaths))
+    for jobs in [1, 2]:
+        results = list(analyze_paths(testPaths, jobs=jobs, channel='each'))
+        assert [(result.path, result.channel) for result in results] == [
+            (testPaths[0], 0), (testPaths[0], 1),
+            (testPaths[1], 0), (testPaths[1], 1),
+            (testPaths[2], None),
+            (testPaths[3], 0), (testPaths[3], 1),
+        ]
+        for result in results:
+            if result.error is None:
+                want_fund_freq = want[testPaths.index(result.path)].fund_freq
+                assert str(freq_to_note(result.fund_freq)) == str(freq_to_note(want_fund_freq))
+
+    result = analyze_path(testPaths[0], channel=1)
+    assert result.channel == 1
+    assert result.error is None
+
+
+# Assert that two lists of results are the same.
+def assert_results_equal(results, want):
+    assert len(results) == len(want)
+    for result, want_result in zip(results, want):
+        assert result.path == want_result.path
+        assert result.fund_freq == want_result.fund_freq
+        assert result.error == want_result.error
+        assert result.sample_rate == want_result.sample_rate
+        assert result.freq_step == want_result.freq_step
+        if want_result.harm_ratios is None:
+            assert result.harm_ratios is None
+        else:
+            assert np.array_equal(result.harm_ratios, want_result.harm_ratios)
@@ -0,0 +1,260 @@
+import argparse
+import glob
+import json
+import os.path
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import scipy
+from spectrum import *
+
+# Directory of the bundled violin samples.
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples', 'mis', 'violin')
+
+# Stages of the analysis that are timed, in the order in which they run.
+STAGES = [
+    'decode',
+    'downmix',
+    'fft',
+    'magnitudes',
+    'find_peaks',
+    'fund_freq',
+    'harm_ratios',
+    'freq_to_note',
+]
+
+# Default tolerance for regressions against a baseline, as a fraction of the
+# baseline value, and the smallest change (in milliseconds) that counts as a
+# regression. Timings of very short stages are too noisy to compare by
+# percentage alone.
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_MIN_DELTA_MS = 0.5
+
+
+def time_file(path, min_freq=150, fft_backend=DEFAULT_FFT_BACKEND):
+    """ Analyze one WAV file stage by stage, exactly like a Spectrum does, and
+    return the time each stage took in seconds along with the duration of the
+    audio in seconds. """
+
+    times = {}
+
+    start = time.perf_counter()
+    with WavReader(path) as reader:
+        sample_rate = reader.sample_rate
+        wav_data = reader.read(reader.num_frames)
+    times['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    signal = downmix(wav_data)
+    times['downmix'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fft_data, fft_size = fft_backend.transform(signal)
+    times['fft'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    magnitudes = to_magnitudes(fft_data, min(len(signal), fft_size))
+    times['magnitudes'] = time.perf_counter() - start
+
+    spectrum = Spectrum.from_magnitudes(path, magnitudes, sample_rate, len(signal), fft_size)
+
+    start = time.perf_counter()
+    peaks = find_peak_indices(magnitudes, min_freq / float(spectrum.freq_step))
+    times['find_peaks'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fund_freq = find_fund_freq([spectrum.get_frequency_at(index) for index in peaks])
+    times['fund_freq'] = time.perf_counter() - start
+
+    # Hand the fundamental frequency to the spectrum so that only the
+    # harmonic ratios themselves are timed.
+    spectrum.fund_freqs[(min_freq, 'pairwise')] = fund_freq
+    start = time.perf_counter()
+    spectrum.get_harm_ratios(min_freq)
+    times['harm_ratios'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        freq_to_note(fund_freq)
+    except ValueError:
+        pass
+    times['freq_to_note'] = time.perf_counter() - start
+
+    return times, len(signal) / sample_rate
+
+
+def measure_memory(path, min_freq=150, fft_backend=DEFAULT_FFT_BACKEND):
+    """ Get the peak number of bytes allocated while a Spectrum analyzes one
+    WAV file. """
+
+    tracemalloc.start()
+    try:
+        spectrum = Spectrum(path, fft_backend=fft_backend)
+        spectrum.get_fund_freq(min_freq)
+        spectrum.get_harm_ratios(min_freq)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def _percentile(values, perc):
+    return float(np.percentile(values, perc)) * 1000
+
+
+def run(paths, repeat=1, min_freq=150, fft_backend=DEFAULT_FFT_BACKEND):
+    """ Benchmark the analysis of every WAV file in paths, repeat times each,
+    and return a summary of the results that can be saved as JSON. The
+    transforms are computed by fft_backend. """
+
+    if len(paths) == 0:
+        raise ValueError("There are no files to benchmark")
+    if repeat < 1:
+        raise ValueError("The number of repeats must be at least 1")
+
+    # Warm up, so that imports and FFT plans don't count against the first
+    # file.
+    time_file(paths[0], min_freq, fft_backend)
+
+    stage_times = {stage: [] for stage in STAGES}
+    audio_secs = 0.0
+    total_secs = 0.0
+    for _ in range(repeat):
+        for path in paths:
+            times, duration = time_file(path, min_freq, fft_backend)
+            for stage in STAGES:
+                stage_times[stage].append(times[stage])
+            audio_secs += duration
+            total_secs += sum(times.values())
+
+    # Memory is measured separately, because tracing allocations slows
+    # everything down.
+    peak_traced = max(measure_memory(path, min_freq, fft_backend) for path in paths)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+
+    return {
+        'files': len(paths),
+        'repeat': repeat,
+        'min_freq': min_freq,
+        'fft_size': fft_backend.size_mode,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'machine': platform.machine(),
+        },
+        'throughput': {
+            'total_seconds': total_secs,
+            'files_per_second': len(paths) * repeat / total_secs,
+            'audio_seconds_per_second': audio_secs / total_secs,
+        },
+        'stages': {
+            stage: {
+                'p50_ms': _percentile(times, 50),
+                'p95_ms': _percentile(times, 95),
+                'total_ms': float(np.sum(times)) * 1000,
+            }
+            for stage, times in stage_times.items()
+        },
+        'memory': {
+            'peak_traced_bytes': peak_traced,
+            'max_rss_bytes': max_rss,
+        },
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """ Compare benchmark results against a baseline, and return a list of
+    descriptions of every regression. A stage regressed if its p50 or p95 time
+    grew by more than the tolerance (and by at least min_delta_ms), and the
+    throughput regressed if it dropped by more than the tolerance. """
+
+    regressions = []
+
+    for stage, stats in results['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+
+        for stat in ['p50_ms', 'p95_ms']:
+            value = stats[stat]
+            base = baseline['stages'][stage][stat]
+            if value > base * (1 + tolerance) and value - base >= min_delta_ms:
+                regressions.append(f"{stage} {stat}: {value:.3f}ms vs {base:.3f}ms baseline")
+
+    value = results['throughput']['files_per_second']
+    base = baseline['throughput']['files_per_second']
+    if value < base * (1 - tolerance):
+        regressions.append(f"throughput: {value:.2f} files/s vs {base:.2f} files/s baseline")
+
+    return regressions
+
+
+def format_results(results):
+    """ Format benchmark results as a human-readable table. """
+
+    lines = [f"{results['files']} files x {results['repeat']}, {results['fft_size']} FFT size"]
+    lines.append(f"{'stage':<14}{'p50 (ms)':>12}{'p95 (ms)':>12}{'total (ms)':>14}")
+    for stage, stats in results['stages'].items():
+        lines.append(f"{stage:<14}{stats['p50_ms']:>12.3f}{stats['p95_ms']:>12.3f}{stats['total_ms']:>14.1f}")
+
+    throughput = results['throughput']
+    memory = results['memory']
+    lines.append(f"Throughput: {throughput['files_per_second']:.2f} files/s, "
+                 f"{throughput['audio_seconds_per_second']:.1f}s of audio/s")
+    lines.append(f"Peak memory: {memory['peak_traced_bytes'] / 1024 / 1024:.1f}MB traced, "
+                 f"{memory['max_rss_bytes'] / 1024 / 1024:.1f}MB max RSS")
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+
+    # Parse the command-line arguments.
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the analysis over a corpus of WAV files.")
+    parser.add_argument('path', type=str, nargs='*',
+                        help="Paths to files to analyze (default: the bundled violin samples)")
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                        help="Number of times to analyze each file")
+    parser.add_argument('--min', dest='min_freq', type=int, default=150,
+                        help="Minimum fundamental frequency")
+    parser.add_argument('--fft-size', dest='fft_size', choices=FFT_SIZES, default='exact',
+                        help="Length of each transform (see FFT_SIZES)")
+    parser.add_argument('--save', dest='save', type=str,
+                        help="Save the results as JSON to this file")
+    parser.add_argument('--baseline', dest='baseline', type=str,
+                        help="Compare the results against a JSON file saved earlier, and fail on regressions")
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Fraction by which a result may be worse than the baseline")
+    args = parser.parse_args()
+
+    paths = args.path or sorted(glob.glob(os.path.join(DEFAULT_CORPUS, '*.wav')))
+    try:
+        results = run(paths, args.repeat, args.min_freq, FFTBackend(args.fft_size))
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"\t{regression}", file=sys.stderr)
+            sys.exit(1)
+
+        print("\nNo regressions against the baseline")
@@ -0,0 +1,50 @@
+import pytest
+from bench import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+]
+
+
+# Test benchmarking a couple of files.
+def test_run():
+    with pytest.raises(ValueError):
+        run([])
+    with pytest.raises(ValueError):
+        run(testPaths, repeat=0)
+
+    results = run(testPaths, repeat=2)
+    assert results['files'] == 2
+    assert results['repeat'] == 2
+    assert list(results['stages']) == STAGES
+    for stats in results['stages'].values():
+        assert 0 <= stats['p50_ms'] <= stats['p95_ms']
+    assert results['throughput']['files_per_second'] > 0
+    assert results['memory']['peak_traced_bytes'] > 0
+
+    # The results can be saved as JSON and compared against themselves.
+    results = json.loads(json.dumps(results))
+    assert compare(results, results) == []
+    assert 'fft' in format_results(results)
+
+
+# Test finding regressions against a baseline.
+def test_compare():
+    baseline = {
+        'stages': {'fft': {'p50_ms': 10.0, 'p95_ms': 20.0}, 'decode': {'p50_ms': 0.1, 'p95_ms': 0.2}},
+        'throughput': {'files_per_second': 100.0},
+    }
+    results = {
+        'stages': {'fft': {'p50_ms': 11.0, 'p95_ms': 30.0}, 'decode': {'p50_ms': 0.3, 'p95_ms': 0.4}},
+        'throughput': {'files_per_second': 70.0},
+    }
+
+    # The fft p95 and throughput regressed. The decode stage tripled, but by
+    # too little time to count.
+    regressions = compare(results, baseline)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('fft p95_ms')
+    assert regressions[1].startswith('throughput')
+
+    assert compare(results, baseline, tolerance=1.0) == []
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import tempfile
+from spectrum import *
+
+# Default location and size limit of the cache.
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                 'pitch_finder')
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024  # 1GB
+
+# Version of the layout of cache entries. Changing it invalidates every entry.
+_CACHE_VERSION = 5
+
+# Extension of cache entry files.
+_ENTRY_EXT = '.npz'
+
+
+def hash_file(path):
+    """ Calculate the SHA-256 hash of the contents of a file. """
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+class SpectrumCache():
+    """
+    SpectrumCache stores the magnitudes of Spectrum objects and the results
+    derived from them on disk, so that files that were already analyzed don't
+    have to be decoded and transformed again. Each entry is a single .npz file
+    keyed by the hash of the WAV file's contents and the analysis parameters.
+    When the cache grows above max_size bytes, the least recently used entries
+    are removed.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        if max_size <= 0:
+            raise ValueError("The cache size must be positive")
+
+        self.directory = directory
+        self.max_size = max_size
+
+    def get_key(self, path, **params):
+        """ Get the key of the cache entry for the WAV file at the given path
+        when it's analyzed with the given parameters. """
+
+        params = json.dumps(params, sort_keys=True, default=str)
+        h = hashlib.sha256(f"{_CACHE_VERSION}:{hash_file(path)}:{params}".encode())
+
+        return h.hexdigest()
+
+    def get_spectrum(self, path, dtype=np.float64, fft_backend=None, max_freq=None, segment=False, channel=None):
+        """ Get the spectrum of the WAV file at the given path, along with any
+        results that were stored for it. If the file isn't in the cache yet, it
+        is analyzed from scratch with the given options (see Spectrum). Call
+        store() once the results are computed to save them. """
+
+        dtype = np.dtype(dtype)
+        if fft_backend is None:
+            fft_backend = DEFAULT_FFT_BACKEND
+        key = self.get_key(path, dtype=dtype.name, fft_size=fft_backend.size_mode, max_freq=max_freq, segment=segment,
+                           channel=channel)
+
+        spectrum = self._load(key, path, max_freq, channel)
+        if spectrum is None:
+            log('Cache miss for "{}"', path)
+            spectrum = Spectrum(path, dtype=dtype, fft_backend=fft_backend, max_freq=max_freq, segment=segment,
+                                channel=channel)
+        else:
+            log('Cache hit for "{}"', path)
+
+        # Remember which results the entry already holds, so that it's only
+        # rewritten when something new was computed.
+        spectrum.cache_key = key
+        spectrum.cached_results = (len(spectrum.fund_freqs), len(spectrum.harm_ratios))
+
+        return spectrum
+
+    def store(self, spectrum):
+        """ Save a spectrum returned by get_spectrum() and all of its results
+        in the cache. """
+
+        if spectrum.cached_results == (len(spectrum.fund_freqs), len(spectrum.harm_ratios)):
+            return
+
+        entry = {
+            'sample_rate': np.int64(spectrum.sample_rate),
+            'num_samples': np.int64(spectrum.num_samples),
+            'fft_size': np.int64(spectrum.fft_size),
+            'segment': np.array(spectrum.segment if spectrum.segment is not None else [], dtype=np.int64),
+            'magnitudes': spectrum.magnitudes,
+        }
+
+        # The results are stored as parallel arrays of parameters and
+        # fundamental frequencies, with the harmonic ratios for each set of
+        # parameters (if there are any) in a separate array.
+        params = list(spectrum.fund_freqs)
+        entry['min_freqs'] = np.array([min_freq for min_freq, _ in params], dtype=np.float64)
+        entry['methods'] = np.array([method for _, method in params], dtype=str)
+        entry['fund_freqs'] = np.array(list(spectrum.fund_freqs.values()), dtype=np.float64)
+        for i, param in enumerate(params):
+            if param in spectrum.harm_ratios:
+                entry[f'harm_ratios_{i}'] = np.asarray(spectrum.harm_ratios[param], dtype=np.float64)
+
+        # Write the entry to a temporary file first, so that other processes
+        # sharing the cache never see a partial entry.
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **entry)
+            os.replace(tmp_path, self._get_entry_path(spectrum.cache_key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        spectrum.cached_results = (len(spectrum.fund_freqs), len(spectrum.harm_ratios))
+        self._evict()
+
+    def clear(self):
+        """ Remove every entry from the cache. """
+
+        for entry_path, _, _ in self._list_entries():
+            _remove(entry_path)
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.directory, key + _ENTRY_EXT)
+
+    def _load(self, key, path, max_freq, channel):
+        """ Load the spectrum stored with the given key, which was computed
+        with the given maximum frequency and channel, or return None if there
+        is no such entry. """
+
+        entry_path = self._get_entry_path(key)
+        try:
+            with np.load(entry_path, allow_pickle=False) as entry:
+                segment = tuple(int(i) for i in entry['segment']) or None
+                spectrum = Spectrum.from_magnitudes(path, entry['magnitudes'], int(entry['sample_rate']),
+                                                    int(entry['num_samples']), int(entry['fft_size']), max_freq,
+                                                    segment, channel)
+                params = zip(entry['min_freqs'], entry['methods'], entry['fund_freqs'])
+                for i, (min_freq, method, fund_freq) in enumerate(params):
+                    param = (float(min_freq), str(method))
+                    spectrum.fund_freqs[param] = float(fund_freq)
+                    spectrum.fund_freq = float(fund_freq)
+
+                    name = f'harm_ratios_{i}'
+                    if name in entry:
+                        spectrum.harm_ratios[param] = entry[name]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            # A damaged entry is treated like a missing one.
+            log('Ignoring unreadable cache entry "{}": {}', entry_path, e)
+            _remove(entry_path)
+            return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+
+        return spectrum
+
+    def _list_entries(self):
+        """ List the path, size and last use time of every cache entry. """
+
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+
+        for name in names:
+            if not name.endswith(_ENTRY_EXT):
+                continue
+
+            entry_path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append((entry_path, st.st_size, st.st_mtime))
+
+        return entries
+
+    def _evict(self):
+        """ Remove the least recently used entries until the cache fits in its
+        maximum size. """
+
+        entries = self._list_entries()
+        size = sum(entry[1] for entry in entries)
+        if size <= self.max_size:
+            return
+
+        entries.sort(key=lambda entry: entry[2])
+        for entry_path, entry_size, _ in entries:
+            if size <= self.max_size:
+                break
+
+            log('Evicting cache entry "{}"', entry_path)
+            _remove(entry_path)
+            size -= entry_size
+
+
+def _remove(path):
+    """ Remove a file that another process may have already removed. """
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,130 @@
+import os
+import pytest
+from cache import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+]
+
+
+# Test the keys of cache entries.
+def test_SpectrumCache_get_key(tmp_path):
+    cache = SpectrumCache(str(tmp_path))
+
+    key = cache.get_key(testPaths[0], dtype='float64')
+    assert key == cache.get_key(testPaths[0], dtype='float64')
+    assert key != cache.get_key(testPaths[0], dtype='float32')
+    assert key != cache.get_key(testPaths[1], dtype='float64')
+
+    # The key depends on the contents of the file, not its path.
+    copy = tmp_path / 'copy.wav'
+    with open(testPaths[0], 'rb') as f:
+        copy.write_bytes(f.read())
+    assert key == cache.get_key(str(copy), dtype='float64')
+
+
+# Test storing and loading spectra.
+def test_SpectrumCache(tmp_path):
+    with pytest.raises(ValueError):
+        SpectrumCache(str(tmp_path), 0)
+
+    cache = SpectrumCache(str(tmp_path / 'cache'))
+    for path in testPaths:
+        spectrum = cache.get_spectrum(path)
+        want_fund_freq = spectrum.get_fund_freq()
+        want_ratios = spectrum.get_harm_ratios()
+        want_fund_freq_hps = spectrum.get_fund_freq(200, 'hps')
+        cache.store(spectrum)
+
+        spectrum = cache.get_spectrum(path)
+        assert spectrum.fft_data is None
+        assert spectrum.path == path
+        assert spectrum.sample_rate == 44100
+        assert spectrum.fund_freqs == {(150, 'pairwise'): want_fund_freq, (200, 'hps'): want_fund_freq_hps}
+        assert list(spectrum.harm_ratios) == [(150, 'pairwise')]
+        assert np.array_equal(spectrum.harm_ratios[(150, 'pairwise')], want_ratios)
+        assert spectrum.get_fund_freq() == want_fund_freq
+        assert np.array_equal(spectrum.get_harm_ratios(), want_ratios)
+        assert spectrum.get_fund_freq(200, 'hps') == want_fund_freq_hps
+
+    # A float32 spectrum is a separate entry.
+    spectrum = cache.get_spectrum(testPaths[0], dtype=np.float32)
+    assert spectrum.magnitudes.dtype == np.float32
+    assert spectrum.fund_freqs == {}
+
+    # So is a padded spectrum, which keeps the length of its transform.
+    backend = get_fft_backend('pad')
+    spectrum = cache.get_spectrum(testPaths[0], fft_backend=backend)
+    want_fund_freq = spectrum.get_fund_freq()
+    cache.store(spectrum)
+    spectrum = cache.get_spectrum(testPaths[0], fft_backend=backend)
+    assert spectrum.fft_size == get_fft_size(spectrum.num_samples, 'pad')
+    assert spectrum.freq_step == Decimal(44100) / Decimal(spectrum.fft_size)
+    assert spectrum.fund_freqs == {(150, 'pairwise'): want_fund_freq}
+
+    # A segmented spectrum keeps its segment.
+    spectrum = cache.get_spectrum(testPaths[0], segment=True)
+    want_segment = spectrum.segment
+    spectrum.get_fund_freq()
+    cache.store(spectrum)
+    spectrum = cache.get_spectrum(testPaths[0], segment=True)
+    assert spectrum.fft_data is None
+    assert spectrum.segment == want_segment
+    assert cache.get_spectrum(testPaths[0]).segment is None
+
+    # So is a single channel.
+    spectrum = cache.get_spectrum(testPaths[0], channel=1)
+    want_magnitudes = spectrum.magnitudes
+    spectrum.get_fund_freq()
+    cache.store(spectrum)
+    spectrum = cache.get_spectrum(testPaths[0], channel=1)
+    assert spectrum.fft_data is None
+    assert spectrum.channel == 1
+    assert np.array_equal(spectrum.magnitudes, want_magnitudes)
+
+    cache.clear()
+    assert os.listdir(tmp_path / 'cache') == []
+
+
+# Test that damaged entries are ignored.
+def test_SpectrumCache_damaged(tmp_path):
+    cache = SpectrumCache(str(tmp_path))
+    spectrum = cache.get_spectrum(testPaths[0])
+    spectrum.get_fund_freq()
+    cache.store(spectrum)
+
+    entry_path = tmp_path / (spectrum.cache_key + '.npz')
+    entry_path.write_bytes(b'bogus')
+    spectrum = cache.get_spectrum(testPaths[0])
+    assert spectrum.fund_freqs == {}
+    assert not entry_path.exists()
+
+
+# Test that the least recently used entries are evicted.
+def test_SpectrumCache_evict(tmp_path):
+    cache = SpectrumCache(str(tmp_path))
+    keys = []
+    for path in testPaths:
+        spectrum = cache.get_spectrum(path)
+        spectrum.get_fund_freq()
+        cache.store(spectrum)
+        keys.append(spectrum.cache_key)
+
+    sizes = {key: os.path.getsize(tmp_path / (key + '.npz')) for key in keys}
+
+    # Use the first entry again, so that the second is the oldest.
+    os.utime(tmp_path / (keys[1] + '.npz'), (0, 0))
+    os.utime(tmp_path / (keys[2] + '.npz'), (1, 1))
+    cache.get_spectrum(testPaths[0])
+
+    # Shrink the cache so that only two entries fit, and add a new result.
+    cache.max_size = sizes[keys[0]] + sizes[keys[2]] + 1024
+    spectrum = cache.get_spectrum(testPaths[0])
+    spectrum.get_fund_freq(100)
+    cache.store(spectrum)
+
+    remaining = sorted(name[:-4] for name in os.listdir(tmp_path))
+    assert keys[1] not in remaining
+    assert len(remaining) == 2
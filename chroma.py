@@ -0,0 +1,101 @@
+import functools
+import scipy.sparse
+from stft import *
+
+# Number of octaves in FREQ_TABLE, and so in a chroma.
+NUM_OCTAVES = 11
+
+# Number of chroma matrices (one for every sample rate and transform length)
+# that are kept for reuse. A batch of files recorded the same way needs just
+# one.
+_MATRIX_CACHE_SIZE = 32
+
+
+@functools.lru_cache(maxsize=_MATRIX_CACHE_SIZE)
+def get_chroma_matrix(sample_rate, fft_size, num_bins):
+    """ Get the sparse matrix that folds num_bins units of the spectrum of a
+    transform of fft_size samples at the given sample rate into the semitones
+    of SORTED_FREQS. Each unit goes to the note that freq_to_note gives its
+    frequency, and units below C0 or above B10 (like the DC unit) are
+    dropped. The matrix is built once for every set of arguments and then
+    shared, so it must not be changed. """
+
+    freqs = np.arange(num_bins) * (sample_rate / fft_size)
+    notes = freqs_to_notes(freqs)
+    bins = np.flatnonzero(~np.ma.getmaskarray(notes.note_index))
+    semitones = notes.octave.data[bins].astype(np.intp) * len(NOTES) + notes.note_index.data[bins]
+
+    matrix = scipy.sparse.csr_matrix((np.ones(len(bins)), (semitones, bins)),
+                                     shape=(len(SORTED_FREQS), num_bins))
+    count('chroma_matrices')
+    return matrix
+
+
+def get_chroma(magnitudes, sample_rate, fft_size):
+    """ Fold the magnitudes of a spectrum of fft_size samples at the given
+    sample rate into the energy of every note in FREQ_TABLE. Returns an array
+    with one row for each of the 12 NOTES and one column for each of the 11
+    octaves, so chroma[NOTES.index(note), octave] is the energy of
+    FREQ_TABLE[note][octave]. The energy is the sum of the squared
+    magnitudes of every unit in the semitone.
+
+    Magnitudes can also have one row per frame (like those of
+    frame_spectra), and then the chroma has a leading axis for the frames.
+    Every frame is folded by the same matrix product. """
+
+    magnitudes = np.asarray(magnitudes)
+    matrix = get_chroma_matrix(float(sample_rate), int(fft_size), magnitudes.shape[-1])
+
+    with span('chroma', frames=len(magnitudes) if magnitudes.ndim > 1 else 1):
+        energies = np.square(magnitudes, dtype=np.float64)
+        chroma = (matrix @ energies.T).T
+
+    # Rows of SORTED_FREQS go through every note of one octave before the
+    # next, so they split into one row of notes per octave.
+    return np.swapaxes(chroma.reshape(chroma.shape[:-1] + (NUM_OCTAVES, len(NOTES))), -1, -2)
+
+
+def get_spectrum_chroma(spectrum):
+    """ Get the chroma of a Spectrum (see get_chroma). """
+
+    return get_chroma(spectrum.magnitudes, spectrum.analysis_rate, spectrum.fft_size)
+
+
+def to_pitch_class_profile(chroma):
+    """ Sum a chroma over its octaves into the energy of each of the 12 NOTES,
+    scaled so that they add up to 1 (or left at 0 if there is no energy at
+    all). Chromas of several frames give a profile for every frame. """
+
+    profile = chroma.sum(axis=-1)
+    total = profile.sum(axis=-1, keepdims=True)
+    return np.divide(profile, total, out=np.zeros_like(profile), where=total > 0)
+
+
+def chromagram(path, frame_size=8192, hop_size=2048, batch_size=64):
+    """ Get the chroma of every frame of a WAV file (see frame_spectra).
+    Returns an array of the timestamps of the frames, and an array with the
+    chroma of each frame (see get_chroma). Frames are folded batch_size at a
+    time, so only that many spectrums are ever in memory. """
+
+    if batch_size <= 0:
+        raise ValueError("The batch size must be positive")
+
+    with WavReader(path) as reader:
+        sample_rate = reader.sample_rate
+
+    log('\nFinding the chroma of frames of WAV file at "{}"', path)
+    timestamps = []
+    chromas = []
+    batch = []
+    for timestamp, magnitudes, _ in frame_spectra(path, frame_size, hop_size):
+        timestamps.append(timestamp)
+        batch.append(magnitudes)
+        if len(batch) == batch_size:
+            chromas.append(get_chroma(np.array(batch), sample_rate, frame_size))
+            batch = []
+    if batch:
+        chromas.append(get_chroma(np.array(batch), sample_rate, frame_size))
+
+    if not chromas:
+        return np.zeros(0), np.zeros((0, len(NOTES), NUM_OCTAVES))
+    return np.array(timestamps), np.concatenate(chromas)
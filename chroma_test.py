@@ -0,0 +1,76 @@
+import pytest
+from chroma import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav",
+]
+
+
+# Test that every unit of the spectrum goes to the note that freq_to_note
+# gives it.
+def test_get_chroma_matrix():
+    matrix = get_chroma_matrix(44100.0, 65536, 32768)
+    assert matrix.shape == (len(SORTED_FREQS), 32768)
+    assert get_chroma_matrix(44100.0, 65536, 32768) is matrix
+
+    freqs = np.arange(32768) * 44100 / 65536
+    semitones = np.asarray(matrix.argmax(axis=0)).ravel()
+    in_range = (freqs >= float(LOWEST_NOTE_FREQ)) & (freqs <= float(HIGHEST_NOTE_FREQ))
+    assert np.array_equal(np.asarray(matrix.sum(axis=0)).ravel(), in_range)
+    for i in np.flatnonzero(in_range):
+        assert SORTED_FREQS[semitones[i]] == standardize_freq(freqs[i])
+
+
+# Test folding the spectrum of a pure tone.
+def test_get_chroma():
+    magnitudes = np.zeros(1000)
+    magnitudes[440] = 2
+    magnitudes[0] = 5
+    chroma = get_chroma(magnitudes, 2000, 2000)
+    assert chroma.shape == (len(NOTES), NUM_OCTAVES)
+    assert chroma[NOTES.index('A'), 4] == 4
+    assert chroma.sum() == 4
+
+    # Frames are folded all at once.
+    frames = np.array([magnitudes, magnitudes / 2])
+    chromas = get_chroma(frames, 2000, 2000)
+    assert chromas.shape == (2, len(NOTES), NUM_OCTAVES)
+    assert np.array_equal(chromas[0], chroma)
+    assert np.array_equal(chromas[1], chroma / 4)
+
+    profile = to_pitch_class_profile(chromas)
+    assert np.array_equal(profile[:, NOTES.index('A')], [1, 1])
+    assert np.array_equal(to_pitch_class_profile(np.zeros((12, 11))), np.zeros(12))
+
+
+# Test the chroma of samples, and that the matrices are shared across files.
+def test_get_spectrum_chroma():
+    sink = MemorySink(types=['count'])
+    add_sink(sink)
+    try:
+        spectrums = [Spectrum(path, fft_backend=get_fft_backend('pad')) for path in testPaths * 2]
+        get_chroma_matrix.cache_clear()
+        chromas = [get_spectrum_chroma(spectrum) for spectrum in spectrums]
+    finally:
+        remove_sink(sink)
+
+    assert sink.counters()['chroma_matrices'] == len({len(spectrum.magnitudes) for spectrum in spectrums})
+    assert NOTES[to_pitch_class_profile(chromas[0]).argmax()] == 'A'
+    assert NOTES[to_pitch_class_profile(chromas[1]).argmax()] == 'D♯'
+    assert np.unravel_index(chromas[0].argmax(), chromas[0].shape) == (NOTES.index('A'), 4)
+
+
+# Test the chroma of every frame of a file.
+def test_chromagram():
+    timestamps, chromas = chromagram(testPaths[0], 4096, 1024, batch_size=7)
+    frames = list(frame_spectra(testPaths[0], 4096, 1024))
+    assert np.array_equal(timestamps, [frame[0] for frame in frames])
+    assert chromas.shape == (len(frames), len(NOTES), NUM_OCTAVES)
+    assert np.allclose(chromas[10], get_chroma(frames[10][1], 44100, 4096))
+
+    profiles = to_pitch_class_profile(chromas)
+    assert np.bincount(profiles.argmax(axis=1)).argmax() == NOTES.index('A')
+
+    with pytest.raises(ValueError):
+        chromagram(testPaths[0], batch_size=0)
@@ -0,0 +1,221 @@
+import numpy as np
+import scipy.fft
+from spectrum import *
+
+# Names of the pitch detectors that make_detector can create.
+DETECTOR_NAMES = ('harmonic', 'yin')
+
+
+class HarmonicDetector():
+    """
+    HarmonicDetector finds the fundamental frequency in the power spectrum of
+    the whole signal, with one of FUND_FREQ_METHODS (see
+    Spectrum.get_fund_freq). It's the most robust detector for polyphonic or
+    noisy material, but it needs a transform of the entire signal.
+    """
+
+    name = 'harmonic'
+
+    def __init__(self, min_freq=150, method='pairwise', fft_backend=None, max_freq=None):
+        if method not in FUND_FREQ_METHODS:
+            raise ValueError(f'Invalid method: "{method}"')
+
+        self.min_freq = min_freq
+        self.method = method
+        self.fft_backend = fft_backend
+        self.max_freq = max_freq
+
+    def detect(self, samples, sample_rate):
+        """ Find the fundamental frequency of a signal in memory, with one row
+        per sample (and one column per channel for multichannel signals).
+        Returns 0.0 if none can be found. """
+
+        spectrum = Spectrum.from_samples(samples, sample_rate, fft_backend=self.fft_backend, max_freq=self.max_freq)
+        return spectrum.get_fund_freq(self.min_freq, self.method)
+
+    def detect_file(self, path, channel=None):
+        """ Find the fundamental frequency of the WAV file at the given path
+        (or of a single channel of it). Returns 0.0 if none can be found. """
+
+        spectrum = Spectrum(path, lazy=True, fft_backend=self.fft_backend, max_freq=self.max_freq, channel=channel)
+        return spectrum.get_fund_freq(self.min_freq, self.method)
+
+
+class YinDetector():
+    """
+    YinDetector finds the fundamental frequency in the time domain with the
+    YIN algorithm (de Cheveigné and Kawahara, 2002). Each analysis window is
+    compared against delayed copies of itself, and the shortest delay at which
+    it (almost) repeats is the period of the fundamental. The comparison of
+    every delay is computed at once from an autocorrelation via FFT.
+
+    Only short windows are analyzed, so it uses far less memory and time than
+    a transform of the whole signal, but it's meant for monophonic material.
+    Fields:
+        - min_freq, max_freq: range of fundamental frequencies to look for
+        - threshold: how closely a window must repeat itself (the lower, the
+          stricter); windows that don't repeat closely enough are unvoiced
+        - window_size: number of samples compared at each delay
+        - num_windows: number of windows spread across a file by detect_file
+    """
+
+    name = 'yin'
+
+    def __init__(self, min_freq=150, max_freq=5000, threshold=0.1, window_size=1024, num_windows=16):
+        if min_freq <= 0 or max_freq <= min_freq:
+            raise ValueError("The frequency range must be positive and not empty")
+        if not 0 < threshold < 1:
+            raise ValueError("The threshold must be between 0 and 1")
+        if window_size <= 0 or num_windows <= 0:
+            raise ValueError("The window size and number of windows must be positive")
+
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.threshold = threshold
+        self.window_size = window_size
+        self.num_windows = num_windows
+
+    def get_frame_size(self, sample_rate):
+        """ Get the number of samples needed to analyze one window: the window
+        itself and the longest delay. """
+
+        return self.window_size + int(np.ceil(sample_rate / self.min_freq)) + 1
+
+    def detect(self, samples, sample_rate):
+        """ Find the fundamental frequency of a signal in memory, with one row
+        per sample (and one column per channel for multichannel signals). Up
+        to num_windows windows are spread evenly across it, but no more than
+        fit in the signal side by side. The result is the median of the
+        frequencies of the voiced windows, or 0.0 if there are none. """
+
+        frame_size = self.get_frame_size(sample_rate)
+        starts = self._get_starts(len(samples), frame_size)
+        frames = np.stack([downmix(samples[start:start+frame_size]) for start in starts])
+
+        return self._detect_windows(frames, sample_rate)
+
+    def detect_file(self, path, channel=None):
+        """ Find the fundamental frequency of the WAV file at the given path
+        (or of a single channel of it), like detect() does. Only the analyzed
+        windows are read from the file. """
+
+        log('\nDetecting pitch of WAV file at "{}"', path)
+        count('files')
+        with WavReader(path) as reader:
+            frame_size = self.get_frame_size(reader.sample_rate)
+            starts = self._get_starts(reader.num_frames, frame_size)
+            frames = np.empty((len(starts), frame_size))
+            for frame, start in zip(frames, starts):
+                read_signal(reader, channel=channel, start=start, end=start+frame_size, out=frame)
+
+        return self._detect_windows(frames, reader.sample_rate)
+
+    def _get_starts(self, num_samples, frame_size):
+        """ Get the start of every window to analyze in a signal with
+        num_samples samples: up to num_windows spread evenly across it, but
+        no more than fit in the signal side by side. """
+
+        if num_samples < frame_size:
+            raise ValueError(f"The signal needs at least {frame_size} samples")
+
+        num_windows = min(self.num_windows, num_samples // frame_size)
+        return np.linspace(0, num_samples - frame_size, num_windows).astype(np.intp)
+
+    def _detect_windows(self, frames, sample_rate):
+        """ Find the fundamental frequency of a signal from its windows. """
+
+        freqs = self.detect_frames(frames, sample_rate)
+
+        voiced = freqs[freqs > 0]
+        fund_freq = float(np.median(voiced)) if len(voiced) > 0 else 0.0
+        log("\tFundamental frequency: {}Hz ({} of {} windows voiced)", fund_freq, len(voiced), len(freqs))
+
+        return fund_freq
+
+    def detect_frames(self, frames, sample_rate):
+        """ Find the fundamental frequency of every row of a 2-D array of mono
+        frames of get_frame_size(sample_rate) samples. Unvoiced frames get
+        0.0. """
+
+        with span('yin', frames=len(frames)):
+            min_lag = max(int(sample_rate // self.max_freq), 2)
+            max_lag = frames.shape[1] - self.window_size - 1
+            window = self.window_size
+
+            # The difference between the window and a copy delayed by lag is
+            #     d(lag) = sum((x[j] - x[j+lag])^2) for j in the window
+            #            = energy of the window + energy of the delayed window
+            #              - 2 * correlation of the two
+            # The correlation at every lag comes from a single transform.
+            fft_size = scipy.fft.next_fast_len(frames.shape[1] + window, real=True)
+            spectra = scipy.fft.rfft(frames, fft_size, axis=1)
+            spectra *= np.conj(scipy.fft.rfft(frames[:, :window], fft_size, axis=1))
+            corr = scipy.fft.irfft(spectra, fft_size, axis=1)[:, :max_lag+1]
+            del spectra
+
+            squares = np.cumsum(frames.astype(np.float64) ** 2, axis=1)
+            squares = np.concatenate((np.zeros((len(frames), 1)), squares), axis=1)
+            lags = np.arange(max_lag + 1)
+            energy = squares[:, window][:, np.newaxis]
+            delayed_energy = squares[:, lags + window] - squares[:, lags]
+            diff = energy + delayed_energy - 2 * corr
+
+            # Normalize each difference by the mean of the differences at
+            # shorter lags, so that the threshold doesn't depend on the
+            # loudness of the signal.
+            cumulative = np.cumsum(diff[:, 1:], axis=1)
+            norm = np.ones_like(diff)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                norm[:, 1:] = diff[:, 1:] * lags[1:] / cumulative
+            norm[~np.isfinite(norm)] = 1
+
+            freqs = np.zeros(len(frames))
+            for i, row in enumerate(norm):
+                lag = self._pick_lag(row, min_lag, max_lag)
+                if lag is not None:
+                    freqs[i] = sample_rate / lag
+
+        return freqs
+
+    def _pick_lag(self, norm, min_lag, max_lag):
+        """ Pick the period (in samples, with sub-sample precision) from the
+        normalized differences of one frame: the first dip below the threshold,
+        at the bottom of that dip. Returns None if there is no such dip. """
+
+        below = np.nonzero(norm[min_lag:max_lag] < self.threshold)[0]
+        if len(below) == 0:
+            return None
+
+        lag = min_lag + int(below[0])
+        while lag + 1 < max_lag and norm[lag + 1] < norm[lag]:
+            lag += 1
+
+        # Fit a parabola through the bottom of the dip and its neighbours to
+        # find where the true minimum lies between samples.
+        prev, cur, nxt = norm[lag - 1], norm[lag], norm[lag + 1]
+        denom = prev - 2 * cur + nxt
+        if denom > 0:
+            return lag + (prev - nxt) / (2 * denom)
+        return float(lag)
+
+
+_DETECTORS = {
+    'harmonic': HarmonicDetector,
+    'yin': YinDetector,
+}
+
+
+def make_detector(name, **options):
+    """ Create the pitch detector with the given name (one of DETECTOR_NAMES),
+    passing it any options. Every detector has:
+        - name: its name
+        - detect(samples, sample_rate): find the fundamental frequency of a
+          signal in memory
+        - detect_file(path, channel=None): find the fundamental frequency
+          of a WAV file, or of one of its channels
+    Both return 0.0 if no fundamental frequency can be found. """
+
+    if name not in _DETECTORS:
+        raise ValueError(f'Invalid detector: "{name}"')
+
+    return _DETECTORS[name](**options)
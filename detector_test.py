@@ -0,0 +1,46 @@
+import pytest
+from detector import *
+from spectrum_test import testFiles
+
+
+# Test creating detectors.
+def test_make_detector():
+    with pytest.raises(ValueError):
+        make_detector('bogus')
+    with pytest.raises(ValueError):
+        make_detector('harmonic', method='bogus')
+    with pytest.raises(ValueError):
+        make_detector('yin', min_freq=500, max_freq=400)
+    with pytest.raises(ValueError):
+        make_detector('yin', threshold=1)
+
+    for name in DETECTOR_NAMES:
+        assert make_detector(name).name == name
+
+
+# Test finding the fundamental frequency of synthetic tones.
+def test_detect():
+    sample_rate = 44100
+    t = np.arange(sample_rate // 2) / sample_rate
+    for freq in [196.0, 440.0, 1046.5, 2637.0]:
+        # A tone with a few harmonics, the second one stronger than the
+        # fundamental.
+        tone = np.sin(2*np.pi*freq*t) + 1.5*np.sin(4*np.pi*freq*t) + 0.5*np.sin(6*np.pi*freq*t)
+        for name in DETECTOR_NAMES:
+            fund_freq = make_detector(name).detect(tone, sample_rate)
+            assert fund_freq == pytest.approx(freq, rel=0.005)
+
+    # Silence and noise have no fundamental frequency.
+    yin = make_detector('yin')
+    assert yin.detect(np.zeros(sample_rate), sample_rate) == 0.0
+    assert yin.detect(np.random.default_rng(0).normal(size=sample_rate), sample_rate) == 0.0
+
+    with pytest.raises(ValueError):
+        yin.detect(np.zeros(100), sample_rate)
+
+
+# Test that YIN finds the note of every violin sample.
+def test_YinDetector_detect_file():
+    yin = make_detector('yin')
+    for testFile in testFiles:
+        assert str(freq_to_note(yin.detect_file(testFile.path))) == testFile.fund_note
@@ -0,0 +1,152 @@
+import os
+import threading
+import numpy as np
+import scipy.fft
+from log import *
+
+# Ways of choosing the length of the transform of a signal:
+#     - 'exact': transform every sample, whatever the length of the signal
+#     - 'pad': pad the signal with zeros up to the next length that can be
+#       transformed quickly (a product of small primes)
+#     - 'trim': drop samples from the end of the signal down to the previous
+#       length that can be transformed quickly
+# Signals whose length has large prime factors take much longer to transform
+# exactly. Padding keeps every sample and interpolates the spectrum, and
+# trimming keeps the spectrum's resolution close to that of the signal.
+FFT_SIZES = ('exact', 'pad', 'trim')
+
+# Transforms of at least this many samples are spread across threads by
+# default. Smaller ones finish faster in a single thread.
+PARALLEL_THRESHOLD = 1 << 18
+
+# Maximum number of padding buffers each thread keeps for reuse.
+_MAX_BUFFERS = 4
+
+
+def get_fft_size(num_samples, size_mode='exact'):
+    """ Get the length of the transform of a signal with num_samples samples
+    for the given mode (one of FFT_SIZES). """
+
+    if size_mode not in FFT_SIZES:
+        raise ValueError(f'Invalid FFT size: "{size_mode}"')
+
+    if size_mode == 'pad':
+        return scipy.fft.next_fast_len(num_samples, real=True)
+    if size_mode == 'trim':
+        return scipy.fft.prev_fast_len(num_samples, real=True)
+    return num_samples
+
+
+class FFTBackend():
+    """
+    FFTBackend computes the Fourier Transforms of real signals. The length of
+    each transform is chosen with size_mode (see FFT_SIZES). workers is the
+    number of threads used for each transform; by default, transforms of at
+    least PARALLEL_THRESHOLD samples use every CPU and smaller ones use one.
+
+    Analyzing a batch of files with one backend reuses its work across files
+    with the same length: scipy.fft keeps the plans of the most recent
+    transform lengths, and the zero-padded copies of the signals are made in
+    buffers that the backend keeps for each thread.
+    """
+
+    def __init__(self, size_mode='exact', workers=None):
+        if size_mode not in FFT_SIZES:
+            raise ValueError(f'Invalid FFT size: "{size_mode}"')
+        if workers is not None and workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+
+        self.size_mode = size_mode
+        self.workers = workers
+        self._local = threading.local()
+
+    def get_size(self, num_samples):
+        """ Get the length of the transform of a signal with num_samples
+        samples. """
+
+        return get_fft_size(num_samples, self.size_mode)
+
+    def get_workers(self, fft_size):
+        """ Get the number of threads used for a transform of the given
+        length. """
+
+        if self.workers is not None:
+            return self.workers
+        if fft_size >= PARALLEL_THRESHOLD:
+            return os.cpu_count() or 1
+        return 1
+
+    def transform(self, signal):
+        """ Compute the Fourier Transform of a mono signal, up to (but not
+        including) the Nyquist limit, and return it along with the length of
+        the transform. The transform keeps the precision of the signal
+        (complex64 for float32 and complex128 for float64). """
+
+        num_samples = len(signal)
+        fft_size = self.get_size(num_samples)
+
+        # Trimming only needs a view of the start of the signal, but padding
+        # needs a longer copy.
+        if fft_size < num_samples:
+            signal = signal[:fft_size]
+        elif fft_size > num_samples:
+            buffer = self._get_buffer(fft_size, signal.dtype)
+            buffer[:num_samples] = signal
+            buffer[num_samples:] = 0
+            signal = buffer
+
+        workers = self.get_workers(fft_size)
+        with span('fft', size=fft_size, workers=workers):
+            # The signal is real, so the negative frequencies mirror the
+            # positive ones and a real-input transform only has to compute
+            # half of them.
+            fft_data = scipy.fft.rfft(signal, workers=workers)
+
+        # We now have a list of frequencies and their data. We can ignore all
+        # frequencies at and above the Nyquist limit (half the sample rate),
+        # because they cannot be reliably reproduced from the digital signal.
+        return fft_data[:fft_size // 2], fft_size
+
+    def _get_buffer(self, size, dtype):
+        """ Get this thread's buffer of the given length and type, creating it
+        if needed. """
+
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+
+        key = (size, np.dtype(dtype))
+        buffer = buffers.pop(key, None)
+        if buffer is None:
+            buffer = np.empty(size, dtype=dtype)
+            if len(buffers) >= _MAX_BUFFERS:
+                del buffers[next(iter(buffers))]
+
+        # Keep the most recently used buffer at the end.
+        buffers[key] = buffer
+        return buffer
+
+    def __reduce__(self):
+        # A backend sent to another process (e.g. a batch worker) becomes that
+        # process's shared backend with the same settings, so that its buffers
+        # are reused across every file the process analyzes.
+        return (get_fft_backend, (self.size_mode, self.workers))
+
+
+# Backends shared by everything in this process, by their settings.
+_SHARED_BACKENDS = {}
+
+
+def get_fft_backend(size_mode='exact', workers=None):
+    """ Get the FFTBackend with the given settings that is shared by
+    everything in this process. """
+
+    key = (size_mode, workers)
+    if key not in _SHARED_BACKENDS:
+        _SHARED_BACKENDS[key] = FFTBackend(size_mode, workers)
+
+    return _SHARED_BACKENDS[key]
+
+
+# Backend used by spectrums that aren't given one.
+DEFAULT_FFT_BACKEND = get_fft_backend()
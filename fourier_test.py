@@ -0,0 +1,51 @@
+import pickle
+import pytest
+from fourier import *
+
+
+# Test choosing the length of a transform.
+def test_get_fft_size():
+    with pytest.raises(ValueError):
+        get_fft_size(1000, 'bogus')
+
+    assert get_fft_size(138591) == 138591
+    assert get_fft_size(138591, 'pad') == 139968
+    assert get_fft_size(138591, 'trim') == 138240
+    assert get_fft_size(1024, 'pad') == 1024
+    assert get_fft_size(1024, 'trim') == 1024
+
+
+# Test transforming signals with each backend.
+def test_FFTBackend():
+    with pytest.raises(ValueError):
+        FFTBackend('bogus')
+    with pytest.raises(ValueError):
+        FFTBackend(workers=0)
+
+    signal = np.sin(np.arange(1009) * 0.25)
+    want = scipy.fft.rfft(signal)[:504]
+
+    fft_data, fft_size = FFTBackend().transform(signal)
+    assert fft_size == 1009
+    assert np.allclose(fft_data, want)
+
+    backend = FFTBackend('pad', workers=2)
+    assert backend.get_workers(1 << 20) == 2
+    fft_data, fft_size = backend.transform(signal)
+    assert fft_size == 1024
+    assert np.allclose(fft_data, scipy.fft.rfft(signal, 1024)[:512])
+
+    # The padding buffer is reused, and cleared past the end of a shorter
+    # signal.
+    fft_data, fft_size = backend.transform(signal[:1001])
+    assert fft_size == 1024
+    assert np.allclose(fft_data, scipy.fft.rfft(signal[:1001], 1024)[:512])
+
+    fft_data, fft_size = FFTBackend('trim').transform(signal.astype(np.float32))
+    assert fft_size == 1000
+    assert fft_data.dtype == np.complex64
+    assert np.allclose(fft_data, scipy.fft.rfft(signal[:1000])[:500], atol=1e-3)
+
+    # Backends are shared by everything in a process with the same settings.
+    assert get_fft_backend() is DEFAULT_FFT_BACKEND
+    assert pickle.loads(pickle.dumps(get_fft_backend('pad'))) is get_fft_backend('pad')
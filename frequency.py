@@ -1,9 +1,16 @@
+import collections
+import math
 from decimal import *
+import numpy as np
 from notes import *
 
-# Set the precision and rounding option for decimals.
+# Set the precision and rounding option for decimals. Every thread has its own
+# context, copied from the default one when the thread first uses decimals, so
+# the default is set too for threads that analyze files (see pipeline.py).
 getcontext().prec = 7
 getcontext().rounding = ROUND_FLOOR
+DefaultContext.prec = 7
+DefaultContext.rounding = ROUND_FLOOR
 
 
 # Some standard frequencies for reference
@@ -31,9 +38,67 @@ FREQ_TABLE = {
 }
 
 
+# Every frequency in FREQ_TABLE in ascending order, so that the index of a
+# frequency is the number of semitones it is above C0.
+SORTED_FREQS = [FREQ_TABLE[note][octave] for octave in range(11) for note in NOTES]
+_MIDDLE_C_INDEX = SORTED_FREQS.index(MIDDLE_C_FREQ)
+
+# Float versions of the reference frequencies for the fast path.
+_MIDDLE_C_FLOAT = float(MIDDLE_C_FREQ)
+_LOWEST_NOTE_FLOAT = float(LOWEST_NOTE_FREQ)
+_HIGHEST_NOTE_FLOAT = float(HIGHEST_NOTE_FREQ)
+
+# Float array of SORTED_FREQS for vectorized lookups.
+SORTED_FREQS_ARRAY = np.array([float(freq) for freq in SORTED_FREQS])
+
+# Parallel arrays describing the closest standard note to each of an array of
+# frequencies. See freqs_to_notes.
+NoteArrays = collections.namedtuple('NoteArrays', ['note_index', 'octave', 'freq', 'cents'])
+
+# How close (in semitones) a frequency must be to the boundary between two
+# notes for the fast path to defer to the Decimal calculation. The Decimal
+# calculation has 7 digits of precision, which puts it within about 0.00005
+# semitones of the exact value, so this leaves a wide safety margin.
+_BOUNDARY_TOLERANCE = 0.001
+
+
+def get_semitone_index(freq):
+    """ Get the index in SORTED_FREQS of the standard note closest to the
+    frequency. This is the same note that standardize_freq_decimal picks, but
+    it's calculated in closed form with floats. """
+
+    # Calculate the number of semitones away from Middle C it is, and round it
+    # to the nearest whole number. If it's almost exactly halfway between two
+    # notes, then the rounding depends on the precision of the calculation, so
+    # we use the reference calculation to get the same answer. That also
+    # covers the limits of the range, where the float comparison could
+    # disagree with the Decimal one.
+    f = float(freq)
+    if _LOWEST_NOTE_FLOAT < f < _HIGHEST_NOTE_FLOAT:
+        semitones = 12 * math.log2(f / _MIDDLE_C_FLOAT)
+        if abs(semitones - math.floor(semitones) - 0.5) < _BOUNDARY_TOLERANCE:
+            semitones = _count_semitones_decimal(freq)
+    else:
+        semitones = _count_semitones_decimal(freq)
+
+    # The reference calculation picks the closest frequency in the table, so
+    # anything past either end of it gets the note at that end.
+    index = round(semitones) + _MIDDLE_C_INDEX
+    return min(max(index, 0), len(SORTED_FREQS) - 1)
+
+
 def standardize_freq(freq):
     """ Calculate the closest frequency that matches a note on the standard
-    12-note scale. """
+    12-note scale. This returns exactly the same values as
+    standardize_freq_decimal, but much faster. """
+
+    return SORTED_FREQS[get_semitone_index(freq)]
+
+
+def _count_semitones_decimal(freq):
+    """ Calculate the number of whole semitones between Middle C and the
+    frequency using Decimal math. This is the first step of
+    standardize_freq_decimal. """
 
     freq = Decimal(freq)
     if freq < LOWEST_NOTE_FREQ or freq > HIGHEST_NOTE_FREQ:
@@ -44,7 +109,14 @@ def standardize_freq(freq):
     # imperfections in the sample data.
     d = freq / MIDDLE_C_FREQ
     log = d.log10() / Decimal('2').log10()
-    num_semitones = Decimal(round(12 * Decimal(log)))
+    return round(12 * Decimal(log))
+
+
+def standardize_freq_decimal(freq):
+    """ Calculate the closest frequency that matches a note on the standard
+    12-note scale. This is the reference calculation using Decimal math. """
+
+    num_semitones = Decimal(_count_semitones_decimal(freq))
 
     # Calculate back to a frequency, which is now based on Middle C and will
     # have a standard/normalized value.
@@ -67,3 +139,57 @@ def standardize_freq(freq):
                 chosen = table_freq
 
     return chosen
+
+
+def freqs_to_notes(freqs):
+    """ Find the closest standard note to every frequency in an array. This is
+    the vectorized version of standardize_freq, and it returns NoteArrays of
+    the same shape as freqs with:
+        - note_index: index of the note in NOTES (int8)
+        - octave: octave of the note (int8)
+        - freq: standardized frequency of the note, as in FREQ_TABLE (float64)
+        - cents: deviation of the frequency from the note in cents (float64)
+    Each field is a masked array. Frequencies that are out of range (or NaN)
+    are masked instead of raising a ValueError. """
+
+    freqs = np.asarray(freqs, dtype=np.float64)
+    valid = (freqs >= _LOWEST_NOTE_FLOAT) & (freqs <= _HIGHEST_NOTE_FLOAT)
+
+    # Calculate the number of semitones away from Middle C, exactly like
+    # get_semitone_index does for a single frequency.
+    semitones = np.where(valid, freqs, _MIDDLE_C_FLOAT)
+    semitones /= _MIDDLE_C_FLOAT
+    np.log2(semitones, out=semitones)
+    semitones *= 12
+    indices = np.rint(semitones).astype(np.int64)
+    indices += _MIDDLE_C_INDEX
+    np.clip(indices, 0, len(SORTED_FREQS) - 1, out=indices)
+
+    # Frequencies that are almost halfway between two notes, or right at the
+    # limits of the range, are handed to the scalar version to make sure that
+    # they get exactly the same note. There are normally very few of them.
+    semitones -= np.floor(semitones)
+    semitones -= 0.5
+    np.abs(semitones, out=semitones)
+    edges = valid & ((semitones < _BOUNDARY_TOLERANCE) |
+                     (freqs == _LOWEST_NOTE_FLOAT) | (freqs == _HIGHEST_NOTE_FLOAT))
+    for i in zip(*np.nonzero(edges)):
+        try:
+            indices[i] = get_semitone_index(freqs[i])
+        except ValueError:
+            valid[i] = False
+    del semitones
+
+    note_freqs = SORTED_FREQS_ARRAY[indices]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cents = freqs / note_freqs
+        np.log2(cents, out=cents)
+        cents *= 1200
+
+    mask = ~valid
+    return NoteArrays(
+        np.ma.masked_array((indices % 12).astype(np.int8), mask=mask),
+        np.ma.masked_array((indices // 12).astype(np.int8), mask=mask),
+        np.ma.masked_array(note_freqs, mask=mask),
+        np.ma.masked_array(cents, mask=mask),
+    )
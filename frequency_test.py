@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from frequency import *
 
@@ -31,3 +32,91 @@ def test_standardize_freq():
 
             freq = standardize_freq(test_freq)
             assert freq == want_freq
+
+
+# Test the table of sorted frequencies.
+def test_sorted_freqs():
+    assert len(SORTED_FREQS) == 132
+    assert SORTED_FREQS[0] == LOWEST_NOTE_FREQ
+    assert SORTED_FREQS[-1] == HIGHEST_NOTE_FREQ
+    assert SORTED_FREQS[48] == MIDDLE_C_FREQ
+    assert SORTED_FREQS[57] == CONCERT_A_FREQ
+    assert SORTED_FREQS == sorted(SORTED_FREQS)
+
+
+# Test that "standardize_freq" gives the same results as the reference
+# calculation in "standardize_freq_decimal".
+def test_standardize_freq_reference():
+    # Test invalid frequencies.
+    with pytest.raises(ValueError):
+        standardize_freq_decimal(LOWEST_NOTE_FREQ - Decimal('.01'))
+    with pytest.raises(ValueError):
+        standardize_freq_decimal(HIGHEST_NOTE_FREQ + Decimal('.01'))
+    with pytest.raises(ValueError):
+        standardize_freq(float(LOWEST_NOTE_FREQ) - 0.01)
+    with pytest.raises(ValueError):
+        standardize_freq(float(HIGHEST_NOTE_FREQ) + 0.01)
+
+    # Test the limits of the range.
+    assert standardize_freq(LOWEST_NOTE_FREQ) == LOWEST_NOTE_FREQ
+    assert standardize_freq(HIGHEST_NOTE_FREQ) == HIGHEST_NOTE_FREQ
+
+    # Test every note, frequencies around the boundaries between notes, and
+    # frequencies spread over the whole range, in different types.
+    test_freqs = [Decimal(table_freq) for table_freq in SORTED_FREQS]
+    for table_freq in SORTED_FREQS[:-1]:
+        boundary = float(table_freq) * 2 ** (1 / 24)
+        for offset in [-1e-4, -1e-5, -1e-6, 0, 1e-6, 1e-5, 1e-4]:
+            test_freqs.append(boundary * (1 + offset))
+    for i in range(2000):
+        test_freqs.append(float(LOWEST_NOTE_FREQ) * (float(HIGHEST_NOTE_FREQ / LOWEST_NOTE_FREQ) ** (i / 2000)))
+    test_freqs.append('440')
+    test_freqs.append(440)
+
+    for test_freq in test_freqs:
+        freq = standardize_freq(test_freq)
+        assert type(freq) == Decimal
+        assert freq == standardize_freq_decimal(test_freq)
+        assert get_semitone_index(test_freq) == SORTED_FREQS.index(freq)
+
+
+# Test the function "freqs_to_notes".
+def test_freqs_to_notes():
+    # Test frequencies around the boundaries between notes and spread over the
+    # whole range, along with some invalid ones.
+    test_freqs = []
+    for table_freq in SORTED_FREQS[:-1]:
+        boundary = float(table_freq) * 2 ** (1 / 24)
+        for offset in [-1e-4, -1e-6, 0, 1e-6, 1e-4]:
+            test_freqs.append(boundary * (1 + offset))
+    for i in range(1000):
+        test_freqs.append(float(LOWEST_NOTE_FREQ) * (float(HIGHEST_NOTE_FREQ / LOWEST_NOTE_FREQ) ** (i / 1000)))
+    test_freqs += [float(LOWEST_NOTE_FREQ), float(HIGHEST_NOTE_FREQ), 0, -440, 16, 32000, np.nan, np.inf]
+    test_freqs = np.array(test_freqs)
+
+    notes = freqs_to_notes(test_freqs)
+    for field in notes:
+        assert field.shape == test_freqs.shape
+    assert notes.note_index.dtype == np.int8
+    assert notes.octave.dtype == np.int8
+
+    for i, test_freq in enumerate(test_freqs):
+        try:
+            want_freq = standardize_freq(test_freq)
+        except (ValueError, InvalidOperation):
+            for field in notes:
+                assert field.mask[i]
+            continue
+
+        for field in notes:
+            assert not field.mask[i]
+        assert notes.freq[i] == float(want_freq)
+        assert FREQ_TABLE[NOTES[notes.note_index[i]]][notes.octave[i]] == want_freq
+        assert notes.cents[i] == pytest.approx(1200 * np.log2(test_freq / float(want_freq)))
+        assert abs(notes.cents[i]) <= 50.1
+
+    # Test that the shape of the input is kept.
+    notes = freqs_to_notes([[440.0, 880.0], [5.0, 261.6256]])
+    assert notes.octave.shape == (2, 2)
+    assert notes.octave.tolist() == [[4, 5], [None, 4]]
+    assert notes.note_index.tolist() == [[9, 9], [None, 0]]
@@ -1,11 +1,251 @@
+import collections
+import json
+import os
+import sys
+import time
+
+# Instrumentation of the analysis. Three kinds of records are sent to every
+# registered sink, each as a dict with a 'type' key:
+#     - 'log': a human-readable message
+#     - 'span': the duration in seconds of a stage of the analysis (e.g. the
+#       FFT), with any extra fields given to span()
+#     - 'count': an increment of a counter (e.g. the number of peaks found)
+# When there are no sinks, nothing is formatted, timed or counted.
+
+# Whether log messages are printed to stdout. This is kept for compatibility;
+# use set_logging() to change it and logging_enabled() to read it, since a copy
+# made with "from log import *" doesn't follow changes.
 ENABLE_LOGGING = False
 
+# Registered sinks, and whether any of them are interested in each kind of
+# record. The flags are checked before any work is done, so that disabled
+# instrumentation costs a single lookup.
+_SINKS = []
+_WANTS_LOGS = False
+_WANTS_SPANS = False
+_WANTS_COUNTS = False
+
+# The kinds of records that sinks can receive.
+RECORD_TYPES = ('log', 'span', 'count')
+
+
+class TextSink():
+    """
+    TextSink prints records as plain text to stdout or stderr (or to any other
+    file object, but only the standard streams can be sent to worker
+    processes). types limits which kinds of records are printed.
+    """
+
+    def __init__(self, stream='stderr', types=RECORD_TYPES):
+        self.stream = stream
+        self.types = frozenset(types)
+
+    def emit(self, record):
+        if isinstance(self.stream, str):
+            stream = getattr(sys, self.stream)
+        else:
+            stream = self.stream
+
+        kind = record['type']
+        if kind == 'log':
+            print(record['message'], file=stream)
+        elif kind == 'span':
+            print(f"[span] {record['name']}: {record['duration'] * 1000:.3f}ms", file=stream)
+        elif kind == 'count':
+            print(f"[count] {record['name']}: +{record['value']}", file=stream)
+
+
+class JsonLinesSink():
+    """
+    JsonLinesSink appends every record as a line of JSON to the file at the
+    given path, along with the time at which it was emitted and the ID of the
+    process that emitted it. The file is opened on the first record, so that
+    the sink can be sent to worker processes, which then append to the same
+    file.
+    """
+
+    def __init__(self, path, types=RECORD_TYPES):
+        self.path = path
+        self.types = frozenset(types)
+        self._file = None
+
+    def emit(self, record):
+        if self._file is None:
+            self._file = open(self.path, 'a', buffering=1)
+
+        record = dict(record, time=time.time(), pid=os.getpid())
+        self._file.write(json.dumps(record, default=str) + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+
+class MemorySink():
+    """
+    MemorySink collects records in a list in memory, e.g. for tests. Records
+    from worker processes are not collected.
+    """
+
+    def __init__(self, types=RECORD_TYPES):
+        self.types = frozenset(types)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def messages(self):
+        """ Get every log message, in order. """
+
+        return [record['message'] for record in self.records if record['type'] == 'log']
+
+    def spans(self, name=None):
+        """ Get the durations of every span (with the given name), in
+        order. """
+
+        return [record['duration'] for record in self.records
+                if record['type'] == 'span' and (name is None or record['name'] == name)]
+
+    def counters(self):
+        """ Get the total of every counter. """
+
+        totals = collections.Counter()
+        for record in self.records:
+            if record['type'] == 'count':
+                totals[record['name']] += record['value']
+
+        return dict(totals)
+
+
+def add_sink(sink):
+    """ Start sending records to a sink. """
+
+    set_sinks(_SINKS + [sink])
+
+
+def remove_sink(sink):
+    """ Stop sending records to a sink. """
+
+    set_sinks([s for s in _SINKS if s is not sink])
+
+
+def get_sinks():
+    """ Get every registered sink. """
+
+    return list(_SINKS)
+
+
+def set_sinks(sinks):
+    """ Replace every registered sink. This can be used as the initializer of
+    worker processes to give them the sinks of the parent process. """
+
+    global _WANTS_LOGS, _WANTS_SPANS, _WANTS_COUNTS
+    _SINKS[:] = sinks
+    _WANTS_LOGS = any('log' in sink.types for sink in _SINKS)
+    _WANTS_SPANS = any('span' in sink.types for sink in _SINKS)
+    _WANTS_COUNTS = any('count' in sink.types for sink in _SINKS)
+
+
+def _emit(record):
+    for sink in _SINKS:
+        if record['type'] in sink.types:
+            sink.emit(record)
+
 
 def set_logging(b):
+    """ Turn printing log messages to stdout on or off. """
+
     global ENABLE_LOGGING
     ENABLE_LOGGING = b
 
+    sinks = [sink for sink in _SINKS if not isinstance(sink, _StdoutLogSink)]
+    if b:
+        sinks.append(_StdoutLogSink())
+    set_sinks(sinks)
+
+
+def logging_enabled():
+    """ Whether any sink receives log messages. """
+
+    return _WANTS_LOGS
+
+
+def log(s, *args):
+    """ Log a message. If there are any args, the message is a format string
+    that is only formatted when a sink receives it, e.g.
+    log("Sample rate: {}", sample_rate). """
+
+    if not _WANTS_LOGS:
+        return
+
+    if args:
+        s = s.format(*args)
+    _emit({'type': 'log', 'message': s})
+
+
+def count(name, value=1):
+    """ Add value to the counter with the given name. """
+
+    if _WANTS_COUNTS:
+        _emit({'type': 'count', 'name': name, 'value': value})
+
+
+class _Span():
+    """ Context manager that times a stage of the analysis. """
+
+    __slots__ = ('name', 'fields', 'start')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        _emit(dict(self.fields, type='span', name=self.name, duration=duration))
+        return False
+
+
+class _NullSpan():
+    """ Context manager that does nothing, for when spans are disabled. """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **fields):
+    """ Time the enclosed block as a stage of the analysis with the given
+    name, e.g.
+        with span('fft'):
+            ...
+    Any fields are added to the record. """
+
+    if not _WANTS_SPANS:
+        return _NULL_SPAN
+
+    return _Span(name, fields)
+
+
+class _StdoutLogSink(TextSink):
+    """ The sink that set_logging() adds, which prints log messages to
+    stdout like log() always has. """
 
-def log(s):
-    if ENABLE_LOGGING:
-        print(s)
+    def __init__(self):
+        super().__init__('stdout', ('log',))
@@ -0,0 +1,81 @@
+import json
+from spectrum import *
+
+
+# Test that nothing is recorded without sinks, and that the log shim still
+# works.
+def test_disabled():
+    assert get_sinks() == []
+    assert not logging_enabled()
+    assert span('fft') is span('decode')
+
+    # Messages aren't formatted when nobody receives them.
+    log("{} {}", 1)
+
+    set_logging(True)
+    try:
+        assert logging_enabled()
+        assert len(get_sinks()) == 1
+    finally:
+        set_logging(False)
+    assert get_sinks() == []
+
+
+# Test collecting the records of an analysis.
+def test_MemorySink():
+    sink = MemorySink()
+    add_sink(sink)
+    try:
+        spectrum = Spectrum("samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav")
+        spectrum.get_fund_freq()
+        spectrum.get_harm_ratios()
+    finally:
+        remove_sink(sink)
+    assert get_sinks() == []
+
+    assert "\tSample rate: 44100" in sink.messages()
+    for name in ['fft', 'magnitudes', 'find_peaks', 'fund_freq', 'harm_ratios']:
+        assert len(sink.spans(name)) == 1
+        assert sink.spans(name)[0] >= 0
+
+    # The file is decoded and mixed down a block at a time.
+    num_blocks = -(-spectrum.num_samples // DEFAULT_BLOCK_SIZE)
+    for name in ['decode', 'downmix']:
+        assert len(sink.spans(name)) == num_blocks
+
+    counters = sink.counters()
+    assert counters['files'] == 1
+    assert counters['samples'] == spectrum.num_samples
+    assert counters['peaks'] > 0
+    assert counters['harmonics'] == len(spectrum.get_harm_ratios())
+
+    # A sink only receives the kinds of records it asks for.
+    sink = MemorySink(types=['count'])
+    add_sink(sink)
+    try:
+        with span('fft'):
+            log("message")
+            count('files', 2)
+    finally:
+        remove_sink(sink)
+    assert sink.records == [{'type': 'count', 'name': 'files', 'value': 2}]
+
+
+# Test writing records as JSON lines.
+def test_JsonLinesSink(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    sink = JsonLinesSink(str(path))
+    add_sink(sink)
+    try:
+        with span('fft', size=8):
+            count('peaks', 3)
+    finally:
+        remove_sink(sink)
+        sink.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record['type'] for record in records] == ['count', 'span']
+    assert records[0]['value'] == 3
+    assert records[1]['name'] == 'fft'
+    assert records[1]['size'] == 8
+    assert records[1]['pid'] == os.getpid()
@@ -1,23 +1,140 @@
 import argparse
+import itertools
 import os.path
-from spectrum import *
+import sys
+from manifest import *
+from output import *
 
 if __name__ == '__main__':
 
     # Parse the command-line arguments.
     parser = argparse.ArgumentParser(description="Analyze a tone from a WAV file.")
-    parser.add_argument('path', type=str, nargs='+', help="Paths to files to analyze")
+    parser.add_argument('path', type=str, nargs='+',
+                        help="Paths to files to analyze, or to directories whose WAV files are analyzed "
+                             "incrementally: only new or changed files are analyzed again on later runs")
     parser.add_argument('--min', dest='min_freq', type=int, default=150,
                         help="Minimum fundamental frequency")
+    parser.add_argument('--max', dest='max_freq', type=int,
+                        help="Maximum frequency to analyze. The signal is filtered and decimated to it before the "
+                             "transform, which is faster and uses less memory")
+    parser.add_argument('--segment', dest='segment', action='store_true',
+                        help="Only analyze the sustained, non-silent part of each file")
+    parser.add_argument('--channel', dest='channel', type=str, default='mix',
+                        help="Channel to analyze: a mix of every channel (mix), a single channel by index (from 0), "
+                             "or every channel separately (each)")
+    parser.add_argument('--method', dest='method', choices=FUND_FREQ_METHODS, default='pairwise',
+                        help="Method used to find the fundamental frequency")
+    parser.add_argument('--detector', dest='detector', choices=DETECTOR_NAMES, default='harmonic',
+                        help="Detector used to find the fundamental frequency: harmonics in the spectrum (with "
+                             "--method) or YIN on short windows of the signal, for monophonic material")
+    parser.add_argument('--fft-size', dest='fft_size', choices=FFT_SIZES, default='exact',
+                        help="Transform every sample exactly, or pad or trim each file to a length that can be "
+                             "transformed quickly")
+    parser.add_argument('--fft-workers', dest='fft_workers', type=int,
+                        help="Number of threads for each transform (default: every CPU for large files)")
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help="Number of files to analyze in parallel")
+    parser.add_argument('--order', dest='order', choices=['input', 'completion'], default='input',
+                        help="Print results in input order or as soon as each file is done")
+    parser.add_argument('--cache', dest='cache', action=argparse.BooleanOptionalAction, default=None,
+                        help="Reuse spectra and results saved by earlier runs")
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help="Directory of the cache (implies --cache)")
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                        help="Maximum size of the cache in MB")
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS, default='text',
+                        help="Format of the results, written as each file is done (npz is written in chunks of "
+                             f"{DEFAULT_NPZ_CHUNK_SIZE} files, see output.read_npz)")
+    parser.add_argument('--manifest', dest='manifest', type=str,
+                        help=f"File that remembers the files and results of a directory between runs (default: "
+                             f"{MANIFEST_NAME} in the directory)")
+    parser.add_argument('-o', '--output', dest='output', type=str, default='-',
+                        help="File to write the results to (default: stdout)")
     parser.add_argument('-v', dest='logging_enabled', action='store_true',
                         help="Enable verbose logging")
+    parser.add_argument('--trace', dest='trace', type=str,
+                        help="Append the timing of each analysis stage and counters to this file as JSON lines "
+                             "(or print them to stderr with -)")
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.max_freq is not None and args.max_freq <= args.min_freq:
+        parser.error("--max must be above --min")
+    if args.fft_workers is not None and args.fft_workers < 1:
+        parser.error("--fft-workers must be at least 1")
+    fft_backend = get_fft_backend(args.fft_size, args.fft_workers)
+
+    files = [path for path in args.path if not os.path.isdir(path)]
+    directories = [path for path in args.path if os.path.isdir(path)]
+    if args.manifest is not None and len(directories) != 1:
+        parser.error("--manifest needs exactly one directory")
+
+    channel = None
+    if args.channel == 'each':
+        channel = 'each'
+    elif args.channel != 'mix':
+        if not args.channel.isdigit():
+            parser.error("--channel must be mix, each or a channel index")
+        channel = int(args.channel)
+
+    detector = None
+    if args.detector != 'harmonic':
+        detector = make_detector(args.detector, min_freq=args.min_freq)
+
+    # Pointing at a cache directory turns the cache on, unless it was
+    # explicitly turned off.
+    cache = None
+    if args.cache or (args.cache is None and args.cache_dir != DEFAULT_CACHE_DIR):
+        cache = SpectrumCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
     set_logging(args.logging_enabled)
+    if args.trace == '-':
+        add_sink(TextSink('stderr', ('span', 'count')))
+    elif args.trace:
+        add_sink(JsonLinesSink(args.trace))
+
+    # Open the output. Every format but npz is text. An npz file is opened
+    # for reading too, so that it can be completed after every chunk.
+    binary = args.output_format == 'npz'
+    if args.output == '-':
+        stream = sys.stdout.buffer if binary else sys.stdout
+    else:
+        stream = open(args.output, 'w+b' if binary else 'w', newline=None if binary else '')
+
+    # Report files that couldn't be analyzed, but keep going with the rest of
+    # the batch. Every result is written as soon as it's ready, and the output
+    # is closed even if the batch is interrupted, so that nothing that was
+    # already analyzed is lost.
+    # The files are analyzed first, and then each directory. Closing the
+    # directories' generators saves their manifests.
+    options = dict(fft_backend=fft_backend, max_freq=args.max_freq, segment=args.segment, channel=channel)
+    sources = [analyze_directory(directory, args.manifest, args.min_freq, args.jobs, args.order == 'input', cache,
+                                 args.method, detector, **options)
+               for directory in directories]
+    if files:
+        sources.insert(0, analyze_paths(files, args.min_freq, args.jobs, args.order == 'input', cache, args.method,
+                                        detector, **options))
+
+    failed = False
+    writer = make_writer(args.output_format, stream)
+    try:
+        for result in itertools.chain(*sources):
+            if result.error is not None:
+                if args.output_format != 'text':
+                    path = result.path if result.channel is None else f"{result.path}#{result.channel}"
+                    print(f"{path}: {result.error}", file=sys.stderr)
+                failed = True
 
-    for path in args.path:
-        if not os.path.exists(path):
-            raise FileExistsError(f'"{path}" is not a readable file')
+            writer.write(result)
+    finally:
+        for source in sources:
+            source.close()
+        writer.close()
+        if args.output != '-':
+            stream.close()
 
-        spectrum = Spectrum(path)
-        print(path, spectrum.get_fund_freq(), spectrum.get_harm_ratios())
+    if failed:
+        sys.exit(1)
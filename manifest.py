@@ -0,0 +1,228 @@
+import json
+import os
+import tempfile
+from batch import *
+
+# Name of the manifest file that analyze_directory keeps in a directory by
+# default. It starts with a dot so that it stays out of the way of the
+# samples.
+MANIFEST_NAME = '.pitch_finder_manifest.json'
+
+# Version of the layout of manifests. Changing it makes every file in a
+# directory be analyzed again.
+_MANIFEST_VERSION = 1
+
+
+def find_wav_files(directory):
+    """ Find every WAV file in a directory tree. Returns their paths relative
+    to the directory, in sorted order. """
+
+    paths = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in names:
+            if name.lower().endswith('.wav'):
+                paths.append(os.path.relpath(os.path.join(root, name), directory))
+
+    return sorted(paths)
+
+
+def get_params(min_freq, method, detector, options):
+    """ Describe the settings of an analysis as plain values, so that a
+    manifest can tell whether its results were computed the same way. Only
+    the length mode of an FFT backend changes its results, not its number of
+    threads. """
+
+    def describe(value):
+        if isinstance(value, FFTBackend):
+            return value.size_mode
+        return str(value)
+
+    params = dict(options, min_freq=min_freq, method=method)
+    if detector is not None:
+        params['detector'] = dict(vars(detector), name=detector.name)
+
+    return json.loads(json.dumps(params, sort_keys=True, default=describe))
+
+
+class Manifest():
+    """
+    Manifest remembers the files of a directory that were analyzed, with their
+    size, modification time, content hash and results, in a JSON file at the
+    given path. The results are only valid for the analysis settings in
+    params (see get_params). Call save() to write any changes back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.params = None
+        self.files = {}
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == _MANIFEST_VERSION:
+                self.params = data['params']
+                self.files = data['files']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            # A damaged manifest is treated like a missing one.
+            log('Ignoring unreadable manifest "{}": {}', path, e)
+
+    def is_unchanged(self, path, name):
+        """ Whether the file at path is unchanged since it was analyzed as
+        name (its path relative to the directory) and all of its results
+        succeeded. A file whose size and modification time haven't changed
+        is assumed to be unchanged. If only the modification time changed
+        (e.g. the file was copied or touched), the contents are hashed to
+        find out. A file that can't be read anymore (e.g. it was just
+        deleted) counts as changed. """
+
+        entry = self.files.get(name)
+        if entry is None or any(result['error'] is not None for result in entry['results']):
+            return False
+
+        try:
+            st = os.stat(path)
+            if st.st_size != entry['size']:
+                return False
+            if st.st_mtime_ns == entry['mtime_ns']:
+                return True
+
+            if hash_file(path) != entry['hash']:
+                return False
+        except OSError:
+            return False
+
+        entry['mtime_ns'] = st.st_mtime_ns
+        return True
+
+    def get_results(self, path, name):
+        """ Get the Results stored for a file, with the given path. """
+
+        return [Result(path, r['fund_freq'], None if r['harm_ratios'] is None else np.array(r['harm_ratios']),
+                       r['error'], r['sample_rate'], None if r['freq_step'] is None else Decimal(r['freq_step']),
+                       r['channel'])
+                for r in self.files[name]['results']]
+
+    def snapshot(self, path):
+        """ Get the size, modification time and content hash of the file at
+        path, to record with its results once it's analyzed (see start).
+        Returns None if the file can't be read. """
+
+        try:
+            st = os.stat(path)
+            return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': hash_file(path)}
+        except OSError:
+            return None
+
+    def start(self, name, snapshot):
+        """ Start a new entry for a file that was analyzed, replacing any old
+        one, from the snapshot that was taken before it was analyzed. Returns
+        it, so that add_result can fill it in. """
+
+        entry = dict(snapshot, results=[])
+        self.files[name] = entry
+        return entry
+
+    def add_result(self, entry, result):
+        """ Add a Result to an entry from start(). """
+
+        entry['results'].append({
+            'fund_freq': result.fund_freq,
+            'harm_ratios': None if result.harm_ratios is None else result.harm_ratios.tolist(),
+            'error': result.error,
+            'sample_rate': result.sample_rate,
+            'freq_step': None if result.freq_step is None else str(result.freq_step),
+            'channel': result.channel,
+        })
+
+    def save(self):
+        """ Write the manifest to its file. """
+
+        data = {'version': _MANIFEST_VERSION, 'params': self.params, 'files': self.files}
+
+        # Write to a temporary file first, so that an interrupted run never
+        # leaves a partial manifest behind.
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def analyze_directory(directory, manifest_path=None, min_freq=150, jobs=1, ordered=True, cache=None,
+                      method='pairwise', detector=None, **options):
+    """ Analyze every WAV file in a directory tree, reusing the results of
+    files that haven't changed since the last run. The results are kept in a
+    Manifest at manifest_path (MANIFEST_NAME in the directory by default):
+    new and changed files (and files that failed) are analyzed and added to
+    it, and files that were deleted are dropped from it. Changing any of the
+    analysis settings makes every file be analyzed again.
+
+    This is a generator that yields a Result for every file (or every
+    channel, see analyze_paths): first the stored results of the unchanged
+    files, in sorted order, and then those of the others as they're
+    analyzed. See analyze_paths for the other arguments. The manifest is
+    saved even if the run is interrupted, with every file that was done. """
+
+    if manifest_path is None:
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+
+    manifest = Manifest(manifest_path)
+    params = get_params(min_freq, method, detector, options)
+    if manifest.params != params:
+        if manifest.files:
+            log('Analysis settings changed, analyzing every file in "{}" again', directory)
+        manifest.params = params
+        manifest.files = {}
+
+    names = find_wav_files(directory)
+    deleted = manifest.files.keys() - set(names)
+    for name in deleted:
+        del manifest.files[name]
+
+    paths = {os.path.join(directory, name): name for name in names}
+    unchanged = [path for path, name in paths.items() if manifest.is_unchanged(path, name)]
+    changed = sorted(paths.keys() - set(unchanged))
+    log('Directory "{}": {} unchanged, {} new or changed, {} deleted', directory, len(unchanged), len(changed),
+        len(deleted))
+
+    # Every file is described before it's analyzed, so that one that
+    # changes during its analysis doesn't look like it matches its results,
+    # and is analyzed again next time.
+    snapshots = {path: manifest.snapshot(path) for path in changed}
+
+    # A file only stays in the manifest once every one of its results is in,
+    # so that a run that's interrupted halfway through a file analyzes it
+    # again next time.
+    entries = {}
+    remaining = {}
+    try:
+        for path in unchanged:
+            yield from manifest.get_results(path, paths[path])
+
+        for result in analyze_paths(changed, min_freq, jobs, ordered, cache, method, detector, **options):
+            path = result.path
+            if path not in entries:
+                # A file that was deleted in the meantime is left out.
+                entries[path] = None
+                if snapshots[path] is not None:
+                    entries[path] = manifest.start(paths[path], snapshots[path])
+                    remaining[path] = len(get_channels(path, options.get('channel')))
+
+            if entries[path] is not None:
+                manifest.add_result(entries[path], result)
+                remaining[path] -= 1
+
+            yield result
+    finally:
+        for path, left in remaining.items():
+            if left > 0:
+                del manifest.files[paths[path]]
+        manifest.save()
@@ -0,0 +1,147 @@
+import shutil
+from manifest import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+]
+
+
+# Copy the test files into a directory tree.
+def make_library(directory):
+    os.makedirs(directory / 'sub')
+    shutil.copy(testPaths[0], directory / 'a.wav')
+    shutil.copy(testPaths[1], directory / 'sub' / 'b.WAV')
+    shutil.copy(testPaths[2], directory / 'sub' / 'c.wav')
+    (directory / 'notes.txt').write_text('not a sample')
+
+
+# Analyze a directory and return its results by path, along with the number
+# of files that were actually analyzed.
+def run(directory, **options):
+    sink = MemorySink(types=['count'])
+    add_sink(sink)
+    try:
+        results = list(analyze_directory(str(directory), **options))
+    finally:
+        remove_sink(sink)
+
+    return {result.path: result for result in results}, sink.counters().get('files', 0)
+
+
+# Test finding WAV files in a directory tree.
+def test_find_wav_files(tmp_path):
+    make_library(tmp_path)
+    assert find_wav_files(str(tmp_path)) == ['a.wav', os.path.join('sub', 'b.WAV'), os.path.join('sub', 'c.wav')]
+
+
+# Test that only new and changed files are analyzed again.
+def test_analyze_directory(tmp_path):
+    make_library(tmp_path)
+    a = str(tmp_path / 'a.wav')
+    b = str(tmp_path / 'sub' / 'b.WAV')
+    c = str(tmp_path / 'sub' / 'c.wav')
+
+    want, analyzed = run(tmp_path)
+    assert analyzed == 3
+    assert sorted(want) == [a, b, c]
+    assert str(freq_to_note(want[a].fund_freq)) == 'A4'
+    assert os.path.exists(tmp_path / MANIFEST_NAME)
+
+    # Nothing changed, so the results come from the manifest.
+    results, analyzed = run(tmp_path)
+    assert analyzed == 0
+    for path, result in results.items():
+        assert result.fund_freq == want[path].fund_freq
+        assert np.array_equal(result.harm_ratios, want[path].harm_ratios)
+        assert result.freq_step == want[path].freq_step
+        assert result.sample_rate == want[path].sample_rate
+
+    # Touching a file only makes it be hashed. Changing, adding or deleting
+    # one makes it be analyzed again (or dropped).
+    os.utime(a, ns=(0, 0))
+    shutil.copy(testPaths[0], c)
+    shutil.copy(testPaths[1], tmp_path / 'd.wav')
+    os.remove(b)
+    results, analyzed = run(tmp_path)
+    assert analyzed == 2
+    assert sorted(results) == [a, str(tmp_path / 'd.wav'), c]
+    assert str(freq_to_note(results[c].fund_freq)) == 'A4'
+
+    manifest = Manifest(str(tmp_path / MANIFEST_NAME))
+    assert sorted(manifest.files) == ['a.wav', 'd.wav', os.path.join('sub', 'c.wav')]
+    assert manifest.files['a.wav']['mtime_ns'] == 0
+
+    # Other settings invalidate every result.
+    results, analyzed = run(tmp_path, method='hps')
+    assert analyzed == 3
+    _, analyzed = run(tmp_path, method='hps')
+    assert analyzed == 0
+
+
+# Test that failures are analyzed again, and that a damaged manifest is
+# ignored.
+def test_analyze_directory_errors(tmp_path):
+    make_library(tmp_path)
+    bogus = tmp_path / 'bogus.wav'
+    bogus.write_bytes(b'not a wav file')
+
+    results, analyzed = run(tmp_path)
+    assert analyzed == 4
+    assert results[str(bogus)].error.startswith('ValueError')
+    results, analyzed = run(tmp_path)
+    assert analyzed == 1
+    assert results[str(bogus)].error.startswith('ValueError')
+
+    bogus.unlink()
+    (tmp_path / MANIFEST_NAME).write_text('{"version": ')
+    _, analyzed = run(tmp_path)
+    assert analyzed == 3
+
+    # Every channel of a file is stored.
+    manifest_path = str(tmp_path / 'manifest.json')
+    results = list(analyze_directory(str(tmp_path), manifest_path, channel='each'))
+    assert len(results) == 6
+    results = list(analyze_directory(str(tmp_path), manifest_path, channel='each'))
+    assert sorted((result.path, result.channel) for result in results) == [
+        (str(tmp_path / name), channel)
+        for name in ['a.wav', os.path.join('sub', 'b.WAV'), os.path.join('sub', 'c.wav')] for channel in [0, 1]
+    ]
+
+
+# Test that a file deleted after the directory was listed counts as changed,
+# and that a file that changes while it's analyzed is analyzed again.
+def test_analyze_directory_races(tmp_path, monkeypatch):
+    make_library(tmp_path)
+    a = str(tmp_path / 'a.wav')
+    run(tmp_path)
+
+    listed = find_wav_files(str(tmp_path))
+    os.remove(a)
+    monkeypatch.setattr('manifest.find_wav_files', lambda directory: listed)
+    results, analyzed = run(tmp_path)
+    assert analyzed == 0
+    assert results[a].error.startswith('FileExistsError')
+    monkeypatch.undo()
+
+    # The file is overwritten with another sample after it's been
+    # described, but before its result comes in.
+    shutil.copy(testPaths[2], a)
+    analyze = analyze_paths
+
+    def analyze_and_change(paths, *args, **options):
+        for result in analyze(paths, *args, **options):
+            if result.path == a:
+                shutil.copy(testPaths[1], a)
+            yield result
+
+    monkeypatch.setattr('manifest.analyze_paths', analyze_and_change)
+    results, analyzed = run(tmp_path)
+    assert analyzed == 1
+    assert str(freq_to_note(results[a].fund_freq)) == 'G3'
+    monkeypatch.undo()
+
+    results, analyzed = run(tmp_path)
+    assert analyzed == 1
+    assert str(freq_to_note(results[a].fund_freq)) == 'D♯5'
@@ -25,8 +25,12 @@ class Note():
         - freq: frequency of note
     The string representation of Note puts the "note" and "octave" fields
     together, e.g. B♯ in the 6th octave becomes 'B♯6'.
+    Notes are immutable, and two notes are equal if they have the same note
+    and octave.
     """
 
+    __slots__ = ('note', 'octave', 'freq')
+
     def __init__(self, note, octave):
         # Validate the note.
         result = re.fullmatch(NOTE_REGEX, note)
@@ -62,9 +66,26 @@ class Note():
         # floating-point arithmetic and accurate precision.)
         freq = FREQ_TABLE[note][octave]
 
-        self.note = note
-        self.octave = octave
-        self.freq = freq
+        object.__setattr__(self, 'note', note)
+        object.__setattr__(self, 'octave', octave)
+        object.__setattr__(self, 'freq', freq)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Note objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Note objects are immutable")
+
+    def __reduce__(self):
+        return (Note, (self.note, self.octave))
+
+    def __eq__(self, other):
+        if not isinstance(other, Note):
+            return NotImplemented
+        return self.note == other.note and self.octave == other.octave
+
+    def __hash__(self):
+        return hash((self.note, self.octave))
 
     def __str__(self):
         if not hasattr(self, 'note'):
@@ -100,7 +121,7 @@ class Note():
         returned list of notes does not include this note. The notes are ordered
         from lowest to highest. """
 
-        return [Note(self.note, octave) for octave in range(self.octave+1, 11)]
+        return [FREQ_TO_NOTE[FREQ_TABLE[self.note][octave]] for octave in range(self.octave+1, 11)]
 
 
 def parse_note(s):
@@ -127,15 +148,18 @@ def parse_note(s):
 
 
 def freq_to_note(freq):
-    """ Return the standard note (on a 12-note scale) closest to the frequency. """
+    """ Return the standard note (on a 12-note scale) closest to the frequency.
+    The same Note object is returned every time for the same note. """
 
-    # Make sure we're using a normalized frequency.
-    freq = standardize_freq(freq)
+    # Make sure we're using a normalized frequency, and then look up its note.
+    return FREQ_TO_NOTE[standardize_freq(freq)]
 
-    # Find the note for this frequency.
-    for note, freqs in FREQ_TABLE.items():
-        for octave, table_freq in enumerate(freqs):
-            if table_freq == freq:
-                return Note(note, octave)
 
-    raise ValueError(f"Did not find note for frequency: {freq}")
+# Reverse index from every frequency in FREQ_TABLE to its note. There are only
+# 132 possible notes, so we create each one once here and share it instead of
+# building a new Note (and validating it again) for every lookup.
+FREQ_TO_NOTE = {
+    freq: Note(note, octave)
+    for note, freqs in FREQ_TABLE.items()
+    for octave, freq in enumerate(freqs)
+}
@@ -1,3 +1,4 @@
+import pickle
 import pytest
 from note import *
 
@@ -428,3 +429,40 @@ def test_freq_to_note():
             assert note.freq == want_freq
             assert str(note.freq) == str(want_freq)
             assert str(note) == f'{want_note}{want_octave}'
+
+
+# Test that Note objects are immutable values.
+def test_Note_immutable():
+    note = Note('C', 4)
+    with pytest.raises(AttributeError):
+        note.octave = 5
+    with pytest.raises(AttributeError):
+        note.bogus = 5
+    with pytest.raises(AttributeError):
+        del note.note
+    assert str(note) == 'C4'
+
+    assert note == Note('C', 4)
+    assert note == parse_note('C4')
+    assert note != Note('C', 5)
+    assert note != Note('C♯', 4)
+    assert note != 'C4'
+    assert hash(note) == hash(Note('C', 4))
+    assert pickle.loads(pickle.dumps(note)) == note
+
+
+# Test the reverse index of frequencies to notes.
+def test_FREQ_TO_NOTE():
+    assert len(FREQ_TO_NOTE) == 132
+    for want_note, want_freqs in FREQ_TABLE.items():
+        for want_octave, want_freq in enumerate(want_freqs):
+            note = FREQ_TO_NOTE[want_freq]
+            assert note == Note(want_note, want_octave)
+            assert note.freq == want_freq
+
+            # The same object is returned for every lookup.
+            assert freq_to_note(want_freq) is note
+            if want_octave < 10:
+                assert freq_to_note(float(want_freq) * 1.01) is note
+            else:
+                assert freq_to_note(float(want_freq) * 0.99) is note
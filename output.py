@@ -0,0 +1,255 @@
+import csv
+import json
+import math
+import sys
+import zipfile
+from batch import *
+
+# Formats in which the results of a batch can be written.
+OUTPUT_FORMATS = ('text', 'jsonl', 'csv', 'npz')
+
+# Columns of the CSV format. The harmonic ratios are written to a single
+# column, separated by spaces, since every file can have a different number of
+# them.
+CSV_FIELDS = ['path', 'channel', 'fund_freq', 'note', 'cents', 'sample_rate', 'freq_step', 'harm_ratios', 'error']
+
+# Columns of the npz format (see NpzWriter).
+NPZ_COLUMNS = ['path', 'fund_freq', 'note', 'cents', 'sample_rate', 'channel', 'freq_step', 'error', 'harm_ratios',
+               'harm_ratio_offsets']
+
+# Number of results in every chunk of the npz format. The writer holds one
+# chunk in memory, and a killed batch loses at most one.
+DEFAULT_NPZ_CHUNK_SIZE = 1000
+
+
+def describe_pitch(fund_freq):
+    """ Get the name of the closest standard note to a fundamental frequency
+    and its deviation from that note in cents. Both are None if the frequency
+    is out of range. """
+
+    try:
+        note = freq_to_note(fund_freq)
+    except ValueError:
+        return None, None
+
+    return str(note), 1200 * math.log2(fund_freq / float(note.freq))
+
+
+def to_record(result):
+    """ Convert a Result into a dict of plain values that can be written as
+    JSON. Results that failed have None for everything but the path, the
+    channel and the error. """
+
+    if result.error is not None:
+        return {
+            'path': result.path,
+            'channel': result.channel,
+            'fund_freq': None,
+            'note': None,
+            'cents': None,
+            'sample_rate': None,
+            'freq_step': None,
+            'harm_ratios': None,
+            'error': result.error,
+        }
+
+    note, cents = describe_pitch(result.fund_freq)
+    return {
+        'path': result.path,
+        'channel': result.channel,
+        'fund_freq': result.fund_freq,
+        'note': note,
+        'cents': cents,
+        'sample_rate': result.sample_rate,
+        'freq_step': float(result.freq_step),
+        'harm_ratios': result.harm_ratios.tolist(),
+        'error': None,
+    }
+
+
+class TextWriter():
+    """
+    TextWriter prints each result as its path, fundamental frequency and list
+    of harmonic ratios. The path of a single channel is followed by #channel.
+    Failures are reported on stderr.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result):
+        path = result.path
+        if result.channel is not None:
+            path = f"{path}#{result.channel}"
+
+        if result.error is not None:
+            print(f"{path}: {result.error}", file=sys.stderr)
+            return
+
+        print(path, result.fund_freq, result.harm_ratios.tolist(), file=self.stream, flush=True)
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter():
+    """
+    JsonLinesWriter writes each result as a line of JSON (see to_record).
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result):
+        self.stream.write(json.dumps(to_record(result), ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class CsvWriter():
+    """
+    CsvWriter writes each result as a row of CSV with the columns in
+    CSV_FIELDS, after a header row. Missing values are empty.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, CSV_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, result):
+        record = to_record(result)
+        if record['harm_ratios'] is not None:
+            record['harm_ratios'] = ' '.join(repr(ratio) for ratio in record['harm_ratios'])
+
+        self.writer.writerow(record)
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class NpzWriter():
+    """
+    NpzWriter saves the results as columns of an .npz file, chunk_size results
+    at a time, so that only one chunk of results is ever held in memory.
+    Every chunk is a set of arrays named chunk<n>/<column> (see read_npz to
+    load them back as single columns), with one element per file in each of:
+        - path, note, error: str ('' if missing)
+        - fund_freq, cents, freq_step: float64 (NaN if missing)
+        - sample_rate: int64 (0 if missing)
+        - channel: int64 (-1 for a mix of every channel)
+    The harmonic ratios of every file in a chunk are concatenated into a
+    single float64 array, harm_ratios, and the ratios of file i of the chunk
+    are harm_ratios[harm_ratio_offsets[i]:harm_ratio_offsets[i+1]].
+
+    If the stream can be read and seeked (like a file opened with 'w+b'), the
+    archive is completed after every chunk, so a batch that is killed only
+    loses the chunk in progress. Otherwise (e.g. a pipe), the archive is only
+    complete once the writer is closed.
+    """
+
+    def __init__(self, stream, chunk_size=DEFAULT_NPZ_CHUNK_SIZE):
+        if chunk_size <= 0:
+            raise ValueError("The chunk size must be positive")
+
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.records = []
+        self.num_chunks = 0
+        self._checkpoint = stream.seekable() and stream.readable()
+        self._zip = None
+
+    def write(self, result):
+        self.records.append(to_record(result))
+        if len(self.records) == self.chunk_size:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        records = self.records
+
+        def column(name, dtype, missing):
+            values = [missing if record[name] is None else record[name] for record in records]
+            return np.array(values, dtype=dtype)
+
+        ratios = [record['harm_ratios'] or [] for record in records]
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in ratios], out=offsets[1:])
+
+        columns = {
+            'path': column('path', str, ''),
+            'fund_freq': column('fund_freq', np.float64, np.nan),
+            'note': column('note', str, ''),
+            'cents': column('cents', np.float64, np.nan),
+            'sample_rate': column('sample_rate', np.int64, 0),
+            'channel': column('channel', np.int64, -1),
+            'freq_step': column('freq_step', np.float64, np.nan),
+            'error': column('error', str, ''),
+            'harm_ratios': np.array([ratio for r in ratios for ratio in r], dtype=np.float64),
+            'harm_ratio_offsets': offsets,
+        }
+
+        # A checkpointed archive is reopened for every chunk, which appends
+        # the chunk and writes a new directory of the archive after it.
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.stream, 'a' if self.num_chunks > 0 else 'w', allowZip64=True)
+        for name, values in columns.items():
+            with self._zip.open(f'chunk{self.num_chunks}/{name}.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, values, allow_pickle=False)
+        if self._checkpoint:
+            self._zip.close()
+            self._zip = None
+
+        self.num_chunks += 1
+        self.records = []
+        self.stream.flush()
+
+    def close(self):
+        # There is always at least one chunk, so that every column exists.
+        if self.records or self.num_chunks == 0:
+            self._write_chunk()
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        self.stream.flush()
+
+
+def read_npz(file):
+    """ Load the results saved by NpzWriter from a path or binary stream, as
+    a dict of single columns that hold every chunk in order. The harmonic
+    ratio offsets index the single harm_ratios array. """
+
+    with np.load(file, allow_pickle=False) as data:
+        chunks = sorted({int(name.split('/')[0][len('chunk'):]) for name in data.files})
+        columns = {}
+        for name in NPZ_COLUMNS:
+            parts = [data[f'chunk{chunk}/{name}'] for chunk in chunks]
+            if name == 'harm_ratio_offsets':
+                # Every chunk's offsets start at 0, so they're shifted past
+                # the ratios of the chunks before it.
+                starts = np.cumsum([0] + [part[-1] for part in parts[:-1]])
+                parts = [parts[0][:1]] + [part[1:] + start for part, start in zip(parts, starts)]
+            columns[name] = np.concatenate(parts)
+
+    return columns
+
+
+_WRITERS = {
+    'text': TextWriter,
+    'jsonl': JsonLinesWriter,
+    'csv': CsvWriter,
+    'npz': NpzWriter,
+}
+
+
+def make_writer(output_format, stream):
+    """ Create a writer for results in the given format (one of
+    OUTPUT_FORMATS). The npz format needs a binary stream, and the others need
+    a text stream. Call write() with each Result, and close() at the end. """
+
+    if output_format not in _WRITERS:
+        raise ValueError(f'Invalid output format: "{output_format}"')
+
+    return _WRITERS[output_format](stream)
@@ -0,0 +1,125 @@
+import pytest
+import io
+from output import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/bogus.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+]
+
+
+# Test describing the pitch of a fundamental frequency.
+def test_describe_pitch():
+    assert describe_pitch(440.0) == ('A4', 0.0)
+
+    note, cents = describe_pitch(442.3)
+    assert note == 'A4'
+    assert 9 < cents < 10
+
+    assert describe_pitch(0.0) == (None, None)
+
+
+# Test writing results in each format.
+def test_make_writer(tmp_path):
+    results = [analyze_path(path) for path in testPaths]
+
+    with pytest.raises(ValueError):
+        make_writer('xml', io.StringIO())
+
+    stream = io.StringIO()
+    writer = make_writer('jsonl', stream)
+    for result in results:
+        writer.write(result)
+    writer.close()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record['path'] for record in records] == testPaths
+    assert records[0]['note'] == 'A4'
+    assert records[0]['sample_rate'] == 44100
+    assert records[0]['freq_step'] == float(results[0].freq_step)
+    assert records[0]['harm_ratios'] == results[0].harm_ratios.tolist()
+    assert records[1]['fund_freq'] is None
+    assert records[1]['error'].startswith('FileExistsError')
+    assert records[2]['note'] == 'G3'
+
+    stream = io.StringIO()
+    writer = make_writer('csv', stream)
+    for result in results:
+        writer.write(result)
+    writer.close()
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+    assert [row['path'] for row in rows] == testPaths
+    assert float(rows[0]['fund_freq']) == results[0].fund_freq
+    assert [float(ratio) for ratio in rows[0]['harm_ratios'].split()] == results[0].harm_ratios.tolist()
+    assert rows[1]['fund_freq'] == ''
+    assert rows[2]['note'] == 'G3'
+
+    path = tmp_path / "results.npz"
+    with open(path, 'wb') as f:
+        writer = make_writer('npz', f)
+        for result in results:
+            writer.write(result)
+        writer.close()
+    data = read_npz(path)
+    assert data['path'].tolist() == testPaths
+    assert data['note'].tolist() == ['A4', '', 'G3']
+    assert np.isnan(data['fund_freq'][1])
+    assert data['sample_rate'].tolist() == [44100, 0, 44100]
+    offsets = data['harm_ratio_offsets']
+    assert len(offsets) == 4
+    for i in [0, 2]:
+        assert np.array_equal(data['harm_ratios'][offsets[i]:offsets[i+1]], results[i].harm_ratios)
+    assert offsets[1] == offsets[2]
+
+
+# Test that npz results are written in chunks, and that every chunk that's
+# done can be read even if the writer is never closed.
+def test_NpzWriter_chunks(tmp_path):
+    results = [analyze_path(path) for path in testPaths] * 3
+
+    path = tmp_path / "results.npz"
+    with open(path, 'w+b') as f:
+        writer = NpzWriter(f, chunk_size=2)
+        for result in results[:5]:
+            writer.write(result)
+        assert len(writer.records) == 1
+
+        # Without closing the writer, the first two chunks are there.
+        data = read_npz(str(path))
+        assert data['path'].tolist() == [result.path for result in results[:4]]
+
+        for result in results[5:]:
+            writer.write(result)
+        writer.close()
+
+    data = read_npz(path)
+    assert data['path'].tolist() == testPaths * 3
+    offsets = data['harm_ratio_offsets']
+    assert len(offsets) == len(results) + 1
+    for i, result in enumerate(results):
+        if result.error is None:
+            assert np.array_equal(data['harm_ratios'][offsets[i]:offsets[i+1]], result.harm_ratios)
+        else:
+            assert offsets[i] == offsets[i+1]
+
+    # A stream that can't be seeked only gets a whole archive when it's
+    # closed.
+    class Pipe(io.BytesIO):
+        def seekable(self):
+            return False
+
+    stream = Pipe()
+    writer = NpzWriter(stream, chunk_size=2)
+    for result in results:
+        writer.write(result)
+    writer.close()
+    assert read_npz(io.BytesIO(stream.getvalue()))['path'].tolist() == testPaths * 3
+
+    # An empty batch still has every column.
+    stream = io.BytesIO()
+    NpzWriter(stream).close()
+    stream.seek(0)
+    assert all(len(values) == 0 for name, values in read_npz(stream).items() if name != 'harm_ratio_offsets')
+
+    with pytest.raises(ValueError):
+        NpzWriter(io.BytesIO(), chunk_size=0)
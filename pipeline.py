@@ -0,0 +1,160 @@
+import asyncio
+import concurrent.futures
+from batch import *
+
+# Default number of files that are decoded ahead of the transforms.
+DEFAULT_PREFETCH = 4
+
+# Default amount of memory (in bytes) that the decoded signals waiting for
+# their transform can take up at once.
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024
+
+
+class MemoryBudget():
+    """
+    MemoryBudget keeps the memory taken up by decoded signals under a
+    limit. Reservations wait until enough of the others are released. A
+    signal that is larger than the whole limit is let through once nothing
+    else is reserved, so that it can't wait forever.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+    async def reserve(self, size):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+
+    async def release(self, size):
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+def _read(path, channel, options):
+    """ Open a lazy spectrum of a file, without decoding its samples yet. """
+
+    return Spectrum(path, lazy=True, channel=channel, **options)
+
+
+def _compute(spectrum, signal, min_freq, method, detector):
+    """ Transform a decoded signal and find its results. The spectrum is
+    released afterwards, so that only the Result stays in memory. """
+
+    spectrum.analyze_signal(signal)
+    del signal
+
+    result = get_result(spectrum, min_freq, method, detector,
+                         lambda: detector.detect_file(spectrum.path, spectrum.channel))
+    spectrum.release()
+    return result
+
+
+async def analyze_paths_async(paths, min_freq=150, method='pairwise', detector=None, prefetch=DEFAULT_PREFETCH,
+                              memory_limit=DEFAULT_MEMORY_LIMIT, io_workers=2, compute_workers=1, ordered=True,
+                              **options):
+    """ Analyze every WAV file in paths like analyze_paths, but overlap
+    reading the files with analyzing them. A pool of io_workers threads
+    decodes the files ahead of a pool of compute_workers threads that
+    transform them and find their fundamental frequency and harmonic ratios,
+    so that neither the disk nor the CPU sits idle waiting for the other.
+
+    At most prefetch decoded files wait for a transform, and their signals
+    take up at most memory_limit bytes (apart from a single file that is
+    larger than that on its own). This is an async generator that yields a
+    Result for each file (or channel, see analyze_paths), either in the same
+    order as paths or in the order in which the analyses complete. Errors are
+    stored in the results like analyze_path does. See analyze_path for the
+    other arguments. """
+
+    if prefetch < 1:
+        raise ValueError("The prefetch depth must be at least 1")
+    if memory_limit <= 0:
+        raise ValueError("The memory limit must be positive")
+    if io_workers < 1 or compute_workers < 1:
+        raise ValueError("The number of workers must be at least 1")
+
+    channel = options.pop('channel', None)
+    loop = asyncio.get_running_loop()
+    budget = MemoryBudget(memory_limit)
+    decoded = asyncio.Queue(prefetch)
+    done = asyncio.Queue()
+
+    io_pool = concurrent.futures.ThreadPoolExecutor(io_workers, thread_name_prefix='pitch-io')
+    compute_pool = concurrent.futures.ThreadPoolExecutor(compute_workers, thread_name_prefix='pitch-compute')
+
+    async def read_files(pending):
+        for index, path, c in pending:
+            try:
+                if not os.path.exists(path):
+                    raise FileExistsError(f'"{path}" is not a readable file')
+
+                spectrum = await loop.run_in_executor(io_pool, _read, path, c, options)
+                size = spectrum.num_analyzed * np.dtype(spectrum.dtype).itemsize
+                await budget.reserve(size)
+                try:
+                    signal = await loop.run_in_executor(io_pool, spectrum.read_signal)
+                except BaseException:
+                    await budget.release(size)
+                    raise
+            except Exception as e:
+                await done.put((index, Result(path, None, None, f"{type(e).__name__}: {e}", channel=c)))
+                continue
+
+            await decoded.put((index, spectrum, signal, size))
+
+    async def compute():
+        while True:
+            index, spectrum, signal, size = await decoded.get()
+            try:
+                result = await loop.run_in_executor(compute_pool, _compute, spectrum, signal, min_freq, method,
+                                                    detector)
+            except Exception as e:
+                result = Result(spectrum.path, None, None, f"{type(e).__name__}: {e}", channel=spectrum.channel)
+            finally:
+                del signal
+                await budget.release(size)
+
+            await done.put((index, result))
+
+    tasks = []
+    try:
+        # Every channel to analyze gets an index, so that the results can be
+        # put back in order. Listing every channel reads the header of each
+        # file, so it's done on the I/O threads as well.
+        jobs = []
+        for path in paths:
+            channels = [channel]
+            if channel == 'each':
+                channels = await loop.run_in_executor(io_pool, get_channels, path, channel)
+            for c in channels:
+                jobs.append((len(jobs), path, c))
+
+        # The readers share the same iterator, so that each job is read once.
+        pending = iter(jobs)
+        tasks += [asyncio.create_task(read_files(pending)) for _ in range(io_workers)]
+        tasks += [asyncio.create_task(compute()) for _ in range(compute_workers)]
+
+        # Results that come in ahead of their turn wait here when they're
+        # ordered. They're small, unlike the signals.
+        waiting = {}
+        next_index = 0
+        for _ in range(len(jobs)):
+            index, result = await done.get()
+            if not ordered:
+                yield result
+                continue
+
+            waiting[index] = result
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        io_pool.shutdown(wait=False, cancel_futures=True)
+        compute_pool.shutdown(wait=False, cancel_futures=True)
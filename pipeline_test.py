@@ -0,0 +1,78 @@
+import pytest
+from pipeline import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav",
+    "samples/mis/violin/bogus.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+]
+
+
+# Collect the results of analyze_paths_async.
+def run(paths, **options):
+    async def collect():
+        return [result async for result in analyze_paths_async(paths, **options)]
+
+    return asyncio.run(collect())
+
+
+# Test that the pipeline gives the same results as analyzing each file.
+def test_analyze_paths_async():
+    want = list(analyze_paths(testPaths))
+
+    results = run(testPaths)
+    assert [result.path for result in results] == testPaths
+    for result, expected in zip(results, want):
+        assert result.fund_freq == expected.fund_freq
+        assert np.array_equal(result.harm_ratios, expected.harm_ratios)
+        assert result.freq_step == expected.freq_step
+    assert results[2].error.startswith('FileExistsError')
+
+    # A tiny memory limit and prefetch depth let one file through at a time.
+    results = run(testPaths, prefetch=1, memory_limit=1, io_workers=3, compute_workers=2, ordered=False)
+    assert sorted(result.path for result in results) == sorted(testPaths)
+    for result in results:
+        expected = want[testPaths.index(result.path)]
+        assert result.fund_freq == expected.fund_freq
+
+    # Every channel and the detectors work like they do in analyze_paths.
+    results = run(testPaths[:2], channel='each', segment=True, detector=make_detector('yin'))
+    assert [(result.path, result.channel) for result in results] == [
+        (testPaths[0], 0), (testPaths[0], 1), (testPaths[1], 0), (testPaths[1], 1)]
+    assert all(str(freq_to_note(result.fund_freq)) == 'A4' for result in results[:2])
+
+    with pytest.raises(ValueError):
+        run(testPaths, prefetch=0)
+
+
+# Test that the memory budget holds reservations back until there's room.
+def test_MemoryBudget():
+    async def check():
+        budget = MemoryBudget(100)
+        await budget.reserve(60)
+        waiter = asyncio.create_task(budget.reserve(60))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await budget.release(60)
+        await waiter
+        assert budget.used == 60
+
+        # Reservations above the limit go through once nothing else is in use.
+        await budget.release(60)
+        await budget.reserve(1000)
+        assert budget.used == 1000
+
+    asyncio.run(check())
+
+
+# Test that stopping early shuts the pipeline down.
+def test_analyze_paths_async_close():
+    async def first():
+        results = analyze_paths_async(testPaths * 3, prefetch=1)
+        result = await results.__anext__()
+        await results.aclose()
+        return result
+
+    assert asyncio.run(first()).path == testPaths[0]
@@ -0,0 +1,223 @@
+import argparse
+import collections
+import sys
+import time
+from detector import *
+
+# A pitch update from a live stream. The timestamp is the position (in seconds)
+# of the end of the analyzed window in the stream. The latency is the time (in
+# seconds) from when the last sample of the window was read to when the update
+# was ready. If the update missed its deadline, missed is True. Windows that
+# were skipped to catch up with the stream have no fund_freq or note.
+Update = collections.namedtuple('Update', ['timestamp', 'fund_freq', 'note', 'latency', 'missed'])
+
+# numpy types of the supported raw PCM sample formats, and the value that a
+# full-scale sample has in each of them.
+SAMPLE_FORMATS = {
+    'int16': (np.dtype('<i2'), 32768.0),
+    'float32': (np.dtype('<f4'), 1.0),
+}
+
+# A read that takes at least this long (in seconds) waited for the stream,
+# instead of finding its samples already waiting.
+_BLOCKED_READ_TIME = 0.001
+
+
+class RingBuffer():
+    """
+    RingBuffer holds the most recent samples of a stream in a fixed amount of
+    memory. New samples overwrite the oldest ones.
+    """
+
+    def __init__(self, size, dtype=np.float32):
+        if size <= 0:
+            raise ValueError("The size of the buffer must be positive")
+
+        self.data = np.zeros(size, dtype=dtype)
+        self.pos = 0
+        self.count = 0
+
+    def write(self, samples):
+        """ Add samples to the buffer. """
+
+        size = len(self.data)
+        if len(samples) >= size:
+            samples = samples[-size:]
+
+        # Write up to the end of the buffer, and wrap around for the rest.
+        first = min(len(samples), size - self.pos)
+        self.data[self.pos:self.pos+first] = samples[:first]
+        self.data[:len(samples)-first] = samples[first:]
+
+        self.pos = (self.pos + len(samples)) % size
+        self.count = min(self.count + len(samples), size)
+
+    def latest(self, n):
+        """ Get a copy of the n most recent samples, oldest first. """
+
+        if n > self.count:
+            raise ValueError(f"Only {self.count} samples are available")
+
+        start = (self.pos - n) % len(self.data)
+        if start + n <= len(self.data):
+            return self.data[start:start+n].copy()
+        return np.concatenate((self.data[start:], self.data[:self.pos]))
+
+
+def _read_exactly(stream, size):
+    """ Read size bytes from a binary stream, waiting for more data until the
+    stream ends. Returns fewer bytes only at the end of the stream. """
+
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+
+    return bytes(data)
+
+
+def track_stream(stream, sample_rate=44100, channels=1, sample_format='int16', window_size=4096, hop_size=1024,
+                 latency=0.1, min_freq=150, method='pairwise', detector=None):
+    """ Track the pitch of a live stream of raw PCM data from a binary file
+    object (e.g. stdin or a FIFO). Every hop_size samples, the most recent
+    window_size samples are analyzed with a Spectrum, or with a detector from
+    make_detector if one is given. This is a generator that yields an Update
+    for every hop.
+
+    Each update must be ready within latency seconds of its last sample being
+    read. Updates that take longer are marked as missed. If the analysis falls
+    behind the stream by more than the latency, windows are skipped (and
+    reported as missed) until it catches up. """
+
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f'Invalid sample format: "{sample_format}"')
+    if channels <= 0:
+        raise ValueError("The number of channels must be positive")
+    if window_size <= 0 or hop_size <= 0 or hop_size > window_size:
+        raise ValueError("Window and hop sizes must be positive, and the hop cannot be larger than the window")
+    if latency <= 0:
+        raise ValueError("The latency must be positive")
+
+    dtype, full_scale = SAMPLE_FORMATS[sample_format]
+    frame_bytes = dtype.itemsize * channels
+    buffer = RingBuffer(window_size)
+
+    log("\nTracking pitch of live stream")
+    log("\tSample rate: {}, channels: {}, format: {}", sample_rate, channels, sample_format)
+    log("\tWindow size: {}, hop size: {}, latency: {}s", window_size, hop_size, latency)
+
+    position = 0
+    start = None
+    while True:
+        wait_start = time.monotonic()
+        data = _read_exactly(stream, hop_size * frame_bytes)
+        read_time = time.monotonic()
+
+        # Drop a trailing partial frame at the end of the stream.
+        data = data[:len(data) - len(data) % frame_bytes]
+        if not data:
+            break
+
+        # Convert the samples to a single normalized channel.
+        samples = np.frombuffer(data, dtype=dtype).reshape(-1, channels)
+        samples = samples.mean(axis=1, dtype=np.float32) / np.float32(full_scale)
+        buffer.write(samples)
+        position += len(samples)
+        timestamp = position / sample_rate
+
+        # The stream time starts when the first samples arrive. A read that
+        # had to wait for its samples got them as soon as they arrived, so
+        # nothing is waiting behind them: the stream time starts over from
+        # there. Otherwise a stall in the stream would count as a backlog for
+        # the rest of it.
+        if start is None or read_time - wait_start >= _BLOCKED_READ_TIME:
+            start = read_time - timestamp
+
+        if buffer.count < window_size:
+            continue
+
+        # If the stream is live, this window was complete at the stream time
+        # of its last sample. When the samples that are already waiting put
+        # us further behind than the latency allows, skip it so that we can
+        # catch up with the stream.
+        if read_time - start > timestamp + latency:
+            yield Update(timestamp, None, None, time.monotonic() - read_time, True)
+            continue
+
+        if detector is None:
+            spectrum = Spectrum.from_samples(buffer.latest(window_size), sample_rate, np.float32)
+            fund_freq = spectrum.get_fund_freq(min_freq, method)
+        else:
+            fund_freq = detector.detect(buffer.latest(window_size), sample_rate)
+        try:
+            note = freq_to_note(fund_freq)
+        except ValueError:
+            note = None
+
+        elapsed = time.monotonic() - read_time
+        yield Update(timestamp, fund_freq, note, elapsed, elapsed > latency)
+
+
+if __name__ == '__main__':
+
+    # Parse the command-line arguments.
+    parser = argparse.ArgumentParser(description="Track the pitch of a live stream of raw PCM data.")
+    parser.add_argument('path', type=str, nargs='?', default='-',
+                        help="Path to a file or FIFO to read from (default: stdin)")
+    parser.add_argument('--rate', dest='sample_rate', type=int, default=44100,
+                        help="Sample rate of the stream")
+    parser.add_argument('--channels', dest='channels', type=int, default=1,
+                        help="Number of interleaved channels in the stream")
+    parser.add_argument('--format', dest='sample_format', choices=list(SAMPLE_FORMATS), default='int16',
+                        help="Format of each sample")
+    parser.add_argument('--window', dest='window_size', type=int, default=4096,
+                        help="Number of samples in each analysis window")
+    parser.add_argument('--hop', dest='hop_size', type=int, default=1024,
+                        help="Number of samples between analyses")
+    parser.add_argument('--latency', dest='latency', type=float, default=100,
+                        help="Latency target for each update in milliseconds")
+    parser.add_argument('--min', dest='min_freq', type=int, default=150,
+                        help="Minimum fundamental frequency")
+    parser.add_argument('--method', dest='method', choices=FUND_FREQ_METHODS, default='pairwise',
+                        help="Method used to find the fundamental frequency")
+    parser.add_argument('--detector', dest='detector', choices=DETECTOR_NAMES, default='harmonic',
+                        help="Detector used to find the fundamental frequency (see main.py)")
+    parser.add_argument('-v', dest='logging_enabled', action='store_true',
+                        help="Enable verbose logging")
+    args = parser.parse_args()
+
+    set_logging(args.logging_enabled)
+
+    detector = None
+    if args.detector != 'harmonic':
+        detector = make_detector(args.detector, min_freq=args.min_freq)
+
+    if args.path == '-':
+        stream = sys.stdin.buffer
+    else:
+        stream = open(args.path, 'rb', buffering=0)
+
+    updates = 0
+    missed = 0
+    try:
+        for update in track_stream(stream, args.sample_rate, args.channels, args.sample_format, args.window_size,
+                                   args.hop_size, args.latency / 1000, args.min_freq, args.method, detector):
+            updates += 1
+            if update.missed:
+                missed += 1
+
+            line = f"{update.timestamp:.3f} {update.fund_freq} {update.note} {update.latency * 1000:.1f}ms"
+            if update.missed:
+                line += " MISSED"
+            print(line, flush=True)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    print(f"{updates} updates, {missed} missed the deadline", file=sys.stderr)
@@ -0,0 +1,122 @@
+import collections
+import io
+import pytest
+from scipy.io import wavfile
+from realtime import *
+
+testPath = "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav"
+
+
+# Test the RingBuffer class.
+def test_RingBuffer():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+    buffer = RingBuffer(5)
+    with pytest.raises(ValueError):
+        buffer.latest(1)
+
+    buffer.write(np.array([1, 2, 3]))
+    assert buffer.count == 3
+    assert buffer.latest(3).tolist() == [1, 2, 3]
+    assert buffer.latest(2).tolist() == [2, 3]
+    with pytest.raises(ValueError):
+        buffer.latest(4)
+
+    # Wrap around the end of the buffer.
+    buffer.write(np.array([4, 5, 6, 7]))
+    assert buffer.count == 5
+    assert buffer.latest(5).tolist() == [3, 4, 5, 6, 7]
+
+    # Write more than fits in the buffer.
+    buffer.write(np.arange(10, 22))
+    assert buffer.latest(5).tolist() == [17, 18, 19, 20, 21]
+
+
+# Test that invalid stream parameters are rejected.
+def test_track_stream_invalid():
+    with pytest.raises(ValueError):
+        next(track_stream(io.BytesIO(), sample_format='int8'))
+    with pytest.raises(ValueError):
+        next(track_stream(io.BytesIO(), channels=0))
+    with pytest.raises(ValueError):
+        next(track_stream(io.BytesIO(), window_size=1024, hop_size=2048))
+    with pytest.raises(ValueError):
+        next(track_stream(io.BytesIO(), latency=0))
+
+
+# Test tracking the pitch of a raw PCM stream.
+def test_track_stream():
+    sample_rate, wav_data = wavfile.read(testPath)
+
+    for sample_format, data in [('int16', wav_data), ('float32', (wav_data / 32768).astype('<f4'))]:
+        stream = io.BytesIO(data.tobytes())
+        updates = list(track_stream(stream, sample_rate, channels=2, sample_format=sample_format, latency=10))
+
+        # There is an update for every hop once the first window is full,
+        # including the partial hop at the end of the stream.
+        assert len(updates) == -(-(len(wav_data) - 4096) // 1024) + 1
+        assert updates[0].timestamp == pytest.approx(4096 / sample_rate)
+        assert updates[1].timestamp == pytest.approx(5120 / sample_rate)
+        assert updates[-1].timestamp == pytest.approx(len(wav_data) / sample_rate)
+
+        for update in updates:
+            assert not update.missed
+            assert 0 <= update.latency < 10
+
+        notes = collections.Counter(str(update.note) for update in updates)
+        assert notes.most_common(1)[0][0] == 'A4'
+
+    # YIN on the same stream finds the same note.
+    stream = io.BytesIO(wav_data.tobytes())
+    updates = list(track_stream(stream, sample_rate, channels=2, latency=10, detector=make_detector('yin')))
+    notes = collections.Counter(str(update.note) for update in updates)
+    assert notes.most_common(1)[0][0] == 'A4'
+
+
+# A stream that delivers its data at the pace of a live stream, and stalls
+# once for a while partway through.
+class PacedStream():
+    def __init__(self, data, byte_rate, stall_at, stall_time):
+        self.data = data
+        self.byte_rate = byte_rate
+        self.stall_at = stall_at
+        self.stall_time = stall_time
+        self.pos = 0
+        self.start = None
+
+    def due_time(self, pos):
+        stall = self.stall_time if pos > self.stall_at else 0
+        return self.start + pos / self.byte_rate + stall
+
+    def read(self, size):
+        if self.start is None:
+            self.start = time.monotonic()
+        if self.pos >= len(self.data):
+            return b''
+
+        # Wait for the next byte, then hand over everything that's due (the
+        # bytes after the stall only come once it's over).
+        time.sleep(max(self.due_time(self.pos + 1) - time.monotonic(), 0))
+        elapsed = time.monotonic() - self.start
+        if self.pos + 1 > self.stall_at:
+            elapsed -= self.stall_time
+        limit = min(self.pos + size, len(self.data))
+        if self.pos < self.stall_at:
+            limit = min(limit, self.stall_at)
+        end = min(max(int(elapsed * self.byte_rate), self.pos + 1), limit)
+        data = self.data[self.pos:end]
+        self.pos = end
+        return data
+
+
+# Test that a stall in a live stream doesn't make the updates after it count
+# as missed.
+def test_track_stream_stall():
+    sample_rate, wav_data = wavfile.read(testPath)
+    data = wav_data[:sample_rate].tobytes()
+    stream = PacedStream(data, sample_rate * 4, len(data) // 3, 0.3)
+
+    updates = list(track_stream(stream, sample_rate, channels=2, latency=0.1))
+    assert len(updates) == -(-(sample_rate - 4096) // 1024) + 1
+    assert sum(update.missed for update in updates) <= 1
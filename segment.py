@@ -0,0 +1,116 @@
+import numpy as np
+from log import *
+
+# Defaults for find_steady_segment. Levels are in dB relative to the loudest
+# frame.
+SEGMENT_FRAME_SIZE = 1024
+SILENCE_DB = -40.0
+SUSTAIN_DB = -12.0
+ATTACK_RISE_DB = 1.0
+MIN_SEGMENT_FRAMES = 8
+
+# Number of frames whose energy is computed at once, to bound the memory used
+# for memory-mapped files.
+_ENERGY_CHUNK_FRAMES = 256
+
+
+def frame_energies(wav_data, frame_size=SEGMENT_FRAME_SIZE):
+    """ Calculate the mean square of every frame of frame_size samples of WAV
+    data (with one column per channel for multichannel data), over all of its
+    channels. A partial frame at the end is dropped. The frames are processed
+    a chunk at a time, so memory-mapped data is never converted all at
+    once. """
+
+    chunk_size = _ENERGY_CHUNK_FRAMES * frame_size
+    chunks = (wav_data[start:start+chunk_size] for start in range(0, len(wav_data), chunk_size))
+
+    return block_energies(chunks, frame_size)
+
+
+def block_energies(blocks, frame_size=SEGMENT_FRAME_SIZE):
+    """ Calculate the mean square of every frame of frame_size samples of WAV
+    data that comes in consecutive blocks of any length (e.g. from a
+    WavReader), like frame_energies does. """
+
+    energies = []
+    leftover = None
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)
+        if leftover is not None:
+            block = np.concatenate((leftover, block))
+
+        num_frames = len(block) // frame_size
+        width = frame_size * (block.shape[1] if block.ndim > 1 else 1)
+        frames = block[:num_frames * frame_size].reshape(num_frames, width)
+        energies.append(np.mean(frames * frames, axis=1))
+        leftover = block[num_frames * frame_size:]
+
+    if not energies:
+        return np.empty(0)
+    return np.concatenate(energies)
+
+
+def find_steady_segment(wav_data, frame_size=SEGMENT_FRAME_SIZE, silence_db=SILENCE_DB, sustain_db=SUSTAIN_DB,
+                        attack_rise_db=ATTACK_RISE_DB, min_frames=MIN_SEGMENT_FRAMES):
+    """ Find the sustained, non-silent region of a recorded note in WAV data
+    (with one column per channel for multichannel data). Returns the start
+    and end (exclusive) of the region in samples.
+
+    The energy of every frame of frame_size samples is measured relative to
+    the loudest frame:
+        - frames quieter than silence_db are silence, and are cut from both
+          ends
+        - the sustain starts at the first frame that reaches sustain_db (the
+          onset) and ends after the last one (the offset), which drops the
+          quiet start of the attack and the release
+        - while the energy is still rising by more than attack_rise_db per
+          frame after the onset, the attack isn't over, so the sustain starts
+          later
+    If the sustain is shorter than min_frames, the whole non-silent region is
+    used instead, and if that's too short as well, the whole signal is. """
+
+    return find_steady_segment_from_energies(frame_energies(wav_data, frame_size), len(wav_data), frame_size,
+                                             silence_db, sustain_db, attack_rise_db, min_frames)
+
+
+def find_steady_segment_from_energies(energies, num_samples, frame_size=SEGMENT_FRAME_SIZE, silence_db=SILENCE_DB,
+                                      sustain_db=SUSTAIN_DB, attack_rise_db=ATTACK_RISE_DB,
+                                      min_frames=MIN_SEGMENT_FRAMES):
+    """ Find the steady segment of a signal with num_samples samples from the
+    energies of its frames (see frame_energies and block_energies), like
+    find_steady_segment does. """
+
+    whole = (0, num_samples)
+    if len(energies) < min_frames or energies.max() <= 0:
+        return whole
+
+    with np.errstate(divide='ignore'):
+        levels = 10 * np.log10(energies / energies.max())
+
+    # Cut the silence from both ends.
+    loud = np.nonzero(levels >= silence_db)[0]
+    gate_start, gate_end = int(loud[0]), int(loud[-1]) + 1
+
+    # Find the onset and offset of the sustain.
+    sustained = np.nonzero(levels[gate_start:gate_end] >= sustain_db)[0] + gate_start
+    onset, offset = int(sustained[0]), int(sustained[-1]) + 1
+
+    # Skip the rest of the attack.
+    rises = np.diff(levels[onset:offset])
+    settled = np.nonzero(rises <= attack_rise_db)[0]
+    if len(settled) > 0:
+        onset += int(settled[0])
+
+    if offset - onset >= min_frames:
+        start, end = onset, offset
+    elif gate_end - gate_start >= min_frames:
+        start, end = gate_start, gate_end
+    else:
+        return whole
+
+    # The last frame takes any partial frame at the end of the signal with
+    # it.
+    end_sample = end * frame_size if end < len(energies) else num_samples
+    log("\tSteady segment: samples {} to {} of {}", start * frame_size, end_sample, num_samples)
+
+    return start * frame_size, end_sample
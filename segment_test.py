@@ -0,0 +1,40 @@
+from segment import *
+
+# A synthetic note at 44.1kHz: 0.2s of silence, a 0.1s attack, 0.5s of
+# sustain, a 0.3s release and 0.2s of silence.
+SAMPLE_RATE = 44100
+_envelope = np.concatenate((
+    np.zeros(8820),
+    np.linspace(0, 1, 4410) ** 2,
+    np.ones(22050),
+    np.linspace(1, 0, 13230) ** 3,
+    np.zeros(8820),
+))
+TONE = _envelope * np.sin(2 * np.pi * 440 * np.arange(len(_envelope)) / SAMPLE_RATE)
+
+
+# Test measuring the energy of each frame.
+def test_frame_energies():
+    wav_data = np.column_stack((TONE, TONE)) * 1000
+    energies = frame_energies(wav_data.astype(np.int16), 1024)
+    assert len(energies) == len(TONE) // 1024
+    assert energies[0] == 0
+    assert np.max(energies) > 0
+
+    # Chunking doesn't change the result.
+    want = np.mean(TONE[:len(energies) * 1024].reshape(-1, 1024) ** 2, axis=1)
+    assert np.allclose(frame_energies(TONE, 1024), want)
+
+
+# Test finding the sustain of a note.
+def test_find_steady_segment():
+    start, end = find_steady_segment(TONE)
+    assert 8820 + 2205 <= start <= 8820 + 4410 + 1024
+    assert 35280 <= end <= 35280 + 13230 // 2
+
+    # Signals that are too short or silent are used whole.
+    assert find_steady_segment(TONE[:4096]) == (0, 4096)
+    assert find_steady_segment(np.zeros(100000)) == (0, 100000)
+
+    # A steady signal has no attack or release to cut.
+    assert find_steady_segment(np.ones(10000)) == (0, 10000)
@@ -0,0 +1,474 @@
+import argparse
+import asyncio
+import concurrent.futures
+import http
+import json
+import os
+import sys
+import urllib.parse
+from output import *
+from realtime import *
+
+# Default number of requests that can wait for a worker. Requests beyond that
+# are turned away with 503 Service Unavailable until the queue drains, so that
+# a burst of clients can't pile up unbounded work (and memory) in the service.
+DEFAULT_QUEUE_SIZE = 64
+
+# Largest request body that is accepted, in bytes.
+MAX_BODY_SIZE = 256 * 1024 * 1024
+
+# Parameters that an analysis request can have, besides the path or samples,
+# and their defaults. See main.py for what they do.
+REQUEST_PARAMS = {
+    'min_freq': 150,
+    'max_freq': None,
+    'method': 'pairwise',
+    'detector': 'harmonic',
+    'segment': False,
+    'channel': None,
+    'fft_size': 'exact',
+}
+
+
+class RequestError(Exception):
+    """ An invalid request, with the HTTP status to answer it with. """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_params(params):
+    """ Check the parameters of an analysis request (see REQUEST_PARAMS) and
+    convert them into the min_freq, method, detector and options of
+    analyze_path. Raises RequestError if any of them is invalid. """
+
+    unknown = params.keys() - REQUEST_PARAMS.keys()
+    if unknown:
+        raise RequestError(400, f"Unknown parameters: {', '.join(sorted(unknown))}")
+    params = dict(REQUEST_PARAMS, **params)
+
+    min_freq, max_freq, channel = params['min_freq'], params['max_freq'], params['channel']
+    if isinstance(min_freq, bool) or not isinstance(min_freq, (int, float)) or min_freq <= 0:
+        raise RequestError(400, "min_freq must be a positive number")
+    if max_freq is not None and (isinstance(max_freq, bool) or not isinstance(max_freq, (int, float))
+                                 or max_freq <= min_freq):
+        raise RequestError(400, "max_freq must be a number above min_freq")
+    if params['method'] not in FUND_FREQ_METHODS:
+        raise RequestError(400, f"method must be one of {', '.join(FUND_FREQ_METHODS)}")
+    if params['detector'] not in DETECTOR_NAMES:
+        raise RequestError(400, f"detector must be one of {', '.join(DETECTOR_NAMES)}")
+    if not isinstance(params['segment'], bool):
+        raise RequestError(400, "segment must be true or false")
+    if channel is not None and (isinstance(channel, bool) or not isinstance(channel, int) or channel < 0):
+        raise RequestError(400, "channel must be a channel index")
+    if params['fft_size'] not in FFT_SIZES:
+        raise RequestError(400, f"fft_size must be one of {', '.join(FFT_SIZES)}")
+
+    detector = None
+    if params['detector'] != 'harmonic':
+        detector = make_detector(params['detector'], min_freq=min_freq)
+
+    options = {
+        'fft_backend': get_fft_backend(params['fft_size']),
+        'max_freq': max_freq,
+        'segment': params['segment'],
+        'channel': channel,
+    }
+    return min_freq, params['method'], detector, options
+
+
+def check_samples(num_bytes, sample_format, num_channels):
+    """ Make sure that num_bytes bytes of raw PCM samples in one of
+    SAMPLE_FORMATS hold a whole number of samples of every channel. Raises
+    RequestError if they don't. """
+
+    if sample_format not in SAMPLE_FORMATS:
+        raise RequestError(400, f"format must be one of {', '.join(SAMPLE_FORMATS)}")
+    if num_channels < 1:
+        raise RequestError(400, "channels must be at least 1")
+
+    dtype, _ = SAMPLE_FORMATS[sample_format]
+    if num_bytes % (dtype.itemsize * num_channels) != 0:
+        raise RequestError(400, "The body doesn't hold a whole number of samples")
+
+
+def decode_samples(data, sample_format, num_channels):
+    """ Convert raw little-endian PCM bytes in one of SAMPLE_FORMATS into an
+    array with one row per sample and one column per channel, normalized so
+    that full scale is 1.0. """
+
+    check_samples(len(data), sample_format, num_channels)
+
+    dtype, full_scale = SAMPLE_FORMATS[sample_format]
+    samples = np.frombuffer(data, dtype=dtype).astype(np.float32)
+    samples /= full_scale
+    return samples.reshape(-1, num_channels)
+
+
+def _warm_up(sinks):
+    """ Set up a worker process: give it the service's sinks and run a small
+    analysis, so that every module and transform plan that an analysis needs
+    is loaded before the first request arrives. """
+
+    # A forked worker starts with the sinks of the service, but the warm-up
+    # isn't worth reporting.
+    set_sinks([])
+    t = np.arange(4096) / 44100
+    analyze_samples(np.sin(2 * np.pi * 440 * t) + 0.5 * np.sin(4 * np.pi * 440 * t), 44100)
+
+    set_sinks(sinks)
+
+
+def _ping():
+    pass
+
+
+def _analyze_path(path, min_freq, cache, method, detector, options):
+    return to_record(analyze_path(path, min_freq, cache, method, detector, **options))
+
+
+def _analyze_samples(data, sample_format, num_channels, sample_rate, min_freq, method, detector, options):
+    # The samples are decoded in the worker, so that the event loop never
+    # spends time on them.
+    samples = decode_samples(data, sample_format, num_channels)
+    return to_record(analyze_samples(samples, sample_rate, min_freq, method, detector, **options))
+
+
+class AnalysisService():
+    """
+    AnalysisService answers analysis requests over HTTP from a pool of jobs
+    worker processes that stay warm between requests. It listens on a Unix
+    socket or a localhost TCP port, and takes:
+        - POST /analyze with a JSON object holding the path of a WAV file and
+          any of REQUEST_PARAMS
+        - POST /analyze/pcm?sample_rate=...&channels=...&format=... with raw
+          PCM samples (in one of SAMPLE_FORMATS) as the body and any of
+          REQUEST_PARAMS in the query string
+        - GET /health, which describes the workers and the queue
+    Analyses are answered with the JSON record of their Result (see
+    to_record), with status 422 if they failed. Requests wait in a queue of
+    queue_size for a free worker, and are turned away with status 503 when
+    it's full. Every connection carries a single request.
+
+    A request with a body is only read once there's room for it: at most
+    queue_size requests (plus one for every worker) are taken in at a time,
+    and the others are turned away with 503 before their body is read, so
+    that a burst of uploads can't fill up the memory of the service. A
+    request whose client disconnects before it's answered is dropped from
+    the queue.
+    """
+
+    def __init__(self, jobs=None, queue_size=DEFAULT_QUEUE_SIZE, cache=None):
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs < 1:
+            raise ValueError("The number of jobs must be at least 1")
+        if queue_size < 1:
+            raise ValueError("The queue size must be at least 1")
+
+        self.jobs = jobs
+        self.queue_size = queue_size
+        self.cache = cache
+        self._pool = None
+        self._queue = None
+        self._dispatchers = []
+        self._server = None
+        self._busy = 0
+        self._admitted = 0
+
+    async def start(self):
+        """ Start the workers and wait until every one of them is warm. """
+
+        self._pool = concurrent.futures.ProcessPoolExecutor(self.jobs, initializer=_warm_up,
+                                                            initargs=(get_sinks(),))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.jobs)))
+
+        # Each dispatcher keeps one worker busy with requests from the queue.
+        self._queue = asyncio.Queue(self.queue_size)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.jobs)]
+        log("Started {} warm workers", self.jobs)
+
+    async def listen_unix(self, path):
+        """ Accept requests on a Unix socket at the given path, replacing any
+        stale socket that's already there. """
+
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = await asyncio.start_unix_server(self._handle, path)
+        log('Listening on "{}"', path)
+
+    async def listen_tcp(self, host='127.0.0.1', port=0):
+        """ Accept requests on a TCP port (by default, a free one on
+        localhost). Returns the port. """
+
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        log("Listening on http://{}:{}", host, port)
+        return port
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """ Stop accepting requests, and stop the workers. """
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    async def submit(self, func, *args):
+        """ Queue a call of func(*args) in a worker and wait for its result.
+        Raises RequestError if the queue is full. """
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((future, func, args))
+        except asyncio.QueueFull:
+            count('rejected')
+            raise RequestError(503, "Too many pending requests")
+
+        return await future
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            future, func, args = await self._queue.get()
+
+            # The client may have gone away while the request was waiting.
+            if future.cancelled():
+                continue
+
+            self._busy += 1
+            try:
+                with span('request', func=func.__name__):
+                    result = await loop.run_in_executor(self._pool, func, *args)
+                if not future.cancelled():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self._busy -= 1
+
+    async def _handle(self, reader, writer):
+        """ Answer a single HTTP request. """
+
+        admitted = False
+        try:
+            try:
+                method, target, length = await _read_head(reader)
+
+                # Bodies take up memory until their request is answered, so
+                # a request is turned away before its body is read when
+                # there's no room for it.
+                if length > 0:
+                    if self._admitted >= self.queue_size + self.jobs:
+                        count('rejected')
+                        raise RequestError(503, "Too many pending requests")
+                    self._admitted += 1
+                    admitted = True
+                body = await reader.readexactly(length)
+
+                response = await _unless_disconnected(reader, self._route(method, target, body))
+                if response is None:
+                    count('abandoned')
+                    return
+                status, response = response
+            except RequestError as e:
+                status, response = e.status, {'error': str(e)}
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # e.g. a worker died.
+                status, response = 500, {'error': f"{type(e).__name__}: {e}"}
+
+            _write_response(writer, status, response)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if admitted:
+                self._admitted -= 1
+            writer.close()
+
+    async def _route(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+
+        if url.path == '/health':
+            if method != 'GET':
+                raise RequestError(405, "Use GET")
+            return 200, {'workers': self.jobs, 'busy': self._busy, 'queued': self._queue.qsize(),
+                         'queue_size': self.queue_size}
+
+        if url.path not in ('/analyze', '/analyze/pcm'):
+            raise RequestError(404, "Not found")
+        if method != 'POST':
+            raise RequestError(405, "Use POST")
+
+        if url.path == '/analyze':
+            try:
+                params = json.loads(body)
+            except ValueError:
+                raise RequestError(400, "The body must be a JSON object")
+            if not isinstance(params, dict) or not isinstance(params.get('path'), str):
+                raise RequestError(400, "The body must be a JSON object with a path")
+
+            path = params.pop('path')
+            min_freq, method, detector, options = parse_params(params)
+            record = await self.submit(_analyze_path, path, min_freq, self.cache, method, detector, options)
+        elif url.path == '/analyze/pcm':
+            try:
+                sample_rate = int(query.pop('sample_rate'))
+                num_channels = int(query.pop('channels', 1))
+            except (KeyError, ValueError):
+                raise RequestError(400, "sample_rate and channels must be integers")
+            if sample_rate <= 0:
+                raise RequestError(400, "sample_rate must be positive")
+            sample_format = query.pop('format', 'int16')
+
+            min_freq, method, detector, options = parse_params({name: _parse_value(value)
+                                                                for name, value in query.items()})
+            check_samples(len(body), sample_format, num_channels)
+            record = await self.submit(_analyze_samples, body, sample_format, num_channels, sample_rate, min_freq,
+                                       method, detector, options)
+
+        return (200 if record['error'] is None else 422), record
+
+
+def _parse_value(value):
+    """ Convert a value from a query string into the JSON value it spells, or
+    keep it as a string, e.g. '150' -> 150, 'true' -> True, 'hps' -> 'hps'. """
+
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+async def _read_head(reader):
+    """ Read the request line and headers of an HTTP request, and return its
+    method, target and the length of its body. """
+
+    try:
+        method, target, _ = (await reader.readline()).decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, "Malformed request line")
+
+    length = 0
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            try:
+                length = int(value)
+            except ValueError:
+                raise RequestError(400, "Invalid Content-Length")
+
+    if not 0 <= length <= MAX_BODY_SIZE:
+        raise RequestError(413, "The body is too large")
+
+    return method, target, length
+
+
+async def _unless_disconnected(reader, coro):
+    """ Run a coroutine until it's done, unless the client disconnects
+    first, in which case it's cancelled and None is returned. A client that
+    only shuts down its side of the connection counts as disconnected too,
+    since every connection carries a single request. """
+
+    async def wait_for_eof():
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+
+    task = asyncio.ensure_future(coro)
+    eof = asyncio.ensure_future(wait_for_eof())
+    try:
+        await asyncio.wait((task, eof), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        eof.cancel()
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, eof, return_exceptions=True)
+
+    if task.cancelled():
+        return None
+    return task.result()
+
+
+def _write_response(writer, status, response):
+    body = json.dumps(response, ensure_ascii=False).encode()
+    status = http.HTTPStatus(status)
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n")
+    if status == http.HTTPStatus.SERVICE_UNAVAILABLE:
+        head += "Retry-After: 1\r\n"
+
+    writer.write(head.encode('latin-1') + b"\r\n" + body)
+
+
+async def serve(service, socket_path=None, host='127.0.0.1', port=8000):
+    """ Run a service on a Unix socket, if a path is given, or else a TCP
+    port, until it's cancelled. """
+
+    await service.start()
+    try:
+        if socket_path is not None:
+            await service.listen_unix(socket_path)
+        else:
+            await service.listen_tcp(host, port)
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Answer analysis requests from warm worker processes.")
+    parser.add_argument('--socket', dest='socket', type=str,
+                        help="Unix socket to listen on, instead of a TCP port")
+    parser.add_argument('--host', dest='host', type=str, default='127.0.0.1',
+                        help="Address to listen on")
+    parser.add_argument('--port', dest='port', type=int, default=8000,
+                        help="TCP port to listen on")
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes")
+    parser.add_argument('--queue-size', dest='queue_size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Number of requests that can wait for a worker before new ones are turned away")
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str,
+                        help="Reuse spectra and results from a cache in this directory")
+    parser.add_argument('-v', dest='logging_enabled', action='store_true',
+                        help="Enable verbose logging")
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+
+    # Log to stderr, so that the logs of the workers and the service don't get
+    # mixed up with anything else.
+    if args.logging_enabled:
+        add_sink(TextSink('stderr', ('log',)))
+
+    cache = SpectrumCache(args.cache_dir) if args.cache_dir else None
+    service = AnalysisService(args.jobs, args.queue_size, cache)
+    try:
+        asyncio.run(serve(service, args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        print("Stopped", file=sys.stderr)
@@ -0,0 +1,198 @@
+import pytest
+import asyncio
+import time
+from scipy.io import wavfile
+from service import *
+
+testPath = "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav"
+
+
+# Send an HTTP request to a service and return the status and JSON response.
+async def request(connect, method, target, body=b''):
+    reader, writer = await connect()
+    writer.write(f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+# Test checking the parameters of requests.
+def test_parse_params():
+    min_freq, method, detector, options = parse_params({})
+    assert (min_freq, method, detector) == (150, 'pairwise', None)
+    assert options['fft_backend'] is DEFAULT_FFT_BACKEND
+
+    min_freq, method, detector, options = parse_params({'min_freq': 200, 'detector': 'yin', 'segment': True})
+    assert detector.name == 'yin'
+    assert detector.min_freq == 200
+    assert options['segment'] is True
+
+    for params in [{'bogus': 1}, {'min_freq': 'x'}, {'min_freq': -1}, {'max_freq': 100}, {'method': 'x'},
+                   {'detector': 'x'}, {'segment': 1}, {'channel': -1}, {'fft_size': 'x'}]:
+        with pytest.raises(RequestError) as e:
+            parse_params(params)
+        assert e.value.status == 400
+
+
+# Test answering requests over TCP and a Unix socket.
+def test_AnalysisService(tmp_path):
+    want = to_record(analyze_path(testPath))
+    sample_rate, wav_data = wavfile.read(testPath)
+
+    async def run():
+        service = AnalysisService(jobs=2)
+        await service.start()
+        try:
+            port = await service.listen_tcp()
+            tcp = lambda: asyncio.open_connection('127.0.0.1', port)
+
+            status, record = await request(tcp, 'POST', '/analyze', json.dumps({'path': testPath}).encode())
+            assert status == 200
+            assert record == want
+
+            # The same samples, uploaded as PCM, give the same results.
+            status, record = await request(tcp, 'POST', f'/analyze/pcm?sample_rate={sample_rate}&channels=2',
+                                           wav_data.tobytes())
+            assert status == 200
+            assert record['fund_freq'] == want['fund_freq']
+            assert record['note'] == 'A4'
+            assert record['harm_ratios'] == want['harm_ratios']
+
+            status, record = await request(tcp, 'POST', f'/analyze/pcm?sample_rate={sample_rate}&channels=2'
+                                           '&detector="yin"&channel=1', wav_data.tobytes())
+            assert status == 200
+            assert record['note'] == 'A4'
+            assert record['channel'] == 1
+
+            status, record = await request(tcp, 'POST', '/analyze', json.dumps({'path': 'bogus.wav'}).encode())
+            assert status == 422
+            assert record['error'].startswith('FileExistsError')
+
+            for method, target, body, want_status in [
+                ('POST', '/analyze', b'{', 400),
+                ('POST', '/analyze', b'{"path": "x", "min_freq": 0}', 400),
+                ('POST', '/analyze/pcm?sample_rate=44100&channels=2', b'\0\0', 400),
+                ('POST', '/analyze/pcm', b'', 400),
+                ('GET', '/analyze', b'', 405),
+                ('GET', '/bogus', b'', 404),
+            ]:
+                status, record = await request(tcp, method, target, body)
+                assert status == want_status
+                assert 'error' in record
+
+            status, health = await request(tcp, 'GET', '/health')
+            assert status == 200
+            assert health == {'workers': 2, 'busy': 0, 'queued': 0, 'queue_size': DEFAULT_QUEUE_SIZE}
+
+            socket_path = str(tmp_path / 'service.sock')
+            await service.listen_unix(socket_path)
+            unix = lambda: asyncio.open_unix_connection(socket_path)
+            status, record = await request(unix, 'POST', '/analyze', json.dumps({'path': testPath}).encode())
+            assert status == 200
+            assert record == want
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+
+
+# Test that requests are turned away when the queue is full.
+def test_AnalysisService_backpressure():
+    async def run():
+        service = AnalysisService(jobs=1, queue_size=1)
+        await service.start()
+        try:
+            # The first request keeps the worker busy and the second one
+            # waits in the queue.
+            running = asyncio.create_task(service.submit(time.sleep, 0.5))
+            await asyncio.sleep(0.1)
+            queued = asyncio.create_task(service.submit(time.sleep, 0))
+            await asyncio.sleep(0.1)
+
+            with pytest.raises(RequestError) as e:
+                await service.submit(time.sleep, 0)
+            assert e.value.status == 503
+
+            await asyncio.gather(running, queued)
+            await service.submit(time.sleep, 0)
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+
+
+# Test that uploads are turned away before their body is read when there's
+# no room for them.
+def test_AnalysisService_admission():
+    async def run():
+        service = AnalysisService(jobs=1, queue_size=1)
+        await service.start()
+        try:
+            port = await service.listen_tcp()
+            tcp = lambda: asyncio.open_connection('127.0.0.1', port)
+
+            # Two uploads that haven't sent their bodies yet take up every
+            # place.
+            head = b"POST /analyze HTTP/1.1\r\nContent-Length: 1000\r\n\r\n"
+            waiting = [await tcp() for _ in range(2)]
+            for _, writer in waiting:
+                writer.write(head)
+                await writer.drain()
+            await asyncio.sleep(0.1)
+
+            # A third one is answered without sending any of its body.
+            reader, writer = await tcp()
+            writer.write(b"POST /analyze HTTP/1.1\r\nContent-Length: 100000000\r\n\r\n")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            assert response.startswith(b"HTTP/1.1 503 ")
+            assert b"Retry-After: 1\r\n" in response
+
+            # Once the others go away, there's room again.
+            for _, writer in waiting:
+                writer.close()
+            await asyncio.sleep(0.1)
+            status, record = await request(tcp, 'POST', '/analyze', json.dumps({'path': testPath}).encode())
+            assert status == 200
+            assert record['note'] == 'A4'
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+
+
+# Test that a request is dropped from the queue when its client disconnects.
+def test_AnalysisService_disconnect():
+    async def run():
+        service = AnalysisService(jobs=1, queue_size=2)
+        await service.start()
+        sink = MemorySink(types=['count', 'span'])
+        add_sink(sink)
+        try:
+            port = await service.listen_tcp()
+
+            # The request waits in the queue behind a busy worker, and its
+            # client goes away.
+            running = asyncio.create_task(service.submit(time.sleep, 0.5))
+            await asyncio.sleep(0.1)
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            body = json.dumps({'path': testPath}).encode()
+            writer.write(f"POST /analyze HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            await asyncio.sleep(0.1)
+            writer.close()
+
+            await running
+            await asyncio.sleep(0.1)
+            assert sink.counters().get('abandoned') == 1
+            assert len(sink.spans('request')) == 1
+            assert service._queue.qsize() == 0
+        finally:
+            remove_sink(sink)
+            await service.close()
+
+    asyncio.run(run())
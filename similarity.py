@@ -0,0 +1,325 @@
+import argparse
+import collections
+import sys
+import scipy.spatial
+from manifest import *
+
+# Default number of harmonic ratios in each timbre vector (besides the
+# fundamental). The first few harmonics carry most of the character of a
+# sound, and k-d trees search quickly only in a modest number of dimensions.
+DEFAULT_NUM_HARMONICS = 8
+
+# Version of the layout of saved indexes.
+_INDEX_VERSION = 1
+
+# A sample found by a similarity query, with the distance between its timbre
+# vector and the query's (from 0 for the same timbre up to the square root of 2
+# for samples that share no harmonics besides the fundamental).
+# The channel is None for a mix of every channel, and the note is the standard
+# note closest to the fundamental frequency.
+Match = collections.namedtuple('Match', ['path', 'channel', 'fund_freq', 'note', 'distance'])
+
+
+def timbre_vector(harm_ratios, num_harmonics=DEFAULT_NUM_HARMONICS):
+    """ Convert the harmonic ratios of a sample (see Spectrum.get_harm_ratios)
+    into a timbre vector of a fixed length: the fundamental (whose ratio is
+    always 1) followed by the first num_harmonics ratios, padded with zeros
+    if there are fewer, and scaled to unit length. Samples with the same
+    balance of harmonics have the same vector, however loud they are, so the
+    Euclidean distance between two vectors compares their timbres. """
+
+    vector = np.zeros(num_harmonics + 1, dtype=np.float32)
+    vector[0] = 1
+    harm_ratios = np.asarray(harm_ratios, dtype=np.float32)[:num_harmonics]
+    vector[1:1+len(harm_ratios)] = harm_ratios
+
+    vector /= np.linalg.norm(vector)
+    return vector
+
+
+def get_note_indices(note=None, octave=None):
+    """ Get the indices in SORTED_FREQS of the notes that a query is
+    restricted to: a single Note, a note name (like 'A' or 'C#') in any
+    octave, every note in an octave, or a note name in an octave. Returns None
+    if there is no restriction. """
+
+    if note is None and octave is None:
+        return None
+
+    if isinstance(note, Note):
+        if octave is not None and octave != note.octave:
+            return []
+        return [note.octave * len(NOTES) + NOTES.index(note.note)]
+
+    octaves = range(11)
+    if octave is not None:
+        if not 0 <= octave <= 10:
+            raise ValueError("Octave must be between 0 and 10 inclusive")
+        octaves = [octave]
+
+    names = NOTES
+    if note is not None:
+        names = [Note(note, 4).note]
+
+    return [o * len(NOTES) + NOTES.index(name) for o in octaves for name in names]
+
+
+class SimilarityIndex():
+    """
+    SimilarityIndex finds the samples with the closest timbre to a given one.
+    It stores the timbre vector (see timbre_vector) of every sample in a
+    single float32 array, next to arrays of their paths, channels,
+    fundamental frequencies and notes, and searches them with k-d trees, so
+    queries take logarithmic time on average even in large libraries.
+
+    Queries can be restricted to a note or octave. Every note has its own
+    tree, which is built the first time it's needed, so a restricted query
+    only searches the samples it can return.
+    """
+
+    def __init__(self, num_harmonics=DEFAULT_NUM_HARMONICS):
+        if num_harmonics < 1:
+            raise ValueError("The number of harmonics must be at least 1")
+
+        self.num_harmonics = num_harmonics
+        self.vectors = np.zeros((0, num_harmonics + 1), dtype=np.float32)
+        self.paths = np.zeros(0, dtype=str)
+        self.channels = np.zeros(0, dtype=np.int64)
+        self.fund_freqs = np.zeros(0, dtype=np.float64)
+        self.note_indices = np.zeros(0, dtype=np.int16)
+        self._reset()
+
+    def _reset(self):
+        """ Forget the trees and lookups, after the samples changed. """
+
+        self._tree = None
+        self._note_trees = {}
+        self._note_rows = None
+        self._rows_by_path = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, results):
+        """ Add the Results of analyzing samples (see analyze_paths) to the
+        index. Results that failed or have no fundamental frequency are
+        skipped. Adding samples in large batches is much faster than one at a
+        time, since the arrays are copied every time. """
+
+        rows = [result for result in results
+                if result.error is None and result.fund_freq is not None and result.fund_freq > 0]
+        if not rows:
+            return
+
+        vectors = np.array([timbre_vector(result.harm_ratios, self.num_harmonics) for result in rows])
+        paths = np.array(['' if result.path is None else result.path for result in rows], dtype=str)
+        channels = np.array([-1 if result.channel is None else result.channel for result in rows], dtype=np.int64)
+        fund_freqs = np.array([result.fund_freq for result in rows], dtype=np.float64)
+        note_indices = freqs_to_notes(fund_freqs)
+        note_indices = (note_indices.octave.filled(-1).astype(np.int16) * len(NOTES)
+                        + note_indices.note_index.filled(0))
+        note_indices[note_indices < 0] = -1
+
+        self.vectors = np.concatenate((self.vectors, vectors))
+        self.paths = np.concatenate((self.paths, paths))
+        self.channels = np.concatenate((self.channels, channels))
+        self.fund_freqs = np.concatenate((self.fund_freqs, fund_freqs))
+        self.note_indices = np.concatenate((self.note_indices, note_indices))
+        self._reset()
+
+    def get_match(self, row, distance=0.0):
+        """ Describe the sample in a row of the index as a Match. """
+
+        note_index = int(self.note_indices[row])
+        return Match(str(self.paths[row]) or None, None if self.channels[row] < 0 else int(self.channels[row]),
+                     float(self.fund_freqs[row]), None if note_index < 0 else FREQ_TO_NOTE[SORTED_FREQS[note_index]],
+                     float(distance))
+
+    def find(self, path, channel=None):
+        """ Get the row of the sample with the given path and channel, or None
+        if it isn't in the index. """
+
+        if self._rows_by_path is None:
+            self._rows_by_path = {(str(p), int(c)): row for row, (p, c) in enumerate(zip(self.paths, self.channels))}
+
+        return self._rows_by_path.get((path, -1 if channel is None else channel))
+
+    def query(self, harm_ratios, k=10, note=None, octave=None, exclude=None):
+        """ Find the k samples whose timbre is closest to the given harmonic
+        ratios, closest first, as a list of Matches. The search can be
+        restricted to a note or octave (see get_note_indices). The row given
+        as exclude is left out of the results. """
+
+        if k < 1:
+            raise ValueError("The number of matches must be at least 1")
+
+        vector = timbre_vector(harm_ratios, self.num_harmonics)
+        note_indices = get_note_indices(note, octave)
+        if note_indices is None:
+            trees = [(self._get_tree(), None)]
+        else:
+            trees = [self._get_note_tree(note_index) for note_index in note_indices]
+
+        # Every tree gives its own k closest samples (one more, in case the
+        # excluded one is among them), and the closest of those win.
+        distances = []
+        rows = []
+        for tree, tree_rows in trees:
+            if tree is None:
+                continue
+            tree_k = min(k + 1, tree.n)
+            d, i = tree.query(vector, tree_k)
+            d, i = np.atleast_1d(d), np.atleast_1d(i)
+            distances.append(d)
+            rows.append(i if tree_rows is None else tree_rows[i])
+
+        if not distances:
+            return []
+
+        distances = np.concatenate(distances)
+        rows = np.concatenate(rows)
+        order = np.argsort(distances, kind='stable')
+        matches = [self.get_match(rows[i], distances[i]) for i in order if rows[i] != exclude]
+        return matches[:k]
+
+    def neighbours(self, path, k=10, channel=None, same_note=False, same_octave=False):
+        """ Find the k samples that sound most like the one with the given
+        path and channel in the index, closest first, as a list of Matches.
+        The search can be restricted to samples of the same note or in the
+        same octave. Raises KeyError if the sample isn't in the index. """
+
+        row = self.find(path, channel)
+        if row is None:
+            raise KeyError(f'"{path}" is not in the index')
+
+        note = None
+        note_index = int(self.note_indices[row])
+        if (same_note or same_octave) and note_index < 0:
+            return []
+        if same_note:
+            note = FREQ_TO_NOTE[SORTED_FREQS[note_index]]
+        octave = note_index // len(NOTES) if same_octave else None
+
+        # The vector in the index is already normalized, so scaling it again
+        # in query() leaves it as it is.
+        vector = self.vectors[row]
+        return self.query(vector[1:] / vector[0], k, note, octave, exclude=row)
+
+    def _get_tree(self):
+        if self._tree is None and len(self) > 0:
+            with span('similarity_tree', size=len(self)):
+                self._tree = scipy.spatial.cKDTree(self.vectors)
+        return self._tree
+
+    def _get_note_tree(self, note_index):
+        """ Get the tree of the samples of a note, and the rows of the index
+        that its points are in. """
+
+        if self._note_rows is None:
+            # Group the rows of every note together with a single sort.
+            order = np.argsort(self.note_indices, kind='stable')
+            notes, starts = np.unique(self.note_indices[order], return_index=True)
+            self._note_rows = dict(zip(notes.tolist(), np.split(order, starts[1:])))
+
+        if note_index not in self._note_trees:
+            rows = self._note_rows.get(note_index)
+            tree = None
+            if rows is not None:
+                tree = scipy.spatial.cKDTree(self.vectors[rows])
+            self._note_trees[note_index] = (tree, rows)
+
+        return self._note_trees[note_index]
+
+    def save(self, path):
+        """ Save the index to an .npz file at the given path (or a binary
+        stream). The trees aren't saved, since they're quick to build again
+        the first time the loaded index is queried. """
+
+        np.savez(
+            path,
+            version=_INDEX_VERSION,
+            num_harmonics=self.num_harmonics,
+            vectors=self.vectors,
+            paths=self.paths,
+            channels=self.channels,
+            fund_freqs=self.fund_freqs,
+            note_indices=self.note_indices,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """ Load an index that was saved with save(). Raises ValueError if the
+        file isn't a saved index of this version. """
+
+        with np.load(path, allow_pickle=False) as data:
+            if 'version' not in data or int(data['version']) != _INDEX_VERSION:
+                raise ValueError(f'"{path}" is not a similarity index of version {_INDEX_VERSION}')
+
+            index = cls(int(data['num_harmonics']))
+            index.vectors = data['vectors']
+            index.paths = data['paths']
+            index.channels = data['channels']
+            index.fund_freqs = data['fund_freqs']
+            index.note_indices = data['note_indices']
+
+        return index
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Find samples with a similar timbre.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Analyze WAV files and save their timbres in an index")
+    build.add_argument('index', type=str, help="Index file to write")
+    build.add_argument('paths', type=str, nargs='+', help="WAV files or directories of WAV files")
+    build.add_argument('--min-freq', dest='min_freq', type=float, default=150,
+                       help="Minimum frequency of the fundamental")
+    build.add_argument('--harmonics', dest='num_harmonics', type=int, default=DEFAULT_NUM_HARMONICS,
+                       help="Number of harmonics in each timbre vector")
+    build.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                       help="Number of files to analyze in parallel")
+
+    query = subparsers.add_parser('query', help="Find the samples in an index that sound like a WAV file")
+    query.add_argument('index', type=str, help="Index file to search")
+    query.add_argument('path', type=str, help="WAV file to compare")
+    query.add_argument('-k', dest='k', type=int, default=10,
+                       help="Number of samples to find")
+    query.add_argument('--min-freq', dest='min_freq', type=float, default=150,
+                       help="Minimum frequency of the fundamental")
+    query.add_argument('--same-note', dest='same_note', action='store_true',
+                       help="Only find samples of the same note")
+    query.add_argument('--same-octave', dest='same_octave', action='store_true',
+                       help="Only find samples in the same octave")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        paths = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                paths += [os.path.join(path, name) for name in find_wav_files(path)]
+            else:
+                paths.append(path)
+
+        index = SimilarityIndex(args.num_harmonics)
+        index.add(analyze_paths(paths, args.min_freq, args.jobs))
+        index.save(args.index)
+        print(f"Indexed {len(index)} of {len(paths)} files", file=sys.stderr)
+    else:
+        index = SimilarityIndex.load(args.index)
+        result = analyze_path(args.path, args.min_freq)
+        if result.error is not None:
+            sys.exit(f"{result.path}: {result.error}")
+
+        # The index only holds samples with a fundamental frequency (see
+        # SimilarityIndex.add), so there's nothing to compare without one.
+        try:
+            note = freq_to_note(result.fund_freq)
+        except ValueError:
+            sys.exit(f"{result.path}: No fundamental frequency found")
+
+        matches = index.query(result.harm_ratios, args.k, note if args.same_note else None,
+                              note.octave if args.same_octave else None)
+        for match in matches:
+            channel = '' if match.channel is None else f"#{match.channel}"
+            print(f"{match.distance:.4f}\t{match.note}\t{match.path}{channel}")
@@ -0,0 +1,95 @@
+import pytest
+from similarity import *
+
+testPaths = [
+    "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav",
+    "samples/mis/violin/Violin.arco.ff.sulD.A4.stereo.wav",
+]
+
+
+# Make a Result with the given fundamental frequency and harmonic ratios.
+def make_result(path, fund_freq, harm_ratios, channel=None):
+    return Result(path, fund_freq, np.array(harm_ratios, dtype=np.float64), None, channel=channel)
+
+
+# Test converting harmonic ratios into timbre vectors.
+def test_timbre_vector():
+    vector = timbre_vector([1, 0.5], 3)
+    assert vector.dtype == np.float32
+    assert np.allclose(vector, np.array([1, 1, 0.5, 0]) / 1.5)
+
+    # Only the first harmonics are kept, and loudness doesn't matter.
+    assert np.allclose(timbre_vector([0.5, 0.25, 0.125, 2], 3), timbre_vector([0.5, 0.25, 0.125], 3))
+    assert np.allclose(timbre_vector([]), np.eye(DEFAULT_NUM_HARMONICS + 1)[0])
+
+
+# Test finding the notes that a query is restricted to.
+def test_get_note_indices():
+    assert get_note_indices() is None
+    assert get_note_indices(parse_note('A4')) == [SORTED_FREQS.index(FREQ_TABLE['A'][4])]
+    assert get_note_indices(parse_note('A4'), 5) == []
+    assert get_note_indices('Eb', 5) == [SORTED_FREQS.index(FREQ_TABLE['D♯'][5])]
+    assert len(get_note_indices('C')) == 11
+    assert get_note_indices(octave=0) == list(range(12))
+    with pytest.raises(ValueError):
+        get_note_indices(octave=11)
+    with pytest.raises(ValueError):
+        get_note_indices('H')
+
+
+# Test that queries find the closest timbres, restricted to a note or octave.
+def test_SimilarityIndex():
+    index = SimilarityIndex(4)
+    index.add([
+        make_result('a4', 440.0, [0.5, 0.25, 0.1]),
+        make_result('a4_bright', 441.0, [0.9, 0.8, 0.7]),
+        make_result('a5', 880.0, [0.5, 0.25, 0.12]),
+        make_result('e5', 659.0, [0.5, 0.2, 0.1], channel=1),
+        Result('bogus', None, None, 'ValueError: bogus'),
+    ])
+    assert len(index) == 4
+    assert index.vectors.shape == (4, 5)
+
+    matches = index.query([0.5, 0.25, 0.1], 2)
+    assert [match.path for match in matches] == ['a4', 'a5']
+    assert matches[0].distance == pytest.approx(0, abs=1e-6)
+    assert matches[0].note == parse_note('A4')
+    assert matches[0].fund_freq == 440.0
+
+    assert [m.path for m in index.query([0.5, 0.25, 0.1], 10, note=parse_note('A4'))] == ['a4', 'a4_bright']
+    assert [m.path for m in index.query([0.5, 0.25, 0.1], 10, note='A')] == ['a4', 'a5', 'a4_bright']
+    assert [m.path for m in index.query([0.5, 0.25, 0.1], 10, octave=5)] == ['a5', 'e5']
+    assert index.query([0.5, 0.25, 0.1], 10, note='C') == []
+
+    # Neighbours leave out the sample itself.
+    assert [m.path for m in index.neighbours('a4', 2)] == ['a5', 'e5']
+    assert [m.path for m in index.neighbours('a4', 2, same_note=True)] == ['a4_bright']
+    assert [(m.path, m.channel) for m in index.neighbours('a5', 1, same_octave=True)] == [('e5', 1)]
+    assert [m.path for m in index.neighbours('e5', 1, channel=1)] == ['a4']
+    with pytest.raises(KeyError):
+        index.neighbours('e5')
+
+    # Adding samples rebuilds the trees.
+    index.add([make_result('a4_copy', 440.0, [0.5, 0.25, 0.1])])
+    assert [m.path for m in index.neighbours('a4', 1, same_note=True)] == ['a4_copy']
+
+
+# Test saving and loading an index of analyzed files.
+def test_SimilarityIndex_save(tmp_path):
+    index = SimilarityIndex()
+    index.add(analyze_paths(testPaths))
+    assert len(index) == 4
+
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+    loaded = SimilarityIndex.load(path)
+    assert loaded.num_harmonics == DEFAULT_NUM_HARMONICS
+    assert np.array_equal(loaded.vectors, index.vectors)
+    assert loaded.neighbours(testPaths[0], 3) == index.neighbours(testPaths[0], 3)
+    assert [m.path for m in loaded.neighbours(testPaths[0], 3, same_note=True)] == [testPaths[3]]
+
+    np.savez(path, vectors=index.vectors)
+    with pytest.raises(ValueError):
+        SimilarityIndex.load(path)
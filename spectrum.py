@@ -1,77 +1,546 @@
-from scipy.io import wavfile
+import threading
 import numpy as np
 import scipy.signal
+from fourier import *
 from frequency import *
 from note import *
-from log import *
+from segment import *
+from wav import *
 
 
-class Spectrum():
-    def __init__(self, path):
-        """ Initialize a new spectral analysis from a WAV file. """
-
-        log(f'\nOpening WAV file at "{path}"')
-        sample_rate, wav_data = wavfile.read(path)
-
-        # Convert stereo mixes down into a single mono track.
-        if len(wav_data.shape) > 1 and wav_data.shape[1] > 1:
-            log("\tConverting from stereo to mono")
-            wav_data = np.mean(wav_data, axis=1)
-
-        # Calculate some info from the source.
-        num_samples = wav_data.shape[0]
-        freq_step = Decimal(sample_rate) / Decimal(num_samples)
-        log(f"\tSample rate: {sample_rate}")
-        log(f"\tNumber of samples: {num_samples}")
-        log(f"\tTotal track length: {num_samples / sample_rate}s")
-        log(f"\tFrequency step: {freq_step}Hz / sample")
-
-        # Create the power spectrum by computing the Fourier Transform on the signal.
-        log("Analyzing signal spectrum")
-        fft_data = np.fft.fft(wav_data)
+# Methods that get_fund_freq can use to find the fundamental frequency.
+FUND_FREQ_METHODS = ('pairwise', 'hps')
 
-        log("\tLowest frequency: 0Hz")
-        log(f"\tHighest frequency: {float(len(fft_data)) * sample_rate / num_samples}Hz")
+# Buffers that each thread downmixes multichannel signals into, by type. See
+# _get_downmix_buffer.
+_DOWNMIX_BUFFERS = threading.local()
+
+
+def _check_dtype(dtype):
+    """ Make sure that the dtype is one that a spectrum can be computed in. """
+
+    dtype = np.dtype(dtype)
+    if dtype != np.float32 and dtype != np.float64:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    return dtype
+
+
+def get_num_channels(wav_data):
+    """ Get the number of channels in WAV data. """
+
+    return wav_data.shape[1] if wav_data.ndim > 1 else 1
+
+
+def select_channel(wav_data, channel):
+    """ Get a single channel of WAV data as a one-dimensional view, without
+    copying anything. A channel of a memory-mapped file stays mapped. """
+
+    _check_channel(channel, get_num_channels(wav_data))
+    if wav_data.ndim == 1:
+        return wav_data
+    return wav_data[:, channel]
+
+
+def _check_channel(channel, num_channels):
+    """ Make sure that a signal with num_channels channels has the given
+    channel. """
+
+    if not 0 <= channel < num_channels:
+        raise ValueError(f"Invalid channel {channel} for a signal with {num_channels} channels")
+
+
+def downmix(wav_data, dtype=np.float64, out=None):
+    """ Convert WAV data into a single mono track of the given floating-point
+    type. Multichannel data has one column per channel. If out is given, the
+    track is written into it (it must have one element per sample and the
+    given type) instead of a new array. """
+
+    count('samples', len(wav_data))
+
+    with span('downmix'):
+        if get_num_channels(wav_data) == 1:
+            mono = wav_data.reshape(len(wav_data))
+            if out is None:
+                return mono.astype(dtype, copy=False)
+            out[:] = mono
+            return out
+
+        # Convert stereo mixes down into a single mono track. The channels
+        # are added up one column at a time, straight from the integer
+        # samples into the output, so that there are no temporary copies of
+        # the signal. This gives the same result as np.mean.
+        log("\tConverting from stereo to mono")
+        if out is None:
+            out = np.empty(len(wav_data), dtype=dtype)
+        np.copyto(out, wav_data[:, 0], casting='unsafe')
+        for channel in range(1, wav_data.shape[1]):
+            np.add(out, wav_data[:, channel], out=out, casting='unsafe')
+        out /= wav_data.shape[1]
+
+        return out
+
+
+def _get_downmix_buffer(size, dtype):
+    """ Get a buffer of the given size and type for this thread to downmix a
+    signal into. The buffer only grows, so a batch of files of similar
+    lengths reuses a single allocation. Its contents are only valid until the
+    next call. """
+
+    buffers = getattr(_DOWNMIX_BUFFERS, 'buffers', None)
+    if buffers is None:
+        buffers = _DOWNMIX_BUFFERS.buffers = {}
+
+    dtype = np.dtype(dtype)
+    buffer = buffers.get(dtype)
+    if buffer is None or len(buffer) < size:
+        buffer = buffers[dtype] = np.empty(size, dtype=dtype)
+
+    return buffer[:size]
+
+
+def read_signal(reader, dtype=np.float64, channel=None, start=0, end=None, out=None):
+    """ Read the frames from start to end (or the end of the file) of a
+    WavReader as a single mono track of the given floating-point type: either
+    a mix of every channel (see downmix) or the given channel alone. The file
+    is decoded and mixed a block at a time, straight into the track, so only
+    a single block of the file is ever decoded in memory. If out is given, the
+    track is written into it instead of a new array. """
+
+    if end is None:
+        end = reader.num_frames
+    if channel is not None:
+        _check_channel(channel, reader.num_channels)
+    if out is None:
+        out = np.empty(end - start, dtype=dtype)
+
+    reader.seek(start)
+    position = 0
+    for block in reader.blocks(end - start):
+        if channel is not None:
+            block = select_channel(block, channel)
+        downmix(block, dtype, out[position:position+len(block)])
+        position += len(block)
+
+    return out
+
+
+def to_magnitudes(fft_data, num_samples):
+    """ Convert the FFT data of a signal with num_samples samples into the
+    magnitude of each frequency. """
+
+    # Convert the complex numbers representing wave phases into real numbers
+    # representing the magnitude of each frequency. The magnitude is the
+    # length of the hypotenuse formed by the cosine (real) and sine
+    # (imaginary) components. We double it to account for both sides of the
+    # signal and shrink it by the number of samples in the audio file.
+    with span('magnitudes'):
+        magnitudes = np.abs(fft_data)
+        magnitudes *= 2 / num_samples
+
+    return magnitudes
+
+
+def get_decimation(sample_rate, max_freq):
+    """ Get the largest whole factor by which a signal with the given sample
+    rate can be decimated while keeping every frequency up to max_freq. If
+    max_freq is None, the signal is not decimated and the factor is 1. """
+
+    if max_freq is None:
+        return 1
+    if max_freq <= 0:
+        raise ValueError("The maximum frequency must be positive")
+
+    return max(int(sample_rate // (2 * max_freq)), 1)
+
+
+def decimate(signal, factor):
+    """ Low-pass filter a mono signal and keep every factor-th sample of it.
+    The filter removes the frequencies above the new Nyquist limit, so that
+    they don't alias into the ones below it. The result has the same type as
+    the signal. """
+
+    if factor == 1:
+        return signal
+
+    with span('decimate', factor=factor):
+        # A polyphase filter only computes the samples that are kept.
+        return scipy.signal.resample_poly(signal, 1, factor).astype(signal.dtype, copy=False)
+
+
+def find_peak_indices(magnitudes, min_peak_distance):
+    """ Find the indices of the most prominent peaks in the magnitudes of a
+    power spectrum, with at least min_peak_distance units between neighbouring
+    peaks. The indices are ordered by frequency in ascending order. """
+
+    # The prominence of each peak is the difference between the magnitude of
+    # its strongest frequency and the magnitude of the frequency at the
+    # base. We're using a value equal to 5% of the largest peak as the
+    # minimum prominence that a peak should have, which should be a large
+    # enough value that we shouldn't have too many peaks from edge
+    # perturbations but a small enough value that we capture higher
+    # harmonics.
+    min_mag = float(magnitudes.min())
+    max_mag = float(magnitudes.max())
+    prominence = (max_mag - min_mag) * 5 / 100
+
+    # find_peaks needs at least one unit between peaks.
+    min_peak_distance = max(min_peak_distance, 1)
 
-        # We now have a list of frequencies and their data. We can ignore all
-        # frequencies above the Nyquist limit (half the sample rate), because
-        # they cannot be reliably reproduced from the digital signal.
-        fft_data = fft_data[:num_samples // 2]
+    with span('find_peaks'):
+        peaks = scipy.signal.find_peaks(magnitudes, distance=min_peak_distance, prominence=prominence)[0]
 
-        # Convert the complex numbers representing wave phases into real numbers
-        # representing the magnitude of each frequency.
-        magnitudes = [0.0] * len(fft_data)
-        for i in range(len(fft_data)):
-            # Get the complex number at this position in the power spectrum.
-            cmplx = fft_data[i]
+    count('peaks', len(peaks))
+    return peaks
 
-            # The real part represents the amplitude of the cosine component.
-            cosAmp = cmplx.real
-            # The imaginary part represents the amplitude of the sine component.
-            sinAmp = cmplx.imag
 
-            # Get the magnitude by calculating the length of the hypotenuse of
-            # the sinusoid in this phase.
-            mag = np.sqrt(cosAmp**2 + sinAmp**2)
+def find_fund_freq(peak_freqs):
+    """ Determine the fundamental frequency from a list of peak frequencies,
+    ordered in ascending order, by figuring out which frequency has the most
+    harmonics among the higher ones. Returns 0.0 if no peak has any
+    harmonics. """
 
-            # Double the magnitude to account for both sides of the signal and
-            # shrink it by the number of samples in the audio file.
-            magnitudes[i] = 2 * mag / num_samples
+    freqs = np.asarray(peak_freqs, dtype=np.float64)
+    if len(freqs) == 0:
+        return 0.0
+
+    # Compare every peak (the rows) against every other peak (the columns) at
+    # once. Calculate the modulo of each frequency against the base frequency,
+    # and see how far away it is from a harmonic.
+    base = freqs[:, np.newaxis]
+    mod = np.mod(freqs[np.newaxis, :], base)
+    mod = np.where(mod > base / 2, base - mod, mod)
+
+    # If the frequency's modulo is within 3% of the base frequency, then we'll
+    # assume it's a harmonic. Only the peaks above the base frequency count.
+    perc = np.floor_divide(mod * 100.0, base)
+    harmonics = np.triu(perc < 3, k=1)
+
+    # The frequency with the most harmonics is the fundamental frequency. If
+    # several have the same number, the lowest one wins.
+    harm_cnts = harmonics.sum(axis=1)
+    best = int(np.argmax(harm_cnts))
+    if harm_cnts[best] == 0:
+        return 0.0
+
+    return float(freqs[best])
+
+
+def find_fund_freq_hps(magnitudes, freq_step, min_freq=150, num_harmonics=5):
+    """ Determine the fundamental frequency of a power spectrum with a harmonic
+    product spectrum. The spectrum is compressed by each factor from 2 up to
+    num_harmonics, so that the k-th harmonic of every frequency lines up with
+    the frequency itself, and the compressed spectra are multiplied together.
+    The fundamental frequency is the strongest frequency in the product that
+    is at least min_freq. freq_step is the width of each unit in the spectrum
+    in Hz. Returns 0.0 if the spectrum is too short. """
+
+    n = len(magnitudes) // num_harmonics
+    lowest = int(np.ceil(min_freq / freq_step))
+    if lowest >= n:
+        return 0.0
+
+    # Compress the spectrum by taking the largest magnitude of every group of
+    # k units, instead of every k-th unit, so that harmonics that are slightly
+    # sharp or flat still line up.
+    product = magnitudes[:n].astype(np.float64)
+    for k in range(2, num_harmonics+1):
+        product *= magnitudes[:n*k].reshape(n, k).max(axis=1)
+
+    return (lowest + int(np.argmax(product[lowest:]))) * freq_step
+
+
+def _find_segment(wav_data, segment):
+    """ Find the segment of WAV data that a spectrum analyzes if segment is
+    True, or None to analyze all of it. """
+
+    if not segment:
+        return None
+
+    with span('segment'):
+        return find_steady_segment(wav_data)
+
+
+def _find_file_segment(reader, segment, channel):
+    """ Find the segment of a WAV file that a spectrum analyzes, like
+    _find_segment does, reading the file a block at a time. """
+
+    if not segment:
+        return None
+
+    with span('segment'):
+        reader.seek(0)
+        blocks = iter(reader)
+        if channel is not None:
+            blocks = (select_channel(block, channel) for block in blocks)
+
+        return find_steady_segment_from_energies(block_energies(blocks), reader.num_frames)
+
+
+class Spectrum():
+    def __init__(self, path, dtype=np.float64, lazy=False, fft_backend=None, max_freq=None, segment=False,
+                 channel=None):
+        """ Initialize a new spectral analysis from a WAV file. The magnitudes
+        are stored as an ndarray of the given floating-point type. Passing
+        np.float32 halves the memory used by the signal and its spectrum.
+
+        The transform is computed by fft_backend, an FFTBackend that decides
+        the length of the transform and how many threads it uses. By default,
+        every sample is transformed in a single thread (see
+        DEFAULT_FFT_BACKEND).
+
+        If max_freq is given, the signal is low-pass filtered and decimated
+        by the largest whole factor that keeps every frequency up to max_freq
+        (see get_decimation) before it is transformed. That shrinks the
+        transform and the spectrum by the same factor. The spectrum then ends
+        at the Nyquist limit of the decimated signal (analysis_rate / 2), and
+        harmonics above max_freq are ignored.
+
+        If segment is True, only the sustained, non-silent region of the
+        signal (see find_steady_segment) is analyzed, so that the silence,
+        the attack and the release don't blur the spectrum. The region is
+        tapered with a Hann window before it is transformed. Its start and end
+        in samples are kept in the segment field, which is None when the
+        whole signal is analyzed.
+
+        By default, every channel of the signal is mixed down to a single
+        mono track. If channel is given, only that channel is analyzed,
+        without mixing. See per_channel to analyze every channel separately.
+
+        The file is read with a WavReader, a block at a time, and its samples
+        are normalized so that full scale is 1.0 whatever their format (16,
+        24 or 32-bit PCM or 32-bit float), so the whole file is never decoded
+        in memory at once: only the mono track that is transformed.
+
+        If lazy is True, only the WAV header (and the energy of the signal,
+        for a segment) is read here. The file is decoded and transformed the
+        first time the spectrum is needed (e.g. by get_fund_freq or
+        get_harm_ratios), and the decoded signal and complex FFT data are
+        dropped as soon as the magnitudes exist. """
+
+        dtype = _check_dtype(dtype)
+
+        log('\nOpening WAV file at "{}"', path)
+        count('files')
+        with WavReader(path) as reader:
+            if channel is not None:
+                _check_channel(channel, reader.num_channels)
+            self._setup(path, reader.sample_rate, reader.num_frames, dtype, lazy, fft_backend, max_freq,
+                        _find_file_segment(reader, segment, channel), channel)
+
+            if not lazy:
+                self._analyze(reader=reader)
+
+    @classmethod
+    def from_samples(cls, samples, sample_rate, dtype=np.float64, path=None, fft_backend=None, max_freq=None,
+                     segment=False, channel=None):
+        """ Create a spectral analysis of a signal that is already in memory,
+        e.g. a buffer from a live stream. samples has one row per sample, with
+        one column per channel for multichannel signals (like the data
+        returned by wavfile.read). The path is only used to describe the
+        signal. See __init__ for the other options. """
+
+        if channel is not None:
+            samples = select_channel(samples, channel)
+
+        spectrum = cls.__new__(cls)
+        spectrum._setup(path, sample_rate, samples.shape[0], _check_dtype(dtype), False, fft_backend, max_freq,
+                        _find_segment(samples, segment), channel)
+        spectrum._analyze(samples)
+
+        return spectrum
+
+    @classmethod
+    def from_magnitudes(cls, path, magnitudes, sample_rate, num_samples, fft_size=None, max_freq=None, segment=None,
+                        channel=None):
+        """ Create a spectrum for the WAV file at the given path from
+        magnitudes that were computed earlier, without reading the file.
+        fft_size is the length of the transform that the magnitudes came from,
+        if it wasn't the number of samples that were analyzed, and max_freq,
+        segment and channel are the maximum frequency, the (start, end) of the
+        region and the channel that they were computed with (see
+        __init__). """
+
+        spectrum = cls.__new__(cls)
+        spectrum._setup(path, sample_rate, num_samples, magnitudes.dtype, False, None, max_freq, segment, channel,
+                        fft_size)
+        spectrum._magnitudes = magnitudes
+
+        return spectrum
+
+    @classmethod
+    def per_channel(cls, path, dtype=np.float64, lazy=False, **options):
+        """ Create a separate spectral analysis of every channel of the WAV
+        file at the given path, in order. See __init__ for the options. """
+
+        with WavReader(path) as reader:
+            num_channels = reader.num_channels
+
+        return [cls(path, dtype, lazy, channel=channel, **options) for channel in range(num_channels)]
+
+    def _setup(self, path, sample_rate, num_samples, dtype, lazy, fft_backend, max_freq, segment, channel,
+               fft_size=None):
+        """ Set up the description of the signal, before it's analyzed. """
+
+        if num_samples == 0:
+            raise ValueError("The signal has no samples")
+
+        # A decimated signal keeps one in every decimation samples (rounding
+        # up), so it has a lower sample rate.
+        decimation = get_decimation(sample_rate, max_freq)
+        analysis_rate = sample_rate / decimation
+
+        # Only the samples in the segment are analyzed.
+        num_analyzed = num_samples
+        if segment is not None:
+            num_analyzed = segment[1] - segment[0]
+
+        if fft_backend is None:
+            fft_backend = DEFAULT_FFT_BACKEND
+        if fft_size is None:
+            fft_size = fft_backend.get_size(-(-num_analyzed // decimation))
+
+        # Calculate some info from the source. The spectrum has one unit for
+        # every sample in the transform, which may be longer or shorter than
+        # the signal.
+        freq_step = Decimal(sample_rate) / Decimal(decimation * fft_size)
+        log("\tSample rate: {}", sample_rate)
+        log("\tNumber of samples: {}", num_samples)
+        log("\tTotal track length: {}s", num_samples / sample_rate)
+        log("\tDecimation factor: {}", decimation)
+        log("\tTransform length: {}", fft_size)
+        log("\tFrequency step: {}Hz / sample", freq_step)
 
         self.path = path
-        self.fft_data = fft_data
-        self.magnitudes = magnitudes
         self.sample_rate = sample_rate
+        self.num_samples = num_samples
+        self.max_freq = max_freq
+        self.segment = segment
+        self.num_analyzed = num_analyzed
+        self.channel = channel
+        self.decimation = decimation
+        self.analysis_rate = analysis_rate
+        self.fft_size = fft_size
+        self.fft_backend = fft_backend
         self.freq_step = freq_step
+        self.dtype = dtype
+        self.lazy = lazy
+        self._fft_data = None
+        self._magnitudes = None
+
+        # Results of the analysis for each minimum frequency and method that
+        # was asked for, so that they're only computed once.
+        self.fund_freqs = {}
+        self.harm_ratios = {}
+
+    @property
+    def magnitudes(self):
+        """ Magnitude of every frequency in the power spectrum, up to the
+        Nyquist limit. """
+
+        if self._magnitudes is None:
+            self._analyze()
+        return self._magnitudes
+
+    @property
+    def fft_data(self):
+        """ Complex FFT data up to the Nyquist limit. Lazy spectrums do not
+        keep it once the magnitudes have been computed, so this is None for
+        them. """
+
+        if self._magnitudes is None:
+            self._analyze()
+        return self._fft_data
+
+    def release(self):
+        """ Free the magnitudes (and FFT data) held by this spectrum. Results
+        that were already computed, like the fundamental frequency, are kept.
+        The spectrum is transformed again from the file if it is needed later
+        on, so spectrums of signals that were only in memory can't be
+        released. """
+
+        if self.path is None:
+            raise ValueError("Cannot release a spectrum without a file")
+
+        self._fft_data = None
+        self._magnitudes = None
+
+    def read_signal(self, reader=None, out=None):
+        """ Decode the mono track that this spectrum analyzes from its file:
+        the mix of every channel or the selected one, over the segment if
+        there is one. It's read with the given WavReader or a new one, into
+        out if it's given or else a new array. Pass the track to
+        analyze_signal to compute the spectrum. """
+
+        start, end = self.segment if self.segment is not None else (0, self.num_samples)
+        if reader is None:
+            with WavReader(self.path) as reader:
+                return read_signal(reader, self.dtype, self.channel, start, end, out)
+
+        return read_signal(reader, self.dtype, self.channel, start, end, out)
+
+    def _analyze(self, wav_data=None, reader=None):
+        """ Compute the power spectrum of WAV data in memory (which already
+        has its channel selected), or else of the file, which is decoded with
+        the given WavReader or a new one. """
+
+        # The mono track is mixed down into a buffer that is reused across
+        # spectrums. Nothing refers to it once it's been transformed, so the
+        # next spectrum can overwrite it.
+        if wav_data is None:
+            signal = self.read_signal(reader, _get_downmix_buffer(self.num_analyzed, self.dtype))
+        else:
+            if self.segment is not None:
+                wav_data = wav_data[self.segment[0]:self.segment[1]]
+            out = None
+            if get_num_channels(wav_data) > 1:
+                out = _get_downmix_buffer(len(wav_data), self.dtype)
+            signal = downmix(wav_data, self.dtype, out)
+            del wav_data, out
+
+        self.analyze_signal(signal)
+
+    def analyze_signal(self, signal):
+        """ Compute the power spectrum from the mono track returned by
+        read_signal. The track may be overwritten. """
+
+        log("Analyzing signal spectrum")
+        signal = decimate(signal, self.decimation)
+
+        # Zero padding doesn't add any energy to the signal, so the magnitudes
+        # are scaled by the number of samples that were actually transformed.
+        scale = min(len(signal), self.fft_size)
+
+        # Taper a segment to zero at both ends, so that the edges of the
+        # region don't smear energy across the spectrum. The window takes
+        # away some of the energy of the signal, so the magnitudes are scaled
+        # by its sum instead.
+        if self.segment is not None:
+            window = scipy.signal.get_window('hann', scale, fftbins=False).astype(self.dtype)
+            signal = signal[:scale] * window
+            scale = float(window.sum())
+
+        fft_data, _ = self.fft_backend.transform(signal)
+        del signal
+
+        log("\tLowest frequency: 0Hz")
+        log("\tHighest frequency: {}Hz", float(len(fft_data)) * self.analysis_rate / self.fft_size)
+
+        magnitudes = to_magnitudes(fft_data, scale)
+
+        self._magnitudes = magnitudes
+        if not self.lazy:
+            self._fft_data = fft_data
 
     def get_frequency_at(self, index):
         """ Get the frequency at the given index in the power spectrum data. """
 
-        if index < 0 or index >= len(self.fft_data):
+        if index < 0 or index >= len(self.magnitudes):
             raise ValueError("Invalid index")
 
         # The number of items in the power spectrum (FFT data) is equal to the
-        # number of samples in the audio file. Whereas an index in the audio
+        # length of the transform, which is the number of samples in the audio
+        # file unless it was padded or trimmed. Whereas an index in the audio
         # file represents the audio signal for that sample, an index in the
         # power spectrum represents a particular frequency. The range of
         # frequencies in the spectrum starts at 0 and goes up to the sample
@@ -81,7 +550,7 @@ class Spectrum():
         # only need to determine its position in the entire set of data (FFT
         # data) and find the corresponding frequency in the entire range of
         # frequencies (sample rate).
-        return float(index) * self.sample_rate / (2*len(self.fft_data))
+        return float(index) * self.analysis_rate / (2*len(self.magnitudes))
 
     def get_magnitude_at(self, index):
         """ Get the magnitude of the frequency at the given index in the
@@ -92,14 +561,32 @@ class Spectrum():
 
         return self.magnitudes[index]
 
-    def get_fund_freq(self, min_freq=150):
-        """ Find the fundamental frequency for this audio sample. """
+    def get_fund_freq(self, min_freq=150, method='pairwise'):
+        """ Find the fundamental frequency for this audio sample. The method is
+        one of FUND_FREQ_METHODS:
+            - 'pairwise': find the prominent peaks in the spectrum, and pick the
+              one with the most harmonics among the other peaks
+            - 'hps': pick the strongest frequency of at least min_freq in the
+              harmonic product spectrum, which is faster on noisy files with
+              many peaks
+        A fundamental frequency that was found some other way (e.g. by a
+        detector) can be given to the spectrum with set_fund_freq, and is then
+        returned for the method that it was set with. """
+
+        if (min_freq, method) in self.fund_freqs:
+            return self.fund_freqs[(min_freq, method)]
 
-        if hasattr(self, 'fund_freq'):
-            return self.fund_freq
+        if method not in FUND_FREQ_METHODS:
+            raise ValueError(f'Invalid method: "{method}"')
 
         log("Determining fundamental frequency")
-        log(f"\tUsing minimum frequency distance of {min_freq}Hz")
+        log("\tUsing minimum frequency distance of {}Hz", min_freq)
+        log("\tUsing {} method", method)
+
+        if method == 'hps':
+            with span('fund_freq', method=method):
+                fund_freq = find_fund_freq_hps(self.magnitudes, self.analysis_rate / (2*len(self.magnitudes)), min_freq)
+            return self.set_fund_freq(min_freq, method, fund_freq)
 
         # Calculate the minimum number of units in the power spectrum data that
         # each peak must have between it and the peak closest to it. The default
@@ -112,96 +599,86 @@ class Spectrum():
         # main peak is wide and has jagged edges.
         min_peak_distance = min_freq / float(self.freq_step)
 
-        # The prominence of each peak is the difference between the magnitude of
-        # its strongest frequency and the magnitude of the frequency at the
-        # base. We're using a value equal to 5% of the largest peak as the
-        # minimum prominence that a peak should have, which should be a large
-        # enough value that we shouldn't have too many peaks from edge
-        # perturbations but a small enough value that we capture higher
-        # harmonics.
-        min_mag = min(self.magnitudes)
-        max_mag = max(self.magnitudes)
-        prominence = (max_mag - min_mag) * 5 / 100
-
-        # Find the indices of the most prominent peaks in the spectrum. They
-        # will ordered by frequency in ascending order.
-        peaks = scipy.signal.find_peaks(self.magnitudes, distance=min_peak_distance, prominence=prominence)[0]
-
-        # Get the frequency at each peak.
+        # Find the indices of the most prominent peaks in the spectrum, and get
+        # the frequency at each peak.
+        peaks = find_peak_indices(self.magnitudes, min_peak_distance)
         peak_freqs = [self.get_frequency_at(index) for index in peaks]
 
         # Determine the fundamental frequency of the spectrum by figuring out
         # which frequency has the most harmonics.
-        cnt = 0
-        fund_freq = 0.0
-        for i, freq in enumerate(peak_freqs):
-
-            harm_cnt = 0
-            for j in range(i+1, len(peak_freqs)):
-
-                # Calculate the modulo of this frequency against the base
-                # frequency, and see how far away it is form a harmonic.
-                mod = peak_freqs[j] % freq
-                if mod > freq / 2:
-                    mod = freq - mod
-
-                # If the frequency's modulp is within 3% of the base frequency,
-                # then we'll assume it's a harmonic.
-                perc = mod * 100.0 // freq
-                if perc < 3:
-                    harm_cnt += 1
-
-            # If this frequency has more harmonics than any frequency so far,
-            # we'll store is as the fundamental frequency for now.
-            if harm_cnt > cnt:
-                cnt = harm_cnt
-                fund_freq = freq
-
-        log(f"\tFundamental frequency: {fund_freq}Hz")
+        with span('fund_freq', method=method):
+            fund_freq = find_fund_freq(peak_freqs)
+
+        return self.set_fund_freq(min_freq, method, fund_freq)
+
+    def set_fund_freq(self, min_freq, method, fund_freq):
+        """ Remember the fundamental frequency found with the given
+        parameters, so that get_fund_freq and get_harm_ratios use it. """
+
+        log("\tFundamental frequency: {}Hz", fund_freq)
         self.fund_freq = fund_freq
+        self.fund_freqs[(min_freq, method)] = fund_freq
 
         return fund_freq
 
-    def get_harm_ratios(self, min_freq=150):
+    def get_harm_ratios(self, min_freq=150, method='pairwise'):
         """ Get the ratios of the harmonic frequencies as compared to the
         fundamental frequency for this audio sample. The resulting array
         contains the magnitude of each harmonic divided by the magnitude of the
-        fundamental frequency, sorted in ascending order of frequency. """
-
-        fund_freq = Decimal(self.get_fund_freq(min_freq))
-
-        # The width of the window for each harmonic's peak will be 10% of the
-        # distance between each harmonic.
-        peak_width = (fund_freq / self.freq_step) // 10
-
-        # Find the magnitude of every harmonic for this fundamental frequency,
-        # up to the highest frequency in this spectrum.
-        magnitudes = []
-
-        freq = Decimal(fund_freq * 2)
-        max_freq = Decimal(self.get_frequency_at(len(self.fft_data)-1))
-        while freq < max_freq:
-
-            # Calculate the start and end of the window around this harmonic in
-            # which we'll look for a peak magnitude.
-            center = freq // self.freq_step
-            start = int(center - (peak_width//2))
-            if start < 0:
-                start = 0
-            end = int(center + (peak_width//2))
-            if end > len(self.magnitudes)-1:
-                end = len(self.magnitudes)-1
-
-            # Find the peak magnitude in this window and add it to the list.
-            mag = max(self.magnitudes[start:end])
-            magnitudes.append(Decimal(mag))
-
-            freq += fund_freq
-
-        # Calculate the ratio of every harmonic's magnitude to the magnitude of
-        # the fundamental frequency.
-        fund_freq_index = fund_freq // self.freq_step
-        fund_freq_mag = self.get_magnitude_at(int(fund_freq_index))
-        ratios = [float(mag / Decimal(fund_freq_mag)) for mag in magnitudes]
+        fundamental frequency, sorted in ascending order of frequency, as a
+        float64 ndarray. The fundamental frequency is found with
+        get_fund_freq(min_freq, method), or is the one given to set_fund_freq
+        with the same parameters. """
+
+        if (min_freq, method) in self.harm_ratios:
+            return self.harm_ratios[(min_freq, method)]
+
+        fund_freq = self.get_fund_freq(min_freq, method)
+        magnitudes = self.magnitudes
+        freq_step = float(self.freq_step)
+
+        # Without a fundamental frequency there are no harmonics either.
+        if fund_freq <= 0:
+            ratios = np.zeros(0)
+            self.harm_ratios[(min_freq, method)] = ratios
+            return ratios
+
+        with span('harm_ratios'):
+            # The width of the window for each harmonic's peak will be 10% of the
+            # distance between each harmonic.
+            peak_width = (fund_freq / freq_step) // 10
+
+            # Calculate the start and end of the window around every harmonic of
+            # this fundamental frequency, up to the highest frequency in this
+            # spectrum (or the maximum frequency it was limited to), in which
+            # we'll look for a peak magnitude. Each window holds at least the
+            # unit at its center.
+            max_freq = self.get_frequency_at(len(magnitudes)-1)
+            if self.max_freq is not None:
+                max_freq = min(max_freq, self.max_freq)
+            harmonics = np.arange(2, int(max_freq // fund_freq) + 2) * fund_freq
+            harmonics = harmonics[harmonics < max_freq]
+            centers = harmonics // freq_step
+            starts = np.maximum(centers - (peak_width//2), 0).astype(np.intp)
+            ends = np.minimum(centers + (peak_width//2), len(magnitudes)-1).astype(np.intp)
+            ends = np.maximum(ends, starts + 1)
+
+            # Find the peak magnitude in every window with a single reduction. The
+            # windows don't overlap, so the start and end of each one can be
+            # interleaved, and every other result is the maximum of a window.
+            bounds = np.empty(2 * len(harmonics), dtype=np.intp)
+            bounds[0::2] = starts
+            bounds[1::2] = ends
+            if len(bounds) > 0:
+                peaks = np.maximum.reduceat(magnitudes, bounds)[0::2]
+            else:
+                peaks = np.zeros(0, dtype=magnitudes.dtype)
+            count('harmonics', len(harmonics))
+
+            # Calculate the ratio of every harmonic's magnitude to the magnitude of
+            # the fundamental frequency.
+            fund_freq_mag = float(self.get_magnitude_at(int(fund_freq // freq_step)))
+            ratios = peaks.astype(np.float64) / fund_freq_mag
+        self.harm_ratios[(min_freq, method)] = ratios
 
         return ratios
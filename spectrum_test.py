@@ -1,4 +1,6 @@
+import pytest
 import collections
+from scipy.io import wavfile
 from spectrum import *
 
 TestFile = collections.namedtuple('TestFile', ['path', 'fund_note', 'sample_rate', 'freq_step'])
@@ -111,3 +113,249 @@ def test_Spectrum_get_fund_note():
         fund_freq = spectrum.get_fund_freq()
         note = freq_to_note(fund_freq)
         assert testFile.fund_note == str(note)
+
+
+# Test that the magnitudes are kept as an array of the requested precision.
+def test_Spectrum_dtype():
+    with pytest.raises(ValueError):
+        Spectrum(testFiles[0].path, dtype=np.int16)
+
+    for testFile in testFiles[::8]:
+        spectrum64 = Spectrum(testFile.path)
+        assert isinstance(spectrum64.magnitudes, np.ndarray)
+        assert spectrum64.magnitudes.dtype == np.float64
+
+        spectrum32 = Spectrum(testFile.path, dtype=np.float32)
+        assert spectrum32.magnitudes.dtype == np.float32
+        assert spectrum32.magnitudes.nbytes * 2 == spectrum64.magnitudes.nbytes
+        assert testFile.freq_step == spectrum32.freq_step
+        assert np.allclose(spectrum32.magnitudes, spectrum64.magnitudes, rtol=1e-3, atol=1e-3)
+        assert testFile.fund_note == str(freq_to_note(spectrum32.get_fund_freq()))
+
+
+# Test that lazy Spectrum objects only analyze the file on demand and free the
+# intermediate buffers afterwards.
+def test_Spectrum_lazy():
+    for testFile in testFiles[::8]:
+        spectrum = Spectrum(testFile.path, lazy=True)
+        assert testFile.path == spectrum.path
+        assert testFile.sample_rate == spectrum.sample_rate
+        assert testFile.freq_step == spectrum.freq_step
+        assert spectrum._magnitudes is None
+
+        note = freq_to_note(spectrum.get_fund_freq())
+        assert testFile.fund_note == str(note)
+        assert spectrum._magnitudes is not None
+        assert spectrum.fft_data is None
+
+        # Releasing the spectrum keeps the results, and the magnitudes can be
+        # rebuilt from the file.
+        magnitudes = spectrum.magnitudes.copy()
+        spectrum.release()
+        assert spectrum._magnitudes is None
+        assert testFile.fund_note == str(freq_to_note(spectrum.get_fund_freq()))
+        assert np.array_equal(magnitudes, spectrum.magnitudes)
+
+
+# Reference implementation of "find_fund_freq" with nested loops.
+def find_fund_freq_loop(peak_freqs):
+    cnt = 0
+    fund_freq = 0.0
+    for i, freq in enumerate(peak_freqs):
+        harm_cnt = 0
+        for j in range(i+1, len(peak_freqs)):
+            mod = peak_freqs[j] % freq
+            if mod > freq / 2:
+                mod = freq - mod
+            perc = mod * 100.0 // freq
+            if perc < 3:
+                harm_cnt += 1
+        if harm_cnt > cnt:
+            cnt = harm_cnt
+            fund_freq = freq
+    return fund_freq
+
+
+# Test the function "find_fund_freq".
+def test_find_fund_freq():
+    assert find_fund_freq([]) == 0.0
+    assert find_fund_freq([440.0]) == 0.0
+    assert find_fund_freq([300.0, 440.0, 710.0]) == 0.0
+    assert find_fund_freq([220.0, 440.0, 661.0, 880.0]) == 220.0
+    assert find_fund_freq([150.0, 300.0, 440.0, 450.0, 900.0]) == 150.0
+
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        peak_freqs = sorted(rng.uniform(100, 5000, rng.integers(1, 40)).tolist())
+        assert find_fund_freq(peak_freqs) == find_fund_freq_loop(peak_freqs)
+
+    for testFile in testFiles[::4]:
+        spectrum = Spectrum(testFile.path)
+        peaks = find_peak_indices(spectrum.magnitudes, 150 / float(spectrum.freq_step))
+        peak_freqs = [spectrum.get_frequency_at(index) for index in peaks]
+        assert find_fund_freq(peak_freqs) == find_fund_freq_loop(peak_freqs)
+
+
+# Test finding the fundamental frequency with each method.
+def test_Spectrum_get_fund_freq_method():
+    spectrum = Spectrum(testFiles[0].path)
+    with pytest.raises(ValueError):
+        spectrum.get_fund_freq(method='bogus')
+
+    for testFile in testFiles:
+        spectrum = Spectrum(testFile.path)
+        for method in FUND_FREQ_METHODS:
+            note = freq_to_note(spectrum.get_fund_freq(method=method))
+            assert testFile.fund_note == str(note)
+        assert set(spectrum.fund_freqs) == {(150, method) for method in FUND_FREQ_METHODS}
+
+
+# Reference implementation of "get_harm_ratios" with Decimal math.
+def get_harm_ratios_decimal(spectrum):
+    fund_freq = Decimal(spectrum.get_fund_freq())
+    peak_width = (fund_freq / spectrum.freq_step) // 10
+    magnitudes = []
+    freq = Decimal(fund_freq * 2)
+    max_freq = Decimal(spectrum.get_frequency_at(len(spectrum.magnitudes)-1))
+    while freq < max_freq:
+        center = freq // spectrum.freq_step
+        start = max(int(center - (peak_width//2)), 0)
+        end = min(int(center + (peak_width//2)), len(spectrum.magnitudes)-1)
+        magnitudes.append(Decimal(float(spectrum.magnitudes[start:end].max())))
+        freq += fund_freq
+    fund_freq_mag = spectrum.get_magnitude_at(int(fund_freq // spectrum.freq_step))
+    return [float(mag / Decimal(float(fund_freq_mag))) for mag in magnitudes]
+
+
+# Test the "get_harm_ratios" method for Spectrum objects.
+def test_Spectrum_get_harm_ratios():
+    for testFile in testFiles[::2]:
+        spectrum = Spectrum(testFile.path)
+        ratios = spectrum.get_harm_ratios()
+        assert isinstance(ratios, np.ndarray)
+        assert ratios.dtype == np.float64
+        assert spectrum.get_harm_ratios() is ratios
+
+        # The Decimal version accumulates rounding errors as it steps through
+        # the harmonics, which can move a window over by one unit, so only
+        # almost all of the ratios are the same.
+        want_ratios = get_harm_ratios_decimal(spectrum)
+        assert len(ratios) == len(want_ratios)
+        matches = np.isclose(ratios, want_ratios, rtol=1e-6)
+        assert np.count_nonzero(~matches) <= max(len(ratios) // 10, 1)
+
+    # There are no harmonics without a fundamental frequency.
+    spectrum = Spectrum.from_magnitudes(None, np.zeros(1000), 44100, 2000)
+    assert spectrum.get_fund_freq() == 0.0
+    assert len(spectrum.get_harm_ratios()) == 0
+
+
+# Test padding and trimming signals to fast transform lengths.
+def test_Spectrum_fft_backend():
+    for size_mode in FFT_SIZES:
+        backend = get_fft_backend(size_mode)
+        for testFile in testFiles[::4]:
+            spectrum = Spectrum(testFile.path, fft_backend=backend)
+            assert spectrum.fft_size == get_fft_size(spectrum.num_samples, size_mode)
+            assert spectrum.freq_step == Decimal(spectrum.sample_rate) / Decimal(spectrum.fft_size)
+            assert len(spectrum.magnitudes) == spectrum.fft_size // 2
+            assert str(freq_to_note(spectrum.get_fund_freq())) == testFile.fund_note
+
+
+# Test decimating signals before transforming them.
+def test_Spectrum_max_freq():
+    assert get_decimation(44100, None) == 1
+    assert get_decimation(44100, 8000) == 2
+    assert get_decimation(44100, 4000) == 5
+    assert get_decimation(44100, 30000) == 1
+    with pytest.raises(ValueError):
+        get_decimation(44100, 0)
+
+    # The second harmonic of the highest notes is just under 6kHz, so every
+    # note is still found at 8kHz.
+    for testFile in testFiles:
+        spectrum = Spectrum(testFile.path, max_freq=8000)
+        assert spectrum.decimation == 2
+        assert spectrum.analysis_rate == testFile.sample_rate / 2
+        assert spectrum.fft_size == -(-spectrum.num_samples // 2)
+        assert len(spectrum.magnitudes) == spectrum.fft_size // 2
+        assert spectrum.freq_step == Decimal(testFile.sample_rate) / Decimal(2 * spectrum.fft_size)
+        assert spectrum.get_frequency_at(len(spectrum.magnitudes)-1) < spectrum.analysis_rate / 2
+        assert str(freq_to_note(spectrum.get_fund_freq())) == testFile.fund_note
+
+        # Harmonics above the maximum frequency are ignored.
+        fund_freq = spectrum.get_fund_freq()
+        num_harmonics = len(spectrum.get_harm_ratios())
+        assert fund_freq * (num_harmonics + 1) < 8000 <= fund_freq * (num_harmonics + 2)
+
+
+# Test analyzing only the steady part of each sample.
+def test_Spectrum_segment():
+    for testFile in testFiles:
+        spectrum = Spectrum(testFile.path, segment=True)
+        start, end = spectrum.segment
+        assert 0 <= start < end <= spectrum.num_samples
+        assert spectrum.fft_size == end - start
+        assert spectrum.freq_step == Decimal(spectrum.sample_rate) / Decimal(end - start)
+        for method in FUND_FREQ_METHODS:
+            assert str(freq_to_note(spectrum.get_fund_freq(method=method))) == testFile.fund_note
+
+    # A lazy spectrum finds the segment from the mapped file.
+    lazy = Spectrum(testFiles[-1].path, lazy=True, segment=True)
+    assert lazy.segment == spectrum.segment
+    assert np.array_equal(lazy.magnitudes, spectrum.magnitudes)
+    assert Spectrum(testFiles[-1].path).segment is None
+
+
+# Test downmixing and selecting channels.
+def test_downmix():
+    _, wav_data = wavfile.read(testFiles[0].path)
+    assert np.array_equal(downmix(wav_data), np.mean(wav_data, axis=1, dtype=np.float64))
+    assert np.array_equal(downmix(wav_data, np.float32), np.mean(wav_data, axis=1, dtype=np.float32))
+
+    out = np.empty(len(wav_data))
+    assert downmix(wav_data, out=out) is out
+    assert np.array_equal(out, np.mean(wav_data, axis=1))
+
+    assert get_num_channels(wav_data) == 2
+    left = select_channel(wav_data, 0)
+    assert left.shape == (len(wav_data),)
+    assert np.shares_memory(left, wav_data)
+    assert np.array_equal(downmix(left), wav_data[:, 0])
+    with pytest.raises(ValueError):
+        select_channel(wav_data, 2)
+
+
+# Test analyzing each channel separately.
+def test_Spectrum_channel():
+    testFile = testFiles[0]
+    spectrums = Spectrum.per_channel(testFile.path)
+    assert [spectrum.channel for spectrum in spectrums] == [0, 1]
+    for channel, spectrum in enumerate(spectrums):
+        assert str(freq_to_note(spectrum.get_fund_freq())) == testFile.fund_note
+
+        # Files are normalized to full scale as they're read.
+        sample_rate, wav_data = wavfile.read(testFile.path)
+        want = Spectrum.from_samples(wav_data[:, channel] / 32768, sample_rate)
+        assert np.array_equal(spectrum.magnitudes, want.magnitudes)
+
+        lazy = Spectrum(testFile.path, lazy=True, channel=channel)
+        assert np.array_equal(lazy.magnitudes, spectrum.magnitudes)
+
+    with pytest.raises(ValueError):
+        Spectrum(testFile.path, channel=2)
+
+
+# Test that files in other sample formats give the same spectrum.
+def test_Spectrum_formats(tmp_path):
+    testFile = testFiles[0]
+    sample_rate, wav_data = wavfile.read(testFile.path)
+    want = Spectrum(testFile.path, segment=True)
+
+    for name, data in [('pcm32.wav', wav_data.astype(np.int32) << 16), ('float32.wav', wav_data / np.float32(32768))]:
+        path = str(tmp_path / name)
+        wavfile.write(path, sample_rate, data)
+        spectrum = Spectrum(path, segment=True)
+        assert spectrum.segment == want.segment
+        assert np.array_equal(spectrum.magnitudes, want.magnitudes)
+        assert spectrum.get_fund_freq() == want.get_fund_freq()
@@ -0,0 +1,83 @@
+import collections
+import numpy as np
+import scipy.fft
+import scipy.signal
+from spectrum import *
+
+# A single analysis frame of a note tracker. The timestamp is the time (in
+# seconds) of the first sample in the frame. The note is None if no
+# fundamental frequency could be found in the frame.
+Frame = collections.namedtuple('Frame', ['timestamp', 'fund_freq', 'note'])
+
+
+def frame_spectra(path, frame_size=8192, hop_size=2048):
+    """ Transform a WAV file over time. The file is read in blocks of hop_size
+    samples, and every frame of frame_size samples is windowed and
+    transformed. This is a generator that yields the timestamp, magnitudes
+    and frequency step (in Hz per unit) of every hop, so the memory used does
+    not depend on the length of the file. """
+
+    if frame_size <= 0 or hop_size <= 0 or hop_size > frame_size:
+        raise ValueError("Frame and hop sizes must be positive, and the hop cannot be larger than the frame")
+
+    with WavReader(path) as reader:
+        sample_rate = reader.sample_rate
+        log("\tSample rate: {}", sample_rate)
+        log("\tFrame size: {}, hop size: {}", frame_size, hop_size)
+
+        # The window tapers the edges of each frame to reduce spectral leakage.
+        # Dividing by its sum (instead of the frame size) keeps the magnitudes
+        # on the same scale as an unwindowed spectrum.
+        window = scipy.signal.get_window('hann', frame_size)
+        scale = 2 / window.sum()
+        freq_step = sample_rate / frame_size
+
+        # The frame is a sliding buffer: each hop shifts out the oldest samples
+        # and appends the new block at the end.
+        buffer = np.zeros(frame_size)
+        filled = 0
+        position = 0
+        while True:
+            block = downmix(reader.read(hop_size if filled == frame_size else frame_size - filled))
+            if len(block) == 0:
+                break
+
+            if filled == frame_size:
+                buffer[:-len(block)] = buffer[len(block):]
+                buffer[-len(block):] = block
+            else:
+                buffer[filled:filled+len(block)] = block
+                filled += len(block)
+                if filled < frame_size:
+                    continue
+
+            # A short final block doesn't fill a whole hop, so the frame only
+            # moved by the number of samples that were read.
+            position += len(block)
+            timestamp = (position - frame_size) / sample_rate
+
+            magnitudes = np.abs(scipy.fft.rfft(buffer * window))[:frame_size // 2]
+            magnitudes *= scale
+
+            yield timestamp, magnitudes, freq_step
+
+
+def track_notes(path, frame_size=8192, hop_size=2048, min_freq=150):
+    """ Track the notes in a WAV file over time. Every frame of frame_size
+    samples (see frame_spectra) is searched for its fundamental frequency.
+    This is a generator that yields a Frame for every hop of hop_size
+    samples. """
+
+    log('\nTracking notes in WAV file at "{}"', path)
+    for timestamp, magnitudes, freq_step in frame_spectra(path, frame_size, hop_size):
+        # Peaks must be at least min_freq apart, just like in a Spectrum.
+        min_peak_distance = min_freq / freq_step
+        peaks = find_peak_indices(magnitudes, min_peak_distance)
+        fund_freq = find_fund_freq([index * freq_step for index in peaks])
+
+        try:
+            note = freq_to_note(fund_freq)
+        except ValueError:
+            note = None
+
+        yield Frame(timestamp, fund_freq, note)
@@ -0,0 +1,45 @@
+import collections
+import pytest
+import wave
+from stft import *
+
+TestFile = collections.namedtuple('TestFile', ['path', 'fund_note'])
+
+testFiles = [
+    TestFile("samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav", 'A4'),
+    TestFile("samples/mis/violin/Violin.arco.ff.sulD.Eb5.stereo.wav", 'D♯5'),
+    TestFile("samples/mis/violin/Violin.arco.ff.sulE.C7.stereo.wav", 'C7'),
+    TestFile("samples/mis/violin/Violin.arco.ff.sulG.G3.stereo.wav", 'G3'),
+]
+
+
+# Test that invalid frame and hop sizes are rejected.
+def test_track_notes_invalid():
+    with pytest.raises(ValueError):
+        next(track_notes(testFiles[0].path, frame_size=0))
+    with pytest.raises(ValueError):
+        next(track_notes(testFiles[0].path, hop_size=0))
+    with pytest.raises(ValueError):
+        next(track_notes(testFiles[0].path, frame_size=1024, hop_size=2048))
+
+
+# Test the timing of the frames produced by "track_notes".
+def test_track_notes_frames():
+    testFile = testFiles[0]
+    frames = list(track_notes(testFile.path, frame_size=4096, hop_size=1024))
+
+    assert frames[0].timestamp == 0
+    for prev, frame in zip(frames[:-2], frames[1:-1]):
+        assert frame.timestamp - prev.timestamp == pytest.approx(1024 / 44100)
+
+    # The last frame ends with the last sample in the file.
+    with wave.open(testFile.path) as wav:
+        duration = wav.getnframes() / wav.getframerate()
+    assert frames[-1].timestamp == pytest.approx(duration - 4096 / 44100)
+
+
+# Test that the tracked notes match the note of each sample.
+def test_track_notes():
+    for testFile in testFiles:
+        notes = collections.Counter(str(frame.note) for frame in track_notes(testFile.path))
+        assert notes.most_common(1)[0][0] == testFile.fund_note
@@ -0,0 +1,215 @@
+import collections
+import struct
+import numpy as np
+from log import *
+
+# Number of frames (one sample of every channel) in each block that a
+# WavReader yields by default.
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+# Format tags of the fmt chunk. Extensible files keep the actual format in the
+# first two bytes of their sub-format GUID.
+_FORMAT_PCM = 0x0001
+_FORMAT_FLOAT = 0x0003
+_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Description of the samples of a WAV file, from its header:
+#     - sample_rate: frames per second
+#     - num_channels: number of samples in each frame
+#     - sample_width: bytes per sample
+#     - sample_format: 'pcm' (integers) or 'float'
+#     - num_frames: number of frames in the data chunk
+#     - data_offset: position of the first frame in the file
+WavInfo = collections.namedtuple('WavInfo', ['sample_rate', 'num_channels', 'sample_width', 'sample_format',
+                                             'num_frames', 'data_offset'])
+
+# numpy types of the samples in each supported format and width, and the value
+# of a full-scale sample. 8-bit PCM is unsigned, and 24-bit PCM has no numpy
+# type, so it's widened into the upper bytes of an int32 (see _decode).
+_SAMPLE_TYPES = {
+    ('pcm', 1): (np.dtype('u1'), 128.0),
+    ('pcm', 2): (np.dtype('<i2'), 32768.0),
+    ('pcm', 3): (np.dtype('<i4'), 2147483648.0),
+    ('pcm', 4): (np.dtype('<i4'), 2147483648.0),
+    ('float', 4): (np.dtype('<f4'), 1.0),
+    ('float', 8): (np.dtype('<f8'), 1.0),
+}
+
+
+def read_wav_info(f):
+    """ Parse the header of a WAV file from a binary file object, up to the
+    start of the data chunk, and return its WavInfo. The file is left at the
+    first frame. Raises ValueError if the file isn't a WAV file in a supported
+    format (8, 16, 24 or 32-bit PCM, or 32 or 64-bit float). """
+
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("No data chunk found")
+
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+        if chunk_id == b'data':
+            break
+
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size)
+            if len(fmt) < 16:
+                raise ValueError("Truncated fmt chunk")
+        else:
+            f.seek(chunk_size, 1)
+
+        # Chunks are aligned to two bytes.
+        if chunk_size % 2 == 1:
+            f.seek(1, 1)
+
+    if fmt is None:
+        raise ValueError("No fmt chunk found before the data chunk")
+
+    format_tag, num_channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == _FORMAT_EXTENSIBLE:
+        if len(fmt) < 26:
+            raise ValueError("Truncated extensible fmt chunk")
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+
+    if format_tag == _FORMAT_PCM:
+        sample_format = 'pcm'
+    elif format_tag == _FORMAT_FLOAT:
+        sample_format = 'float'
+    else:
+        raise ValueError(f"Unsupported WAV format: 0x{format_tag:04x}")
+
+    sample_width = -(-bits // 8)
+    if (sample_format, sample_width) not in _SAMPLE_TYPES:
+        raise ValueError(f"Unsupported {sample_format} sample width: {bits} bits")
+    if num_channels == 0 or block_align != num_channels * sample_width:
+        raise ValueError("Invalid frame layout in fmt chunk")
+
+    # Files that were still being written when they were closed can claim
+    # more data than they hold, so the data ends at the end of the file at
+    # the latest.
+    data_offset = f.tell()
+    f.seek(0, 2)
+    data_size = min(chunk_size, f.tell() - data_offset)
+    f.seek(data_offset)
+
+    return WavInfo(sample_rate, num_channels, sample_width, sample_format, data_size // block_align, data_offset)
+
+
+class WavReader():
+    """
+    WavReader reads the samples of a WAV file a block at a time, so that only
+    one block is ever decoded in memory. Every block is a float32 array with
+    one row per frame and one column per channel, normalized so that full
+    scale is 1.0 whatever the format of the file. Use it as a context manager,
+    or close() it when done.
+    """
+
+    def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        if block_size <= 0:
+            raise ValueError("The block size must be positive")
+
+        self.path = path
+        self.block_size = block_size
+        self._file = open(path, 'rb')
+        try:
+            self.info = read_wav_info(self._file)
+        except BaseException:
+            self._file.close()
+            raise
+
+        self.sample_rate = self.info.sample_rate
+        self.num_channels = self.info.num_channels
+        self.num_frames = self.info.num_frames
+        self._position = 0
+
+        # The raw bytes of every block are read into the same buffer.
+        self._raw = bytearray()
+
+    def tell(self):
+        """ Get the index of the next frame that will be read. """
+
+        return self._position
+
+    def seek(self, frame):
+        """ Move to the frame with the given index. """
+
+        if not 0 <= frame <= self.num_frames:
+            raise ValueError(f"Invalid frame {frame} for a file with {self.num_frames} frames")
+
+        frame_size = self.num_channels * self.info.sample_width
+        self._file.seek(self.info.data_offset + frame * frame_size)
+        self._position = frame
+
+    def read(self, num_frames):
+        """ Read and decode up to num_frames frames from the current position.
+        Fewer frames are returned at the end of the file. """
+
+        num_frames = max(min(num_frames, self.num_frames - self._position), 0)
+        num_bytes = num_frames * self.num_channels * self.info.sample_width
+        if len(self._raw) < num_bytes:
+            self._raw = bytearray(num_bytes)
+
+        raw = memoryview(self._raw)[:num_bytes]
+        if self._file.readinto(raw) < num_bytes:
+            raise ValueError(f'Unexpected end of WAV file "{self.path}"')
+        self._position += num_frames
+
+        with span('decode', frames=num_frames):
+            return _decode(raw, self.info).reshape(num_frames, self.num_channels)
+
+    def blocks(self, num_frames=None):
+        """ Read up to num_frames frames (or the rest of the file) from the
+        current position, a block of block_size frames at a time. This is a
+        generator that yields each block as soon as it's decoded. """
+
+        end = self.num_frames
+        if num_frames is not None:
+            end = min(self._position + num_frames, end)
+
+        while self._position < end:
+            yield self.read(min(self.block_size, end - self._position))
+
+    def __iter__(self):
+        return self.blocks()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _decode(raw, info):
+    """ Decode raw little-endian samples into normalized float32 values. """
+
+    dtype, full_scale = _SAMPLE_TYPES[(info.sample_format, info.sample_width)]
+
+    if info.sample_width == 3:
+        # Place the three bytes of each sample in the upper part of an int32,
+        # which scales it by 256 but keeps its sign. A 24-bit value converts
+        # to float32 exactly, so the scale goes away when it's normalized.
+        wide = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+        wide[:, 1:] = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        samples = wide.reshape(-1).view(dtype)
+    else:
+        samples = np.frombuffer(raw, dtype=dtype)
+
+    out = samples.astype(np.float32)
+    if info.sample_width == 1:
+        out -= 128
+
+    # Full scale is a power of two, so normalizing is exact.
+    if full_scale != 1.0:
+        out *= np.float32(1 / full_scale)
+
+    return out
+
@@ -0,0 +1,113 @@
+import pytest
+import struct
+from scipy.io import wavfile
+from wav import *
+
+testPath = "samples/mis/violin/Violin.arco.ff.sulA.A4.stereo.wav"
+
+# Format tags of the fmt chunk.
+FORMAT_PCM = 0x0001
+FORMAT_ALAW = 0x0006
+FORMAT_EXTENSIBLE = 0xFFFE
+
+
+# Write a WAV file by hand, for formats that wavfile can't write.
+def write_wav(path, sample_rate, data, format_tag, sample_width, extensible=False, extra_chunk=False):
+    num_channels = data.shape[1]
+    block_align = num_channels * sample_width
+    fmt = struct.pack('<HHIIHH', FORMAT_EXTENSIBLE if extensible else format_tag, num_channels, sample_rate,
+                      sample_rate * block_align, block_align, sample_width * 8)
+    if extensible:
+        guid = struct.pack('<H', format_tag) + b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+        fmt += struct.pack('<HHI', 22, sample_width * 8, 0) + guid
+
+    chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+    if extra_chunk:
+        chunks += b'LIST' + struct.pack('<I', 3) + b'abc\x00'
+    chunks += b'data' + struct.pack('<I', data.nbytes) + data.tobytes()
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks)
+
+
+# Pack 24-bit samples from int32 values.
+def to_int24(values):
+    raw = values.astype('<i4').view(np.uint8).reshape(values.shape + (4,))
+    return np.ascontiguousarray(raw[..., :3]).view(np.dtype((np.void, 3)))
+
+
+# Test reading a file in blocks.
+def test_WavReader():
+    sample_rate, want = wavfile.read(testPath)
+    with WavReader(testPath, 10000) as reader:
+        assert reader.sample_rate == sample_rate
+        assert reader.num_channels == 2
+        assert reader.num_frames == len(want)
+        assert reader.info.sample_format == 'pcm'
+        assert reader.info.sample_width == 2
+
+        blocks = list(reader)
+        assert all(len(block) == 10000 for block in blocks[:-1])
+        assert all(block.dtype == np.float32 for block in blocks)
+        assert np.array_equal(np.concatenate(blocks), want / 32768)
+
+        # Blocks can start anywhere.
+        reader.seek(12345)
+        assert np.array_equal(reader.read(100), want[12345:12445] / 32768)
+        assert reader.tell() == 12445
+        assert len(list(reader.blocks(25000))) == 3
+        assert reader.tell() == 37445
+
+        reader.seek(reader.num_frames)
+        assert reader.read(100).shape == (0, 2)
+        with pytest.raises(ValueError):
+            reader.seek(reader.num_frames + 1)
+
+    with pytest.raises(ValueError):
+        WavReader(testPath, 0)
+
+
+# Test that every supported format is normalized to the same scale.
+def test_WavReader_formats(tmp_path):
+    rng = np.random.default_rng(0)
+    values = rng.integers(-(1 << 23), 1 << 23, size=(1000, 2))
+    want = (values / (1 << 23)).astype(np.float32)
+
+    cases = [
+        ('pcm16.wav', lambda p: wavfile.write(p, 48000, (values >> 8).astype(np.int16)), 2 ** -15),
+        ('pcm24.wav', lambda p: write_wav(p, 48000, to_int24(values), FORMAT_PCM, 3), 0),
+        ('pcm24x.wav', lambda p: write_wav(p, 48000, to_int24(values), FORMAT_PCM, 3, True, True), 0),
+        ('pcm32.wav', lambda p: wavfile.write(p, 48000, (values << 8).astype(np.int32)), 0),
+        ('float32.wav', lambda p: wavfile.write(p, 48000, want), 0),
+        ('float64.wav', lambda p: wavfile.write(p, 48000, want.astype(np.float64)), 0),
+        ('pcm8.wav', lambda p: wavfile.write(p, 48000, ((values >> 16) + 128).astype(np.uint8)), 2 ** -7),
+    ]
+    for name, write, atol in cases:
+        path = str(tmp_path / name)
+        write(path)
+        with WavReader(path, 300) as reader:
+            assert reader.sample_rate == 48000
+            data = np.concatenate(list(reader))
+            assert data.dtype == np.float32
+            assert data.shape == values.shape
+            assert np.allclose(data, want, rtol=0, atol=atol * 2), name
+
+
+# Test that invalid files are rejected.
+def test_WavReader_invalid(tmp_path):
+    path = str(tmp_path / 'bogus.wav')
+    with open(path, 'wb') as f:
+        f.write(b'not a wav file')
+    with pytest.raises(ValueError):
+        WavReader(path)
+
+    # A-law isn't supported.
+    write_wav(path, 8000, np.zeros((10, 1), dtype=np.uint8), FORMAT_ALAW, 1)
+    with pytest.raises(ValueError):
+        WavReader(path)
+
+    # A truncated data chunk ends at the end of the file.
+    write_wav(path, 8000, np.zeros((10, 1), dtype=np.int16), FORMAT_PCM, 2)
+    with open(path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 5)
+    with WavReader(path) as reader:
+        assert reader.num_frames == 7